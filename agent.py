@@ -1,32 +1,191 @@
-from llm import get_chat_llm
+import functools
+import os
+import threading
+from typing import List, Optional
+
+from answer_replay import get_answer_store, record_replay, replay
+from checkpointing import CHECKPOINTER_NONE, create_checkpointer, conversation_messages
+from config import config
+from history_compaction import DEFAULT_RECENT_TURNS, DEFAULT_TOKEN_BUDGET, HistoryCompactionMiddleware
+from llm import get_chat_llm, embeddings
 from prompts import Prompts
+from single_flight import flight_key, get_single_flight
 from tools.geographic_map import GeographicMap
 from tools.wikipedia import WikipediaSearch
 from tools.cypher import CypherSearch
+from tools.lazy_tool import LazyTool
+from tools.example_index import DEFAULT_TOP_K, prebuild_example_indexes
 from langchain.agents import create_agent
 from langchain.agents.middleware import TodoListMiddleware
 import asyncio
+from langchain_core.messages import AnyMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+default_checkpoint_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "checkpoints.sqlite")
+
+_checkpointer: Optional[BaseCheckpointSaver] = None
+_checkpointer_lock = threading.Lock()
+_prebuild_thread: Optional[threading.Thread] = None
+_prebuild_lock = threading.Lock()
+
+
+def get_checkpointer() -> Optional[BaseCheckpointSaver]:
+    """
+    Provides the checkpointer configured with CHECKPOINTER, shared by all agents of the process.
+
+    Returns:
+        Optional[BaseCheckpointSaver]: The checkpointer, None if conversations are not checkpointed
+    """
+    global _checkpointer
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            _checkpointer = create_checkpointer(config.get("CHECKPOINTER", CHECKPOINTER_NONE),
+                                                config.get("CHECKPOINT_PATH", default_checkpoint_path))
+        return _checkpointer
+
+
+def _start_prebuilding_example_indexes() -> None:
+    """
+    Builds the example indexes in a background thread, started once per process however many agents are created.
+    """
+    global _prebuild_thread
+    with _prebuild_lock:
+        if _prebuild_thread is None:
+            _prebuild_thread = threading.Thread(target=prebuild_example_indexes,
+                                                args=(embeddings, int(config.get("CYPHER_EXAMPLES_TOP_K", DEFAULT_TOP_K))),
+                                                daemon=True)
+            _prebuild_thread.start()
+
 
 class EcoToxFred:
 
 
-    def __init__(self):
-        self.pm_tool = GeographicMap()
-        self.wiki_tool = WikipediaSearch()
-        self.cypher_tool = CypherSearch()
+    def __init__(self, checkpointer: Optional[BaseCheckpointSaver] = None):
+        """
+        :param checkpointer: Stores the conversations by thread ID. With it, a turn only sends the new
+            message together with the thread ID of its conversation.
+        """
+        self.checkpointer = checkpointer
+        # Tools are created on their first invocation and shared by all sessions
+        self.pm_tool = LazyTool(GeographicMap)
+        self.wiki_tool = LazyTool(WikipediaSearch)
+        self.cypher_tool = LazyTool(CypherSearch)
         self.tools = [self.pm_tool, self.cypher_tool, self.wiki_tool]
+        if config.get("CYPHER_EXAMPLE_RETRIEVAL_ENABLED", True):
+            # Embedding the examples must not delay the first answer
+            _start_prebuilding_example_indexes()
         self.llm = get_chat_llm()
+        middleware = [TodoListMiddleware()]
+        if config.get("HISTORY_COMPACTION_ENABLED", True):
+            # Old tool outputs and turns are compacted once the history exceeds its token budget
+            middleware.append(HistoryCompactionMiddleware(
+                summary_model=self.llm if config.get("HISTORY_SUMMARY_ENABLED", True) else None,
+                token_budget=int(config.get("HISTORY_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+                recent_turns=int(config.get("HISTORY_RECENT_TURNS", DEFAULT_RECENT_TURNS))))
         self.agent = create_agent(model=self.llm,
                                   tools=self.tools,
                                   system_prompt=Prompts.agent.prompt,
-                                  middleware=[TodoListMiddleware()])
+                                  middleware=middleware,
+                                  checkpointer=checkpointer)
+        # Stored answers of the example questions, see answer_replay.py
+        self.answers = get_answer_store() if config.get("ANSWER_REPLAY_ENABLED", True) else None
+
+    @staticmethod
+    def _config(thread_id: Optional[str] = None) -> RunnableConfig:
+        if thread_id is None:
+            return RunnableConfig(recursion_limit=50)
+        return RunnableConfig(recursion_limit=50, configurable={"thread_id": thread_id})
+
+    def invoke(self, messages, thread_id: Optional[str] = None):
+        return self.agent.invoke(messages, config=self._config(thread_id))
+
+    def astream_events(self, messages, thread_id: Optional[str] = None, coalesce_key: Optional[str] = None,
+                       replay_answers: bool = True):
+        """
+        Streams the events of a turn.
+
+        :param messages: The input of the agent, {"messages": [...]}.
+        :param thread_id: The thread ID of a checkpointed conversation.
+        :param coalesce_key: Identical turns with the same key, see single_flight.flight_key, share the run
+            that is in flight. A run started for another conversation is stored in this one when it completes.
+        :param replay_answers: Whether the first turn of a conversation replays a stored answer, if there is one.
+        """
+        question = self._first_question(messages) if replay_answers and self.answers is not None else None
+        if question is not None and self.answers.get(flight_key(question)) is not None:
+            return self._replayed_events(messages, thread_id, coalesce_key, flight_key(question))
+        return self._events(messages, thread_id, coalesce_key)
+
+    @staticmethod
+    def _first_question(messages) -> Optional[str]:
+        """The question of the input if it is the only one, i.e. besides the greeting, else None."""
+        messages = messages.get("messages") if isinstance(messages, dict) else messages
+        if isinstance(messages, str):
+            return messages
+        questions = [m for m in messages if isinstance(m, HumanMessage)]
+        if len(questions) == 1 and messages[-1] is questions[0] and isinstance(questions[0].content, str):
+            return questions[0].content
+        return None
+
+    async def _replayed_events(self, messages, thread_id: Optional[str], coalesce_key: Optional[str], key: str):
+        # A checkpointed conversation only sends the new message, so it may not be its first turn
+        if thread_id is not None and self.checkpointer is not None and await self.ahistory(thread_id):
+            async for event in self._events(messages, thread_id, coalesce_key):
+                yield event
+            return
+        events = self.answers.get(key)
+        record_replay()
+        async for event in replay(events):
+            yield event
+        if thread_id is not None and self.checkpointer is not None:
+            await self._store_turn(thread_id, events)
+
+    def _events(self, messages, thread_id: Optional[str], coalesce_key: Optional[str]):
+        if coalesce_key is None:
+            return self.agent.astream_events(messages, config=self._config(thread_id), version="v2")
+        return self._coalesced_events(messages, thread_id, coalesce_key)
+
+    async def _coalesced_events(self, messages, thread_id: Optional[str], coalesce_key: str):
+        store = None if thread_id is None or self.checkpointer is None else functools.partial(self._store_turn, thread_id)
+        async for event in get_single_flight().subscribe(
+                coalesce_key,
+                lambda: self.agent.astream_events(messages, config=self._config(thread_id), version="v2"),
+                follower_done=store):
+            yield event
+
+    async def _store_turn(self, thread_id: str, events) -> None:
+        """Adds the messages of a turn that ran in another conversation, or was replayed, to the checkpoint of this one."""
+        outputs = [e["data"].get("output") for e in events if e["event"] == "on_chain_end" and not e.get("parent_ids")]
+        if not outputs or not isinstance(outputs[-1], dict):
+            return
+        messages = outputs[-1].get("messages", [])
+        questions = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if questions:
+            await self.agent.aupdate_state(self._config(thread_id), {"messages": messages[questions[-1]:]},
+                                           as_node="model")
+
+    async def ahistory(self, thread_id: str) -> List[AnyMessage]:
+        """Async variant of history()."""
+        if self.checkpointer is None:
+            return []
+        state = await self.agent.aget_state(self._config(thread_id))
+        return conversation_messages(state.values.get("messages", []))
+
+    def history(self, thread_id: str) -> List[AnyMessage]:
+        """
+        Loads the questions and answers of a checkpointed conversation, e.g. when a session is resumed.
 
-    def invoke(self, messages):
-        return self.agent.invoke(messages)
+        :param thread_id: The thread ID of the conversation.
+        :return: The messages to show, empty for unknown threads or without a checkpointer.
+        """
+        if self.checkpointer is None:
+            return []
+        state = self.agent.get_state(self._config(thread_id))
+        return conversation_messages(state.values.get("messages", []))
 
-    def astream_events(self, messages):
-        return self.agent.astream_events(messages, config=RunnableConfig(recursion_limit=50),version="v2")
+    def delete_history(self, thread_id: str) -> None:
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(thread_id)
 
 if __name__ == "__main__":
     agent = EcoToxFred()
@@ -0,0 +1,307 @@
+"""
+Stored answers of the example questions, replayed instead of running the agent.
+
+The example questions of the sidebar are by far the most frequent first turns. A warm-up runs each
+of them through the agent and stores its event stream, i.e. the streamed tokens, the tool calls,
+and the tool outputs with their figure artifacts, in a JSON file. When a session asks an example
+question as its first turn, the stored events are replayed within milliseconds instead of running
+the agent. The file is keyed by a fingerprint of the prompts, the model, the version of the app, and
+the database fingerprint of schema_snapshot.py, so stored answers are not replayed once one of them changes. Run the
+warm-up at container start or on a schedule, it also removes the files of other fingerprints:
+
+    python answer_replay.py --warm-up      # computes the answers that are missing
+    python answer_replay.py --refresh      # recomputes all answers
+    python answer_replay.py --invalidate   # removes all stored answers
+"""
+
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import (AIMessageChunk, BaseMessage, HumanMessage, message_to_dict,
+                                     messages_from_dict)
+
+from llm_scheduler import Priority, llm_priority
+from prompts import get_example_questions, prompts_directory
+from single_flight import flight_key
+
+logger = logging.getLogger("ETF")
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+default_answer_directory = os.path.join(current_directory, ".cache", "answers")
+
+# Files of the prompts directory whose changes do not change the answers
+_fingerprint_exclusions = {"example_questions.yml"}
+
+_totals = {"replays": 0, "stored": 0}
+_totals_lock = threading.Lock()
+
+
+def get_answer_directory() -> str:
+    from config import config
+
+    return config.get("ANSWER_REPLAY_DIR", default_answer_directory)
+
+
+def answers_fingerprint(directory: str, *parts: str) -> str:
+    """
+    Computes the fingerprint of everything the stored answers depend on.
+
+    Args:
+        directory: The directory of the prompts, all its files except the example questions are included.
+        parts: Further values the answers depend on, e.g. the model.
+
+    Returns:
+        str: A short hash usable as part of a file name
+    """
+    digest = hashlib.sha256()
+    for file in sorted(glob.glob(os.path.join(directory, "*"))):
+        if os.path.isfile(file) and os.path.basename(file) not in _fingerprint_exclusions:
+            with open(file, "rb") as f:
+                digest.update(os.path.basename(file).encode() + b"\0" + f.read())
+    digest.update("\0".join(str(part) for part in parts).encode())
+    return digest.hexdigest()[:16]
+
+
+def get_answers_fingerprint() -> str:
+    """
+    The fingerprint of the prompts, the model, the version of the app, and the state of the graph database,
+    which is identified as configured by SCHEMA_FINGERPRINT.
+    """
+    from config import config
+    from graph import connect_to_neo4j
+    from schema_snapshot import get_database_fingerprint
+    from utils import get_version
+
+    return answers_fingerprint(prompts_directory, config.get("OPENAI_MODEL"), get_version(),
+                               get_database_fingerprint(connect_to_neo4j()))
+
+
+def _reduce_output(output: Any) -> Dict[str, Any]:
+    if isinstance(output, BaseMessage):
+        return {"type": "message", "value": message_to_dict(output)}
+    if hasattr(output, "update") and isinstance(output.update, dict):
+        # Commands of write_todos, their messages are not needed to show the agenda
+        return {"type": "command", "value": {k: v for k, v in output.update.items() if k != "messages"}}
+    return {"type": "raw", "value": output}
+
+
+def _restore_output(output: Dict[str, Any]) -> Any:
+    if output["type"] == "message":
+        return messages_from_dict([output["value"]])[0]
+    if output["type"] == "command":
+        return {"update": output["value"]}
+    return output["value"]
+
+
+def reduce_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reduces the events of an agent run to what the user interfaces need, as JSON-serializable dicts.
+
+    The streamed tokens of the answer between two tool calls are merged into a single chunk, and the
+    final state of the run is reduced to the messages of the turn.
+
+    Args:
+        events: The events of astream_events.
+
+    Returns:
+        List[Dict[str, Any]]: The reduced events
+    """
+    reduced = []
+    for event in events:
+        kind = event["event"]
+        base = {"event": kind, "name": event.get("name"), "run_id": str(event.get("run_id"))}
+        if kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if event.get("metadata", {}).get("langgraph_node") != "model" or not isinstance(content, str):
+                continue
+            if reduced and reduced[-1]["event"] == kind:
+                reduced[-1]["data"]["chunk"] += content
+            else:
+                reduced.append({**base, "metadata": {"langgraph_node": "model"}, "data": {"chunk": content}})
+        elif kind == "on_tool_start":
+            reduced.append({**base, "data": {"input": event["data"].get("input")}})
+        elif kind == "on_tool_end":
+            reduced.append({**base, "data": {"output": _reduce_output(event["data"].get("output"))}})
+        elif kind == "on_chain_end" and not event.get("parent_ids") and isinstance(event["data"].get("output"), dict):
+            messages = event["data"]["output"].get("messages", [])
+            questions = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+            turn = messages[questions[-1]:] if questions else messages
+            reduced.append({**base, "parent_ids": [], "data": {"output": {"messages": [message_to_dict(m) for m in turn]}}})
+    return reduced
+
+
+def restore_events(reduced: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Restores reduced events into the shape of astream_events, with LangChain messages."""
+    events = []
+    for event in reduced:
+        kind, data = event["event"], event["data"]
+        if kind == "on_chat_model_stream":
+            data = {"chunk": AIMessageChunk(content=data["chunk"])}
+        elif kind == "on_tool_end":
+            data = {"output": _restore_output(data["output"])}
+        elif kind == "on_chain_end":
+            data = {"output": {"messages": messages_from_dict(data["output"]["messages"])}}
+        events.append({**event, "data": data})
+    return events
+
+
+async def replay(events: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Yields stored events like the event stream of an agent run."""
+    for event in events:
+        yield event
+
+
+class AnswerStore:
+    """
+    The stored answers of one fingerprint, loaded from their file once and kept in memory.
+    """
+
+    def __init__(self, directory: str, fingerprint: str):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        try:
+            with open(self.file) as f:
+                stored = json.load(f)
+            if stored.get("fingerprint") == fingerprint:
+                self._entries = stored["answers"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    @property
+    def file(self) -> str:
+        return os.path.join(self.directory, f"answers_{self.fingerprint}.json")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Returns the events of the stored answer with the key, see single_flight.flight_key, or None."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            if key not in self._events:
+                self._events[key] = restore_events(self._entries[key]["events"])
+            return self._events[key]
+
+    def put(self, key: str, question: str, events: List[Dict[str, Any]]) -> None:
+        """Stores the events of an answer and writes the file atomically."""
+        with self._lock:
+            self._entries[key] = {"question": question, "created": time.time(), "events": reduce_events(events)}
+            self._events.pop(key, None)
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"fingerprint": self.fingerprint, "answers": self._entries}, f, default=str)
+                os.replace(tmp_file, self.file)
+            except Exception:
+                os.remove(tmp_file)
+                raise
+
+    def remove_stale_files(self) -> int:
+        """
+        Removes the answer files of other fingerprints. Only the warm-up command calls it, since app processes
+        of different versions may share the directory.
+
+        Returns:
+            int: The number of removed answer files
+        """
+        files = [f for f in glob.glob(os.path.join(self.directory, "answers_*.json")) if f != self.file]
+        for file in files:
+            os.remove(file)
+        return len(files)
+
+
+async def warm_up(agent: Any, questions: List[str], store: AnswerStore, refresh: bool = False) -> int:
+    """
+    Runs the questions through the agent and stores their answers.
+
+    Args:
+        agent: The agent, EcoToxFred without a checkpointer.
+        questions: The questions, each asked as the first turn of a conversation.
+        store: The store of the answers.
+        refresh: Whether to recompute answers that are already stored.
+
+    Returns:
+        int: The number of stored answers
+    """
+    stored = 0
+    for question in questions:
+        key = flight_key(question)
+        if not refresh and store.get(key) is not None:
+            continue
+        try:
+            # Users asking questions meanwhile go first
+            with llm_priority(Priority.EVALUATION):
+                events = [e async for e in agent.astream_events({"messages": [HumanMessage(content=question)]},
+                                                                   replay_answers=False)]
+        except Exception as e:
+            logger.warning(f"Warm-up of '{question}' failed: {e}")
+            continue
+        store.put(key, question, events)
+        stored += 1
+        with _totals_lock:
+            _totals["stored"] += 1
+    return stored
+
+
+_answer_store: Optional[AnswerStore] = None
+_answer_store_lock = threading.Lock()
+
+
+def get_answer_store() -> AnswerStore:
+    """Provides the store of the current fingerprint, shared by the process."""
+    global _answer_store
+    with _answer_store_lock:
+        if _answer_store is None:
+            _answer_store = AnswerStore(get_answer_directory(), get_answers_fingerprint())
+        return _answer_store
+
+
+def record_replay() -> None:
+    with _totals_lock:
+        _totals["replays"] += 1
+
+
+def get_answer_replay_metrics() -> Dict[str, Any]:
+    """Returns the number of replayed answers and of answers stored by warm-ups of this process."""
+    with _totals_lock:
+        return dict(_totals)
+
+
+def invalidate_answers() -> int:
+    """
+    Removes all stored answers.
+
+    Returns:
+        int: The number of removed answer files
+    """
+    files = glob.glob(os.path.join(get_answer_directory(), "answers_*.json"))
+    for file in files:
+        os.remove(file)
+    return len(files)
+
+
+if __name__ == "__main__":
+    if "--invalidate" in sys.argv:
+        print(f"Removed {invalidate_answers()} answer file(s).")
+    elif "--warm-up" in sys.argv or "--refresh" in sys.argv:
+        from agent import EcoToxFred
+
+        store = get_answer_store()
+        count = asyncio.run(warm_up(EcoToxFred(), get_example_questions(), store, refresh="--refresh" in sys.argv))
+        print(f"Stored {count} answer(s) in {store.file}, removed {store.remove_stale_files()} stale answer file(s).")
+    else:
+        print("Usage: python answer_replay.py --warm-up | --refresh | --invalidate")
@@ -0,0 +1,361 @@
+"""
+Headless HTTP API streaming the answers of EcoToxFred as Server-Sent Events.
+
+Next to the Streamlit app, the agent can be served by an asyncio HTTP server, so programmatic
+clients and batch workloads can use it and several worker processes can run behind a proxy.
+A turn is started with
+
+    POST /chat  {"message": "What is Diuron?", "session_id": "<optional>"}
+
+and answered with a stream of Server-Sent Events: session (the session ID to send with the next
+turn), token, tool_start, tool_end, artifact (the figures of the tools as plain plotly JSON, which
+plotly.js renders as it is, together with a content hash), and finally done or error. Each process runs at most a fixed number of turns at once and queues a limited number
+more; beyond that, turns are rejected with 503 so the proxy or client can retry elsewhere. Events
+are only produced as fast as the client reads them, because writing an event waits until the
+connection has drained. Without a checkpointer, the message histories of the sessions are kept in
+the worker process, so a proxy in front of several workers must route the requests of a session to
+the same worker. With a checkpointer shared by the workers, any of them can continue a session.
+GET /health reports the turns of the process together with the metrics of its caches, the LLM
+scheduler, and the connection pool.
+
+Start the server with
+
+    python api.py --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from langchain_core.messages import AIMessage, HumanMessage
+
+from event_loop import run_shutdown_hooks
+from figure_artifacts import artifact_hash, plotly_json
+from single_flight import flight_key
+
+logger = logging.getLogger("ETF")
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8000
+DEFAULT_MAX_CONCURRENT_TURNS = 4
+DEFAULT_MAX_QUEUED_TURNS = 16
+DEFAULT_MAX_SESSIONS = 1000
+GREETING = "Hi, I'm EcoToxFred!  How can I help you?"
+
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    # Keeps proxies like nginx from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """
+    Encodes a Server-Sent Event with a JSON payload.
+
+    Args:
+        event: The event name.
+        data: The payload, values that are not JSON serializable are converted to strings.
+
+    Returns:
+        bytes: The encoded event
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+def translate_event(event: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Translates an event of the agent's astream_events into the events of the API.
+
+    Args:
+        event: The event of LangChain's astream_events (version v2).
+
+    Returns:
+        List[Tuple[str, Dict[str, Any]]]: The names and payloads of the API events, none for events
+            that are not streamed to clients
+    """
+    kind = event["event"]
+    if kind == "on_chat_model_stream":
+        if event.get("metadata", {}).get("langgraph_node") != "model":
+            return []
+        content = event["data"]["chunk"].content
+        return [("token", {"text": content})] if isinstance(content, str) and content else []
+    if kind == "on_tool_start":
+        return [("tool_start", {"id": event.get("run_id"), "name": event["name"],
+                                "input": event["data"].get("input")})]
+    if kind == "on_tool_end":
+        output = event["data"].get("output")
+        events = [("tool_end", {"id": event.get("run_id"), "name": event["name"],
+                                "output": getattr(output, "content", output)})]
+        artifact = getattr(output, "artifact", None)
+        if artifact is not None:
+            # The compact artifacts of the app can only be read by figure_artifacts.decode_figure
+            events.append(("artifact", {"id": event.get("run_id"), "name": event["name"],
+                                        "hash": artifact_hash(artifact), "figure": plotly_json(artifact)}))
+        return events
+    return []
+
+
+class SessionStore:
+    """
+    Message histories of the sessions served by this process, the least recently used are dropped.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, session_id: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """Returns the ID and state of a session, a new one is started for an unknown or missing ID."""
+        session_id = session_id or uuid.uuid4().hex
+        if session_id in self._sessions:
+            self._sessions.move_to_end(session_id)
+        else:
+            self._sessions[session_id] = {"messages": [AIMessage(content=GREETING)], "lock": asyncio.Lock()}
+            # Sessions that are answering a turn are not dropped
+            for key in list(self._sessions):
+                if len(self._sessions) <= self.max_sessions:
+                    break
+                if not self._sessions[key]["lock"].locked():
+                    del self._sessions[key]
+        return session_id, self._sessions[session_id]
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class TurnLimiter:
+    """
+    Limits the turns answered at once by the process and the number of turns waiting for a slot.
+    """
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT_TURNS,
+                 max_queued: int = DEFAULT_MAX_QUEUED_TURNS):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def full(self) -> bool:
+        """Whether a new turn has to be rejected because all slots and the queue are taken."""
+        return self.running >= self.max_concurrent and self.waiting >= self.max_queued
+
+    def reject(self) -> None:
+        self.rejected += 1
+
+    async def __aenter__(self) -> "TurnLimiter":
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.running -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    def metrics(self) -> Dict[str, int]:
+        return {"running": self.running, "waiting": self.waiting, "completed": self.completed,
+                "rejected": self.rejected, "max_concurrent": self.max_concurrent, "max_queued": self.max_queued}
+
+
+def process_metrics() -> Dict[str, Any]:
+    """
+    Collects the metrics of the caches, the Cypher templates, the schema slicers, the LLM scheduler, and the
+    single flights of this process.
+
+    Returns:
+        Dict[str, Any]: The metrics by component, with the connection pool once graph.py is loaded
+    """
+    from answer_replay import get_answer_replay_metrics
+    from history_compaction import get_history_compaction_metrics
+    from llm_scheduler import get_llm_scheduler_metrics
+    from single_flight import get_single_flight_metrics
+    from tools.cypher_cache import get_cache_metrics
+    from tools.cypher_templates import get_template_metrics
+    from tools.schema_slicer import get_schema_slicer_metrics
+
+    metrics = {
+        "cypher_caches": get_cache_metrics(),
+        "cypher_templates": get_template_metrics(),
+        "schema_slicers": get_schema_slicer_metrics(),
+        "llm_scheduler": get_llm_scheduler_metrics(),
+        "single_flight": get_single_flight_metrics(),
+        "answer_replay": get_answer_replay_metrics(),
+        "history_compaction": get_history_compaction_metrics(),
+    }
+    # Importing graph.py requires the configuration, without it there is no pool to report anyway
+    graph = sys.modules.get("graph")
+    if graph is not None:
+        metrics["connection_pool"] = graph.get_pool_metrics()
+    return metrics
+
+
+class ChatApi:
+    """
+    The request handlers of the API around an agent providing astream_events, e.g. EcoToxFred.
+    """
+
+    def __init__(self, agent: Any, sessions: SessionStore, limiter: TurnLimiter, coalesce: bool = False):
+        self.agent = agent
+        self.sessions = sessions
+        self.limiter = limiter
+        self.coalesce = coalesce
+        # Agents with a checkpointer keep the histories themselves, the sessions only serialize their turns
+        self.checkpointed = getattr(agent, "checkpointer", None) is not None
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise web.HTTPBadRequest(text="The request body must be JSON")
+        message = body.get("message") if isinstance(body, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            raise web.HTTPBadRequest(text="The request body needs a non-empty 'message'")
+        if self.limiter.full():
+            self.limiter.reject()
+            raise web.HTTPServiceUnavailable(text="Too many turns are answered, please retry",
+                                             headers={"Retry-After": "1"})
+        session_id, session = self.sessions.get(body.get("session_id"))
+        if session["lock"].locked():
+            raise web.HTTPConflict(text=f"Session {session_id} is answering another turn")
+
+        async with session["lock"]:
+            response = web.StreamResponse(headers=SSE_HEADERS)
+            await response.prepare(request)
+            await response.write(sse_event("session", {"session_id": session_id}))
+            async with self.limiter:
+                await self._answer(response, session_id, session, message)
+            await response.write_eof()
+        return response
+
+    async def _answer(self, response: web.StreamResponse, session_id: str, session: Dict[str, Any],
+                      message: str) -> None:
+        """Streams the events of a turn and adds it to the session's history once it is complete."""
+        start = time.perf_counter()
+        question = HumanMessage(content=message)
+        final_text, artifact = "", None
+        options = {}
+        if self.coalesce:
+            # Identical questions in identical conversations share one run of the agent
+            context = await self.agent.ahistory(session_id) if self.checkpointed else session["messages"]
+            options["coalesce_key"] = flight_key(message, context)
+        if self.checkpointed:
+            # The history is loaded from the checkpoint, so any worker can continue the session
+            stream = self.agent.astream_events({"messages": [question]}, thread_id=session_id, **options)
+        else:
+            stream = self.agent.astream_events({"messages": session["messages"] + [question]}, **options)
+        try:
+            async for event in stream:
+                for name, data in translate_event(event):
+                    if name == "token":
+                        final_text += data["text"]
+                    elif name == "artifact":
+                        # The history keeps the compact artifact of the tool
+                        artifact = event["data"]["output"].artifact
+                    # Waits until the client has read enough, which pauses the agent for slow clients
+                    await response.write(sse_event(name, data))
+        except ConnectionResetError:
+            logger.info(f"API: Client of session {session_id} disconnected, the turn is dropped")
+            return
+        except Exception as e:
+            logger.warning(f"API: Turn of session {session_id} failed: {e}")
+            await response.write(sse_event("error", {"message": str(e)}))
+            return
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+
+        if not self.checkpointed:
+            answer = AIMessage(content=final_text) if artifact is None else AIMessage(content=final_text, artifact=artifact)
+            session["messages"] += [question, answer]
+        await response.write(sse_event("done", {"session_id": session_id,
+                                                "seconds": round(time.perf_counter() - start, 3)}))
+
+    async def delete_session(self, request: web.Request) -> web.Response:
+        session_id = request.match_info["session_id"]
+        if self.checkpointed:
+            await self.agent.checkpointer.adelete_thread(session_id)
+            self.sessions.delete(session_id)
+        elif not self.sessions.delete(session_id):
+            raise web.HTTPNotFound(text="Unknown session")
+        return web.Response(status=204)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "sessions": len(self.sessions), **self.limiter.metrics(),
+                                  **process_metrics()})
+
+
+def create_app(
+        agent: Any,
+        max_concurrent_turns: int = DEFAULT_MAX_CONCURRENT_TURNS,
+        max_queued_turns: int = DEFAULT_MAX_QUEUED_TURNS,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        coalesce: bool = False,
+) -> web.Application:
+    """
+    Creates the application serving the agent.
+
+    Args:
+        agent: The agent, providing astream_events like EcoToxFred.
+        max_concurrent_turns: Number of turns the process answers at once.
+        max_queued_turns: Number of turns waiting for a slot before further turns are rejected.
+        max_sessions: Number of sessions whose histories are kept.
+        coalesce: Whether identical questions in identical conversations share one run of the agent.
+
+    Returns:
+        web.Application: The aiohttp application
+    """
+    api = ChatApi(agent, SessionStore(max_sessions), TurnLimiter(max_concurrent_turns, max_queued_turns), coalesce)
+    app = web.Application()
+    app.add_routes([
+        web.post("/chat", api.chat),
+        web.delete("/sessions/{session_id}", api.delete_session),
+        web.get("/health", api.health),
+    ])
+
+    async def close_clients(_app: web.Application) -> None:
+        # The async clients of the agent, e.g. the Neo4j driver, live on the server's loop
+        await run_shutdown_hooks()
+
+    app.on_cleanup.append(close_clients)
+    return app
+
+
+def main() -> None:
+    from config import config
+    from agent import EcoToxFred, get_checkpointer
+
+    parser = argparse.ArgumentParser(description="Serve EcoToxFred as an HTTP API with Server-Sent Events.")
+    parser.add_argument("--host", default=config.get("API_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(config.get("API_PORT", DEFAULT_PORT)))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    app = create_app(
+        EcoToxFred(checkpointer=get_checkpointer()),
+        max_concurrent_turns=int(config.get("API_MAX_CONCURRENT_TURNS", DEFAULT_MAX_CONCURRENT_TURNS)),
+        max_queued_turns=int(config.get("API_MAX_QUEUED_TURNS", DEFAULT_MAX_QUEUED_TURNS)),
+        max_sessions=int(config.get("API_MAX_SESSIONS", DEFAULT_MAX_SESSIONS)),
+        coalesce=config.get("SINGLE_FLIGHT_ENABLED", True))
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,29 @@
-import plotly
 from langchain_core.messages import AIMessage, SystemMessage
 import streamlit as st
 from prompts import Prompts
 from todo_parsing import parse_write_todos_result, format_todos_for_display
+from config import config
+from event_loop import get_background_loop
+from figure_artifacts import FigureCache
+from token_renderer import DEFAULT_CHARACTERS, DEFAULT_INTERVAL, TokenRenderer
 
-async def invoke_our_graph(graph_runnable, st_messages, st_placeholder):
+def invoke_our_graph(graph_runnable, st_messages, st_placeholder, figure_cache=None, event_loop=None, thread_id=None,
+                     coalesce_key=None):
     """
-    Asynchronously processes a stream of events from the graph_runnable and updates the Streamlit interface.
+    Processes a stream of events from the graph_runnable and updates the Streamlit interface.
+
+    The graph runs on the process-wide background event loop, so its async clients are reused
+    across turns, while the events are rendered here in the script thread of the session.
 
     Args:
         graph_runnable: The LangGraph runnable
         st_messages (list): List of messages to be sent to the graph_runnable.
         st_placeholder (st.beta_container): Streamlit placeholder used to display updates and statuses.
+        figure_cache (FigureCache): The decoded figures of the session, so the figure shown now is not decoded
+            again when the message history is rendered.
+        event_loop (BackgroundEventLoop): The loop running the graph, the shared one of the process by default.
+        thread_id (str): The thread ID of a checkpointed conversation, st_messages then only holds the new message.
+        coalesce_key (str): Identical questions of other sessions with the same key share one run of the graph.
 
     Returns:
         AIMessage: An AIMessage object containing the final aggregated text content from the events.
@@ -21,29 +33,44 @@ async def invoke_our_graph(graph_runnable, st_messages, st_placeholder):
     todo_list_container = container.empty()  # Use empty() so we can clear and replace it
     thoughts_placeholder = container.container()  # Container for displaying status messages
     image_placeholder = container.empty()  # Container for showing an image
-    token_placeholder = container.empty()  # Placeholder for displaying progressive token updates
+    token_container = container.container()  # Container for displaying progressive token updates
+    # Chunks are rendered on a time or size budget instead of re-rendering the whole answer for each of them
+    token_renderer = TokenRenderer(
+        token_container.empty,
+        interval=float(config.get("TOKEN_RENDER_INTERVAL_MS", DEFAULT_INTERVAL * 1000)) / 1000,
+        characters=int(config.get("TOKEN_RENDER_CHARACTERS", DEFAULT_CHARACTERS)))
     final_text = ""  # Will store the accumulated text from the model's response
     from prompts import Prompts
     system_prompt = Prompts.agent.prompt
     #st_messages = [SystemMessage(content=system_prompt)] + st_messages
     artifact = None
+    figure_cache = figure_cache if figure_cache is not None else FigureCache()
 
     # Dictionary to track tool placeholders by tool call ID for parallel execution
     tool_placeholders = {}
 
-    # Stream events from the graph_runnable asynchronously
-    async for event in graph_runnable.astream_events({"messages": st_messages}):
+    event_loop = event_loop if event_loop is not None else get_background_loop()
+
+    options = {}
+    if thread_id is not None:
+        options["thread_id"] = thread_id
+    if coalesce_key is not None:
+        options["coalesce_key"] = coalesce_key
+    events = graph_runnable.astream_events({"messages": st_messages}, **options)
+
+    # Stream events from the graph_runnable, which runs asynchronously on the background loop
+    for event in event_loop.iterate(events):
         kind = event["event"]  # Determine the type of event received
         if kind == "on_chat_model_stream":
             if  event["metadata"]["langgraph_node"] == "model":
                 # The event corresponding to a stream of new content (tokens or chunks of text)
                 addition = event["data"]["chunk"].content  # Extract the new content chunk
                 final_text += addition  # Append the new content to the accumulated text
-                if addition:
-                    token_placeholder.write(final_text)  # Update the st placeholder with the progressive response
+                token_renderer.add(addition)  # Update the st placeholder with the progressive response
 
         elif kind == "on_tool_start":
             # The event signals that a tool is about to be called
+            token_renderer.flush()  # Show all text the model wrote before the call
             tool_call_id = event.get("run_id")  # Get unique identifier for this tool call
             tool_name = event['name']
 
@@ -111,12 +138,13 @@ async def invoke_our_graph(graph_runnable, st_messages, st_placeholder):
                         if hasattr(event_output, "artifact") and event_output.artifact is not None:
                             artifact = event_output.artifact
                             with image_placeholder:
-                                fig = plotly.io.from_json(artifact)
+                                fig = figure_cache.get(artifact)
                                 st.plotly_chart(
                                     fig,
                                     key=f"plotly_chart_temporary",
                                     use_container_width=True,
                                     config={'displayModeBar': False})
 
+    token_renderer.close()
     # Return the final aggregated message after all events have been processed
     return AIMessage(content=final_text) if artifact is None else AIMessage(content=final_text, artifact=artifact)
\ No newline at end of file
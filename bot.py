@@ -1,11 +1,17 @@
-import plotly
+import uuid
+
 import streamlit as st
 from langchain_core.messages import AIMessage, HumanMessage
-import asyncio
 
 from utils import get_version
-from agent import EcoToxFred
+from agent import EcoToxFred, get_checkpointer
+from answer_replay import warm_up
 from astream_events_handler import invoke_our_graph
+from config import config
+from event_loop import get_background_loop
+from figure_artifacts import FigureCache
+from prompts import get_example_questions
+from single_flight import flight_key
 
 about_text = f"""
 **EcoToxFred v{get_version()}** — a Neo4j-backed Chatbot discussing environmental monitoring and hazard data.
@@ -24,23 +30,50 @@ st.set_page_config(page_title="EcoToxFred", page_icon="figures/assistant.png",
                    layout='centered',
                    menu_items={"about": about_text})
 
-example_questions = [
-    "EcoToxFred, what is your expertise? Structure your response in bullet points.",
-    "What is Diuron and where has it been measured?",
-    "What is Triclosan? Has it been measured in European freshwater?",
-    "Show the ratioTU distribution for algae along the Danube (2010–2015).",
-    "Find the most frequent multiple risk drivers.",
-    "Find substances that most frequently occur together as drivers.",
-    "For Citalopram, provide the name of the sampling site and the measurement time point as a table?"
-]
+example_questions = get_example_questions()
+
+
+
+@st.cache_resource
+def get_checkpointed_agent() -> EcoToxFred:
+    """With a checkpointer, one agent serves all sessions, since it keeps no conversation in memory."""
+    return EcoToxFred(checkpointer=get_checkpointer())
+
+
+@st.cache_resource
+def warm_up_example_answers():
+    """
+    Computes the answers of the example questions that are not stored yet, once per process and in the background.
+    Off by default, the container runs "python answer_replay.py --warm-up" once at start instead.
+    """
+    # The answers are computed without a checkpointer, so the warm-up has its own agent. It shares the
+    # tools and the example indexes with all other agents of the process.
+    agent = EcoToxFred()
+    return get_background_loop().submit(warm_up(agent, example_questions, agent.answers))
+
+
+if config.get("ANSWER_REPLAY_ENABLED", True) and config.get("WARM_UP_ENABLED", False):
+    warm_up_example_answers()
+
 
 # Set up the session state and initialize the LLM agent
 if "initialized" not in st.session_state:
     st.session_state.initialized = True
-    st.session_state.chat_agent = EcoToxFred()
-    st.session_state.messages = [AIMessage(content="Hi, I'm EcoToxFred!  How can I help you?")]
+    if get_checkpointer() is None:
+        st.session_state.chat_agent = EcoToxFred()
+        st.session_state.thread_id = None
+        history = []
+    else:
+        # The thread ID in the URL resumes the conversation from its checkpoint, after a restart or on another worker
+        st.session_state.chat_agent = get_checkpointed_agent()
+        st.session_state.thread_id = st.query_params.get("thread") or uuid.uuid4().hex
+        st.query_params["thread"] = st.session_state.thread_id
+        history = st.session_state.chat_agent.history(st.session_state.thread_id)
+    st.session_state.messages = [AIMessage(content="Hi, I'm EcoToxFred!  How can I help you?")] + history
     st.session_state.figure_numbers = 0
     st.session_state.example_question = None
+    # Figures are decoded once per session instead of on every rerun
+    st.session_state.figure_cache = FigureCache()
 
 
 def generate_response(query: str):
@@ -49,6 +82,8 @@ def generate_response(query: str):
     the application's session state with messages, and renders the response in the user interface.
     :param query: The user's input message that will be processed and sent to the chat assistant.
     """
+    # Sessions asking the same question in the same conversation, e.g. an example question, share one run
+    coalesce_key = flight_key(query, st.session_state.messages) if config.get("SINGLE_FLIGHT_ENABLED", True) else None
     st.session_state.messages.append(HumanMessage(content=query))
     st.chat_message("user", avatar="figures/user.png").write(query)
 
@@ -56,10 +91,14 @@ def generate_response(query: str):
         # create a placeholder container for streaming and any other events to visually render here
         placeholder = st.container()
         try:
-            response = asyncio.run(invoke_our_graph(
+            # A checkpointed conversation only needs the new message
+            response = invoke_our_graph(
                 st.session_state.chat_agent,
-                st.session_state.messages,
-                placeholder))
+                st.session_state.messages[-1:] if st.session_state.thread_id else st.session_state.messages,
+                placeholder,
+                st.session_state.figure_cache,
+                thread_id=st.session_state.thread_id,
+                coalesce_key=coalesce_key)
             st.session_state.messages.append(response)
         except Exception as e:
             print(f'[OpenAI API] {e}')
@@ -98,7 +137,7 @@ for msg in st.session_state.messages:
         with st.chat_message("assistant", avatar="figures/assistant.png"):
             if "artifact" in msg.model_extra.keys():
                 st.session_state.figure_numbers += 1
-                fig = plotly.io.from_json(msg.artifact)
+                fig = st.session_state.figure_cache.get(msg.artifact)
                 st.plotly_chart(
                     fig,
                     key=f"plotly_chart_{st.session_state.figure_numbers:04d}",
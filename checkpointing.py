@@ -0,0 +1,311 @@
+"""
+Checkpointers persisting the state of the agent's conversations.
+
+With a checkpointer, the agent graph stores its messages after every step, keyed by the thread ID
+of the conversation. A conversation can then be continued by sending only the new message with its
+thread ID, by any worker with access to the checkpoints, and the user interface no longer has to
+keep the history of idle sessions in memory: it is loaded from the checkpoint when a session is
+resumed. The checkpointer is pluggable, any LangGraph BaseCheckpointSaver works. SqliteCheckpointSaver
+stores the checkpoints in a local SQLite database, which all workers of a host can share.
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (WRITES_IDX_MAP, BaseCheckpointSaver, ChannelVersions, Checkpoint,
+                                       CheckpointMetadata, CheckpointTuple, get_checkpoint_id,
+                                       get_checkpoint_metadata)
+from langgraph.checkpoint.memory import InMemorySaver
+
+CHECKPOINTER_NONE = "none"
+CHECKPOINTER_MEMORY = "memory"
+CHECKPOINTER_SQLITE = "sqlite"
+
+_schema = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    A checkpointer storing the checkpoints in a SQLite database.
+
+    The values of the channels are stored once per version, so a checkpoint only adds the channels
+    that changed in its step. The async methods run the queries in a worker thread.
+    """
+
+    def __init__(self, path: str, **kwargs: Any):
+        """
+        Args:
+            path: The database file, it is created with its directory if it does not exist.
+            kwargs: Further arguments of BaseCheckpointSaver, e.g. the serializer.
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            # WAL lets the workers of a host read while one of them writes
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_schema)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _query(self, sql: str, parameters: Sequence[Any] = ()) -> List[tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict:
+        channel_values = {}
+        for channel, version in versions.items():
+            rows = self._query(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)))
+            if rows and rows[0][0] != "empty":
+                channel_values[channel] = self.serde.loads_typed(rows[0])
+        return channel_values
+
+    def _tuple(self, row: tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint_: Checkpoint = self.serde.loads_typed((type_, checkpoint))
+        writes = self._query(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint_, "channel_values": self._load_blobs(
+                thread_id, checkpoint_ns, checkpoint_["channel_versions"])},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                             "checkpoint_id": parent_checkpoint_id}}
+                           if parent_checkpoint_id else None),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                   "metadata_type, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        if checkpoint_id := get_checkpoint_id(config):
+            rows = self._query(columns + " AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id))
+        else:
+            rows = self._query(columns + " ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns))
+        return self._tuple(rows[0]) if rows else None
+
+    def list(
+            self,
+            config: Optional[RunnableConfig],
+            *,
+            filter: Optional[dict] = None,
+            before: Optional[RunnableConfig] = None,
+            limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        conditions, parameters = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            parameters.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                parameters.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                parameters.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            parameters.append(before_checkpoint_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._query(
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            f"metadata_type, metadata FROM checkpoints {where} ORDER BY checkpoint_id DESC", parameters)
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            yield self._tuple(row)
+
+    def put(
+            self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        values = c.pop("channel_values")
+        blobs = [(thread_id, checkpoint_ns, channel, str(version),
+                  *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")))
+                 for channel, version in new_versions.items()]
+        type_, serialized = self.serde.dumps_typed(c)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, serialized, metadata_type, serialized_metadata))
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+            self,
+            config: RunnableConfig,
+            writes: Sequence[Tuple[str, Any]],
+            task_id: str,
+            task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock, self._connection:
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                # Special writes replace earlier ones, regular writes of a task are only stored once
+                verb = "INSERT OR REPLACE" if idx < 0 else "INSERT OR IGNORE"
+                self._connection.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel,
+                     *self.serde.dumps_typed(value), task_path))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self._connection:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._connection.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+            self,
+            config: Optional[RunnableConfig],
+            *,
+            filter: Optional[dict] = None,
+            before: Optional[RunnableConfig] = None,
+            limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+            self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+            self,
+            config: RunnableConfig,
+            writes: Sequence[Tuple[str, Any]],
+            task_id: str,
+            task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Versions sort as strings, like those of the in-memory checkpointer
+        version = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{version + 1:032}.{random.random():016}"
+
+
+def create_checkpointer(kind: str = CHECKPOINTER_NONE, path: Optional[str] = None) -> Optional[BaseCheckpointSaver]:
+    """
+    Creates the checkpointer of the agent.
+
+    Args:
+        kind: "sqlite" for a SQLite database, "memory" for checkpoints in the memory of the process,
+            or "none" to keep no state in the agent.
+        path: The database file of the SQLite checkpointer.
+
+    Returns:
+        Optional[BaseCheckpointSaver]: The checkpointer, None for "none"
+    """
+    if kind == CHECKPOINTER_NONE:
+        return None
+    if kind == CHECKPOINTER_MEMORY:
+        return InMemorySaver()
+    if kind == CHECKPOINTER_SQLITE:
+        if path is None:
+            raise ValueError("The SQLite checkpointer needs the path of its database")
+        return SqliteCheckpointSaver(path)
+    raise ValueError(f"Unknown checkpointer {kind}")
+
+
+def conversation_messages(messages: List[AnyMessage]) -> List[AnyMessage]:
+    """
+    Reduces the messages of a checkpointed conversation to the ones shown to the user.
+
+    Args:
+        messages: The messages of the agent's state, including tool calls and their outputs.
+
+    Returns:
+        List[AnyMessage]: The questions of the user and the final answers, each answer carrying the
+            last figure artifact of its turn, like the messages kept by the user interface
+    """
+    shown, artifact = [], None
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            shown.append(message)
+            artifact = None
+        elif isinstance(message, ToolMessage) and message.artifact is not None:
+            artifact = message.artifact
+        elif isinstance(message, AIMessage) and not message.tool_calls and message.content:
+            shown.append(AIMessage(content=message.content) if artifact is None
+                         else AIMessage(content=message.content, artifact=artifact))
+    return shown
@@ -0,0 +1,180 @@
+"""
+Process-wide event loop running in a background thread.
+
+Running every chat turn with asyncio.run creates and closes an event loop per turn, and with it
+every async client bound to that loop, e.g. the HTTP connections to OpenAI and the async Neo4j
+driver. Instead, all sessions submit their coroutines to one long-lived loop, so these clients
+are created once and reused across turns and sessions. Streamlit elements must be written from
+the script thread of their session, so async streams are consumed through iterate(), which
+hands their items over to the calling thread.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import queue
+import threading
+from typing import Any, AsyncGenerator, AsyncIterable, Awaitable, Callable, Coroutine, Iterator, List, Optional
+
+logger = logging.getLogger("ETF")
+
+DEFAULT_SHUTDOWN_TIMEOUT = 10.0  # seconds
+
+_ITEM, _ERROR, _DONE = range(3)
+
+# Coroutine functions awaited on the loop before it shuts down, e.g. to close async drivers
+_shutdown_hooks: List[Callable[[], Awaitable[Any]]] = []
+
+
+def on_loop_shutdown(hook: Callable[[], Awaitable[Any]]) -> None:
+    """Registers a coroutine function that is awaited on the background loop when it shuts down."""
+    _shutdown_hooks.append(hook)
+
+
+async def run_shutdown_hooks() -> None:
+    """Awaits the registered shutdown hooks on the running loop, e.g. when a server using its own loop stops."""
+    for hook in _shutdown_hooks:
+        try:
+            await hook()
+        except Exception as e:
+            logger.warning(f"Shutdown hook of the event loop failed: {e}")
+
+
+async def _await_at_shutdown(hook: Callable[[], Awaitable[Any]]) -> AsyncGenerator[None, None]:
+    try:
+        yield
+    finally:
+        await hook()
+
+
+async def on_running_loop_shutdown(hook: Callable[[], Awaitable[Any]]) -> AsyncGenerator[None, None]:
+    """
+    Awaits a coroutine function on the running loop when the loop shuts down, whichever loop it is.
+
+    The hook runs in the finally clause of an async generator, which the loop closes when it shuts down its
+    async generators, as asyncio.run, aiohttp's run_app, and BackgroundEventLoop.shutdown do. The returned
+    generator must be referenced as long as the hook is pending, closing it runs the hook early.
+    """
+    guard = _await_at_shutdown(hook)
+    await guard.__anext__()
+    return guard
+
+
+class BackgroundEventLoop:
+    """
+    An event loop that runs forever in a daemon thread.
+    """
+
+    def __init__(self, name: str = "ETF event loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._closed = False
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def submit(self, coroutine: Coroutine) -> concurrent.futures.Future:
+        """Schedules the coroutine on the loop, the future's cancel() cancels it."""
+        if self._closed:
+            coroutine.close()
+            raise RuntimeError("The background event loop has been shut down")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Runs the coroutine on the loop and waits for its result. It is cancelled if the caller is interrupted."""
+        future = self.submit(coroutine)
+        try:
+            return future.result(timeout)
+        finally:
+            future.cancel()
+
+    def iterate(self, items: AsyncIterable) -> Iterator:
+        """
+        Consumes an async iterable on the loop and yields its items in the calling thread.
+
+        If the caller stops early, e.g. because the Streamlit session ended while an answer was
+        streamed, the task consuming the iterable is cancelled and the async generator is closed.
+        """
+        handover: "queue.Queue[tuple]" = queue.Queue()
+
+        async def consume() -> None:
+            try:
+                async for item in items:
+                    handover.put((_ITEM, item))
+            except Exception as e:
+                handover.put((_ERROR, e))
+            else:
+                handover.put((_DONE, None))
+            finally:
+                if hasattr(items, "aclose"):
+                    await items.aclose()
+
+        future = self.submit(consume())
+        try:
+            while True:
+                kind, value = handover.get()
+                if kind == _DONE:
+                    return
+                if kind == _ERROR:
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+    def shutdown(self, timeout: float = DEFAULT_SHUTDOWN_TIMEOUT) -> None:
+        """Awaits the shutdown hooks, cancels all pending tasks, and stops the loop and its thread."""
+        if self._closed:
+            return
+
+        async def cancel_all() -> None:
+            await run_shutdown_hooks()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_all(), self.loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Event loop did not shut down cleanly: {e}")
+        finally:
+            self._closed = True
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self.loop.close()
+
+
+_background_loop: Optional[BackgroundEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """
+    Provides the event loop shared by all sessions of the process, it is started on the first call.
+    """
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.closed:
+            _background_loop = BackgroundEventLoop()
+        return _background_loop
+
+
+def shutdown_background_loop() -> None:
+    """Stops the shared event loop, e.g. when the process shuts down."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is not None:
+            _background_loop.shutdown()
+            _background_loop = None
+
+
+atexit.register(shutdown_background_loop)
@@ -0,0 +1,201 @@
+"""
+Compact artifacts of plotly figures passed from the tools to the user interface.
+
+An artifact is a small dictionary holding the figure JSON, optionally compressed with zlib and
+base64 encoded, together with the SHA-256 hash of the JSON. Numeric arrays are written as base64
+typed arrays, and the pinned template, which makes up most of a small figure, is referenced by
+name instead of being embedded. Figures with any other template, e.g. the one Streamlit sets as the
+process-wide default, keep it embedded. The hash identifies the figure, so a session decodes each
+figure once and takes it from its FigureCache on every later rerun. Clients not written in Python
+receive the plain plotly JSON of plotly_json() instead.
+"""
+
+import base64
+import functools
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io
+
+ARTIFACT_FORMAT = "plotly-figure"
+ARTIFACT_VERSION = 1
+DEFAULT_CACHE_SIZE = 32
+# The only template referenced by name, so the name does not depend on plotly.io.templates.default
+DEFAULT_TEMPLATE = "plotly"
+# Shorter numeric lists are cheaper as JSON than as base64
+MIN_TYPED_ARRAY_LENGTH = 8
+
+
+def _typed_array(values: list) -> Union[list, Dict[str, str]]:
+    """Converts a list of numbers into a base64 typed array as understood by plotly."""
+    if len(values) < MIN_TYPED_ARRAY_LENGTH or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return values
+    if all(isinstance(v, int) for v in values) and all(-2 ** 31 <= v < 2 ** 31 for v in values):
+        array = np.asarray(values, dtype="<i4")
+        dtype = "i4"
+    else:
+        array = np.asarray(values, dtype="<f8")
+        dtype = "f8"
+    return {"dtype": dtype, "bdata": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _compact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        value = _typed_array(value)
+        return [_compact(v) for v in value] if isinstance(value, list) else value
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def _serialized_template(name: str) -> Dict[str, Any]:
+    return json.loads(plotly.io.to_json(go.Figure(layout={"template": name}), validate=False))["layout"]["template"]
+
+
+def figure_json(fig: go.Figure, template: Optional[str] = DEFAULT_TEMPLATE) -> str:
+    """
+    Serializes the figure with typed arrays and a reference to the pinned template.
+
+    Args:
+        fig: The plotly figure.
+        template: The name of the template that is referenced instead of embedded if the figure uses it,
+            None to always embed the template.
+
+    Returns:
+        str: The compact figure JSON
+    """
+    figure = json.loads(plotly.io.to_json(fig, validate=False))
+    layout = figure.get("layout", {})
+    if template is not None and isinstance(layout.get("template"), dict):
+        if layout["template"] == _serialized_template(template):
+            layout["template"] = template
+    return json.dumps(_compact(figure), separators=(",", ":"))
+
+
+def encode_figure(fig: go.Figure, compress: bool = True) -> Dict[str, Any]:
+    """
+    Creates the artifact of a figure.
+
+    Args:
+        fig: The plotly figure.
+        compress: Whether to compress the figure JSON.
+
+    Returns:
+        Dict[str, Any]: The artifact
+    """
+    data = figure_json(fig)
+    artifact = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "hash": hashlib.sha256(data.encode()).hexdigest(),
+        "encoding": "json",
+        "data": data,
+    }
+    if compress:
+        artifact["encoding"] = "zlib"
+        artifact["data"] = base64.b64encode(zlib.compress(data.encode(), 6)).decode("ascii")
+    return artifact
+
+
+def artifact_hash(artifact: Union[str, Dict[str, Any]]) -> str:
+    """The content hash of an artifact, plain plotly JSON of older messages is hashed on the fly."""
+    if isinstance(artifact, dict):
+        return artifact["hash"]
+    return hashlib.sha256(artifact.encode()).hexdigest()
+
+
+def _artifact_data(artifact: Dict[str, Any]) -> str:
+    if artifact.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Unknown artifact format {artifact.get('format')}")
+    data = artifact["data"]
+    if artifact["encoding"] == "zlib":
+        data = zlib.decompress(base64.b64decode(data)).decode()
+    return data
+
+
+def _expand(value: Any) -> Any:
+    """Replaces the typed arrays by lists."""
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value:
+            array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value["dtype"])
+            if value.get("shape"):
+                array = array.reshape([int(n) for n in str(value["shape"]).split(",")])
+            return array.tolist()
+        return {k: _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+def plotly_json(artifact: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Restores the plain plotly JSON of an artifact, with lists instead of typed arrays and the template
+    embedded, so any plotly client can render it.
+
+    Args:
+        artifact: An artifact created by encode_figure, or the plotly JSON of a figure.
+
+    Returns:
+        Dict[str, Any]: The figure as plotly JSON
+    """
+    figure = _expand(json.loads(artifact if not isinstance(artifact, dict) else _artifact_data(artifact)))
+    layout = figure.get("layout", {})
+    if isinstance(layout.get("template"), str):
+        layout["template"] = _serialized_template(layout["template"])
+    return figure
+
+
+def decode_figure(artifact: Union[str, Dict[str, Any]]) -> go.Figure:
+    """
+    Restores the figure of an artifact.
+
+    Args:
+        artifact: An artifact created by encode_figure, or the plotly JSON of a figure.
+
+    Returns:
+        go.Figure: The figure
+    """
+    if not isinstance(artifact, dict):
+        return plotly.io.from_json(artifact)
+    return go.Figure(json.loads(_artifact_data(artifact)), skip_invalid=True)
+
+
+class FigureCache:
+    """
+    Decoded figures of a session, keyed by the hash of their artifacts.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._figures: "OrderedDict[str, go.Figure]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.decodes = 0
+
+    def get(self, artifact: Union[str, Dict[str, Any]]) -> go.Figure:
+        """Returns the figure of the artifact, decoding it only if it is not cached."""
+        key = artifact_hash(artifact)
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return self._figures[key]
+        fig = decode_figure(artifact)
+        with self._lock:
+            self.decodes += 1
+            self._figures[key] = fig
+            while len(self._figures) > self.max_size:
+                self._figures.popitem(last=False)
+        return fig
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"figures": len(self._figures), "hits": self.hits, "decodes": self.decodes}
@@ -1,23 +1,345 @@
+import asyncio
+import atexit
+import contextlib
+import logging
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+
+import neo4j
 from langchain_neo4j import Neo4jGraph
+from langchain_neo4j.graphs.neo4j_graph import _value_sanitize
 from config import config
+from event_loop import on_running_loop_shutdown
+from schema_snapshot import load_schema, invalidate_snapshots
+from tools.columnar import ColumnarBuilder, ColumnarResult
+
+logger = logging.getLogger("ETF")
+
+# Defaults for the shared connection pool, each of them may be overridden in the configuration
+DEFAULT_MAX_CONNECTION_POOL_SIZE = 50
+DEFAULT_CONNECTION_ACQUISITION_TIMEOUT = 60.0  # seconds
+DEFAULT_LIVENESS_CHECK_TIMEOUT = 30.0  # seconds
+DEFAULT_FETCH_SIZE = 1000  # records per batch pulled from the server
+
+
+def get_pool_config() -> Dict[str, Any]:
+    """
+    Reads the settings of the shared Neo4j connection pool from the configuration.
+
+    Returns:
+        Dict[str, Any]: The driver configuration passed to the Neo4j driver
+    """
+    return {
+        "max_connection_pool_size": int(
+            config.get("NEO4J_MAX_CONNECTION_POOL_SIZE", DEFAULT_MAX_CONNECTION_POOL_SIZE)),
+        "connection_acquisition_timeout": float(
+            config.get("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", DEFAULT_CONNECTION_ACQUISITION_TIMEOUT)),
+        "liveness_check_timeout": float(
+            config.get("NEO4J_LIVENESS_CHECK_TIMEOUT", DEFAULT_LIVENESS_CHECK_TIMEOUT)),
+        "fetch_size": int(config.get("NEO4J_FETCH_SIZE", DEFAULT_FETCH_SIZE)),
+    }
+
+
+class PoolMetrics:
+    """
+    Thread-safe bookkeeping of how the shared connection pool is used.
+
+    Every query borrows one slot of the pool. The time a query waits for a free slot is recorded
+    separately from the time it holds the slot, so we can see whether sessions queue up on the pool.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.borrowed = 0
+        self.timeouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record_borrow(self, wait_time: float):
+        with self._lock:
+            self.in_use += 1
+            self.borrowed += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def record_release(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "idle": self.max_size - self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "borrowed": self.borrowed,
+                "timeouts": self.timeouts,
+                "total_wait_time": self.total_wait_time,
+                "mean_wait_time": self.total_wait_time / self.borrowed if self.borrowed else 0.0,
+                "max_wait_time": self.max_wait_time,
+            }
+
+
+class PooledNeo4jGraph(Neo4jGraph):
+    """
+    A Neo4jGraph whose queries borrow a slot of the process-wide connection pool.
+
+    The slots mirror the connection pool of the underlying driver. Borrowing them here lets us
+    measure the time spent waiting for a connection and raise a clear error once the acquisition
+    timeout is exceeded instead of letting requests pile up silently.
+    """
+
+    def __init__(self, *args, pool_config: Dict[str, Any], **kwargs):
+        super().__init__(*args, driver_config=pool_config, **kwargs)
+        self._url = kwargs.get("url")
+        self._auth = (kwargs.get("username"), kwargs.get("password"))
+        self._pool_config = pool_config
+        self._acquisition_timeout = pool_config["connection_acquisition_timeout"]
+        self._slots = threading.BoundedSemaphore(pool_config["max_connection_pool_size"])
+        self.pool_metrics = PoolMetrics(pool_config["max_connection_pool_size"])
+        # Async drivers are bound to the event loop they were created in, so we keep one pool per loop
+        self._async_pools: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _timeout_error(self) -> TimeoutError:
+        return TimeoutError(
+            f"Could not acquire a Neo4j connection within {self._acquisition_timeout} seconds. "
+            f"All {self.pool_metrics.max_size} connections of the pool are in use."
+        )
+
+    @contextlib.contextmanager
+    def _borrow_slot(self) -> Iterator[None]:
+        """Holds a slot of the sync driver's pool, waiting at most the acquisition timeout for it."""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self._acquisition_timeout):
+            self.pool_metrics.record_timeout()
+            raise self._timeout_error()
+        self.pool_metrics.record_borrow(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self.pool_metrics.record_release()
+            self._slots.release()
+
+    @contextlib.asynccontextmanager
+    async def _aborrow_slot(self) -> AsyncIterator[neo4j.AsyncDriver]:
+        """Holds a slot of the running loop's async pool and provides its driver."""
+        pool = await self._get_async_pool()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(pool["slots"].acquire(), timeout=self._acquisition_timeout)
+        except asyncio.TimeoutError:
+            pool["metrics"].record_timeout()
+            raise self._timeout_error()
+        pool["metrics"].record_borrow(time.perf_counter() - start)
+        try:
+            yield pool["driver"]
+        finally:
+            pool["metrics"].record_release()
+            pool["slots"].release()
+
+    def query(self, query: str, params: dict = {}, session_params: dict = {}) -> List[Dict[str, Any]]:
+        with self._borrow_slot():
+            return super().query(query, params, session_params)
+
+    def stream_query(self, query: str, params: dict = {}, limit: Optional[int] = None,
+                     columnar: bool = False) -> Union[List[Dict[str, Any]], ColumnarResult]:
+        """
+        Runs a read query and consumes its records from a streaming cursor.
+
+        Records are pulled from the server in batches of the configured fetch size. Once the limit
+        is reached, the remaining records are discarded on the server instead of being transferred.
+
+        Args:
+            query: The Cypher query to execute.
+            params: The parameters to pass to the query.
+            limit: The maximal number of records to return.
+            columnar: Whether to write the values straight into typed columns instead of dictionaries.
+
+        Returns:
+            The list of dictionaries, or the columns, containing at most limit query results.
+        """
+        self._check_driver_state()
+        with self._borrow_slot():
+            with self._driver.session(database=self._database, default_access_mode=neo4j.READ_ACCESS) as session:
+                result = session.run(neo4j.Query(text=query, timeout=self.timeout), params)
+                if columnar:
+                    data = ColumnarResult.from_rows(
+                        result.keys(), result, limit, _value_sanitize if self.sanitize else None)
+                else:
+                    data = []
+                    for record in result:
+                        data.append(_value_sanitize(record.data()) if self.sanitize else record.data())
+                        if limit is not None and len(data) >= limit:
+                            break
+                result.consume()
+            return data
+
+    async def _get_async_pool(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_pools:
+            max_size = self._pool_config["max_connection_pool_size"]
+            self._async_pools[loop] = {
+                "driver": neo4j.AsyncGraphDatabase.driver(self._url, auth=self._auth, **self._pool_config),
+                "slots": asyncio.BoundedSemaphore(max_size),
+                "metrics": PoolMetrics(max_size),
+            }
+            # Every loop closes its driver when it shuts down, not only the background loop
+            self._async_pools[loop]["closing"] = await on_running_loop_shutdown(self._close_async_pool)
+        return self._async_pools[loop]
+
+    async def _close_async_pool(self) -> None:
+        pool = self._async_pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool["driver"].close()
+
+    async def aclose_async_pool(self) -> None:
+        """
+        Closes the async driver of the running event loop, e.g. before the loop shuts down.
+        """
+        pool = self._async_pools.get(asyncio.get_running_loop())
+        if pool is not None:
+            await pool["closing"].aclose()
+
+    def async_pool_metrics(self) -> List[Dict[str, Any]]:
+        """The usage of the async pools, one per event loop."""
+        return [pool["metrics"].snapshot() for pool in list(self._async_pools.values())]
+
+    async def aquery(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        """
+        Runs a query with the async driver of the running event loop without blocking the loop.
+
+        Args:
+            query: The Cypher query to execute.
+            params: The parameters to pass to the query.
+
+        Returns:
+            The list of dictionaries containing the query results.
+        """
+        self._check_driver_state()
+        async with self._aborrow_slot() as driver:
+            records, _, _ = await driver.execute_query(
+                neo4j.Query(text=query, timeout=self.timeout),
+                database_=self._database,
+                parameters_=params,
+            )
+            json_data = [r.data() for r in records]
+            if self.sanitize:
+                json_data = [_value_sanitize(el) for el in json_data]
+            return json_data
+
+    async def astream_query(self, query: str, params: dict = {}, limit: Optional[int] = None,
+                            columnar: bool = False) -> Union[List[Dict[str, Any]], ColumnarResult]:
+        """
+        Async variant of stream_query that uses the async driver of the running event loop.
+        """
+        self._check_driver_state()
+        async with self._aborrow_slot() as driver:
+            async with driver.session(database=self._database, default_access_mode=neo4j.READ_ACCESS) as session:
+                result = await session.run(neo4j.Query(text=query, timeout=self.timeout), params)
+                if columnar:
+                    builder = ColumnarBuilder(result.keys(), _value_sanitize if self.sanitize else None)
+                    async for record in result:
+                        builder.add(record)
+                        if limit is not None and len(builder) >= limit:
+                            break
+                    data = builder.build()
+                else:
+                    data = []
+                    async for record in result:
+                        data.append(_value_sanitize(record.data()) if self.sanitize else record.data())
+                        if limit is not None and len(data) >= limit:
+                            break
+                await result.consume()
+            return data
+
+
+_shared_graph: Optional[PooledNeo4jGraph] = None
+_shared_graph_lock = threading.Lock()
 
 
 def connect_to_neo4j() -> Neo4jGraph:
     """
-    Connects to a Neo4j graph using the provided credentials.
+    Provides the process-wide Neo4j graph that all tools and sessions share.
+
+    The graph and its driver, including the connection pool, are created on the first call only.
+    Every subsequent call returns the same instance. The schema is read from its persisted snapshot
+    instead of being introspected, whenever possible.
 
     Returns:
         Neo4jGraph: The Neo4j graph instance
     """
-    # TODO: Catch ValueError("Cannot resolve address {}".format(address))
-    # ValueError: Could not connect to Neo4j database. Please ensure that the url is correct
-    return Neo4jGraph(
-        url=config["NEO4J_URI"],
-        username=config["NEO4J_USERNAME"],
-        password=config["NEO4J_PASSWORD"],
-    )
+    global _shared_graph
+    if _shared_graph is None:
+        with _shared_graph_lock:
+            if _shared_graph is None:
+                pool_config = get_pool_config()
+                logger.debug(f"Creating shared Neo4j connection pool with {pool_config}")
+                # TODO: Catch ValueError("Cannot resolve address {}".format(address))
+                # ValueError: Could not connect to Neo4j database. Please ensure that the url is correct
+                _shared_graph = PooledNeo4jGraph(
+                    url=config["NEO4J_URI"],
+                    username=config["NEO4J_USERNAME"],
+                    password=config["NEO4J_PASSWORD"],
+                    pool_config=pool_config,
+                    refresh_schema=False,
+                )
+                load_schema(_shared_graph)
+    return _shared_graph
+
+
+def get_pool_metrics() -> Dict[str, Any]:
+    """
+    Reports the usage of the shared connection pool.
+
+    Returns:
+        Dict[str, Any]: Connections of the sync driver in use and idle, and the time spent waiting for a
+            connection, with the same figures for the async driver of each event loop under "async_pools".
+            Empty if no connection has been established yet.
+    """
+    if _shared_graph is None:
+        return {}
+    return {**_shared_graph.pool_metrics.snapshot(), "async_pools": _shared_graph.async_pool_metrics()}
+
+
+def invalidate_schema_snapshot() -> None:
+    """
+    Discards the persisted schema snapshots after the graph database was reloaded.
+    If we are already connected, the schema of the shared graph is introspected and stored again.
+    """
+    invalidate_snapshots()
+    with _shared_graph_lock:
+        if _shared_graph is not None:
+            load_schema(_shared_graph)
+
+
+def close_neo4j() -> None:
+    """
+    Closes the shared driver and its connection pool, e.g. when the process shuts down.
+    """
+    global _shared_graph
+    with _shared_graph_lock:
+        if _shared_graph is not None:
+            _shared_graph.close()
+            _shared_graph = None
+
+
+atexit.register(close_neo4j)
 
 
-# Connect to Neo4j and provide the graph as
-# from graph import graph
-graph = connect_to_neo4j()
+def __getattr__(name: str) -> Any:
+    # Connect to Neo4j lazily and provide the shared graph as
+    # from graph import graph
+    if name == "graph":
+        return connect_to_neo4j()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,207 @@
+"""
+Token-budgeted compaction of the conversation history sent to the agent's model.
+
+The whole chat is sent with every model call, including tool outputs with complete <data>
+blocks. Once the history exceeds its token budget, the messages before the most recent turns are
+compacted in two steps: first the payloads of old tool outputs are removed, then, if that is not
+enough, the old messages are replaced by a summary. The summary is rolling: it is cached for the
+messages it covers and extended by the messages that became old since, so each message is
+summarized only once. The recent turns are always sent verbatim.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately, get_buffer_string
+
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_RECENT_TURNS = 2
+DEFAULT_MAX_TOOL_OUTPUT_CHARACTERS = 1000
+DEFAULT_SUMMARY_CACHE_SIZE = 64
+
+SUMMARY_PROMPT = """Summarize the following conversation between a user and EcoToxFred, an assistant for \
+environmental monitoring and hazard data. Keep the substances, sites, species, time ranges, and findings \
+that were discussed, and the Cypher queries that were used. Answer with the summary only.
+
+{summary}{conversation}"""
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# The summary must not show up as streamed tokens of the agent's answer
+_SUMMARY_CONFIG = {"callbacks": [], "run_name": "history_summary"}
+
+_data_block = re.compile(r"<data>.*?</data>", re.DOTALL)
+
+_totals = {"model_calls": 0, "compacted_calls": 0, "tokens_before": 0, "tokens_after": 0,
+           "summaries_computed": 0, "summaries_cached": 0}
+_totals_lock = threading.Lock()
+
+
+def strip_tool_output(message: ToolMessage, max_characters: int) -> ToolMessage:
+    """Removes the <data> blocks of a tool output and shortens what remains."""
+    if not isinstance(message.content, str):
+        return message
+    content = _data_block.sub("<data>(removed from the history)</data>", message.content)
+    if len(content) > max_characters:
+        content = content[:max_characters] + " ... (shortened)"
+    if content == message.content:
+        return message
+    return message.model_copy(update={"content": content})
+
+
+def _prefix_hashes(messages: List[AnyMessage]) -> List[str]:
+    """Hashes of all prefixes of the messages, the i-th covering the first i messages."""
+    hashes = [hashlib.sha256().hexdigest()]
+    for message in messages:
+        hashes.append(hashlib.sha256((hashes[-1] + get_buffer_string([message])).encode()).hexdigest())
+    return hashes
+
+
+class HistoryCompactionMiddleware(AgentMiddleware):
+    """
+    Keeps the messages of each model call within a token budget.
+    """
+
+    def __init__(
+            self,
+            summary_model: Optional[Any] = None,
+            token_budget: int = DEFAULT_TOKEN_BUDGET,
+            recent_turns: int = DEFAULT_RECENT_TURNS,
+            max_tool_output_characters: int = DEFAULT_MAX_TOOL_OUTPUT_CHARACTERS,
+            summary_cache_size: int = DEFAULT_SUMMARY_CACHE_SIZE,
+    ):
+        """
+        :param summary_model: Chat model summarizing old messages, without it they are dropped instead.
+        :param token_budget: Approximate number of tokens the messages of a model call may have.
+        :param recent_turns: Number of most recent user turns, with all their messages, that are never compacted.
+        :param max_tool_output_characters: Length to which old tool outputs are shortened.
+        :param summary_cache_size: Number of rolling summaries that are kept.
+        """
+        super().__init__()
+        self.summary_model = summary_model
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.max_tool_output_characters = max_tool_output_characters
+        self.summary_cache_size = summary_cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _split(self, messages: List[AnyMessage]) -> int:
+        """Index of the first message of the recent turns, which starts with a user message."""
+        turns = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if len(turns) <= self.recent_turns:
+            return 0
+        return turns[-self.recent_turns] if self.recent_turns > 0 else len(messages)
+
+    def _strip(self, messages: List[AnyMessage], split: int) -> List[AnyMessage]:
+        return [strip_tool_output(m, self.max_tool_output_characters) if isinstance(m, ToolMessage) and i < split
+                else m for i, m in enumerate(messages)]
+
+    def _cached_summary(self, old: List[AnyMessage]) -> Tuple[str, str, int, Optional[str]]:
+        """
+        Looks up the summary of the longest prefix of the old messages.
+
+        :return: The key of all old messages, the summary found, the number of messages it covers,
+            and the summary of all old messages if it is cached.
+        """
+        hashes = _prefix_hashes(old)
+        with self._lock:
+            if hashes[-1] in self._summaries:
+                self._summaries.move_to_end(hashes[-1])
+                return hashes[-1], self._summaries[hashes[-1]], len(old), self._summaries[hashes[-1]]
+            for covered in range(len(old) - 1, 0, -1):
+                if hashes[covered] in self._summaries:
+                    return hashes[-1], self._summaries[hashes[covered]], covered, None
+        return hashes[-1], "", 0, None
+
+    def _summary_prompt(self, summary: str, new_messages: List[AnyMessage]) -> str:
+        previous = f"Summary of the conversation so far:\n{summary}\n\nHow it continued:\n" if summary else ""
+        return SUMMARY_PROMPT.format(summary=previous, conversation=get_buffer_string(new_messages))
+
+    def _store_summary(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.summary_cache_size:
+                self._summaries.popitem(last=False)
+
+    def _compacted(self, messages: List[AnyMessage], split: int, summary: Optional[str]) -> List[AnyMessage]:
+        if summary is None:
+            note = f"{split} earlier messages of the conversation were removed to save context."
+            return [HumanMessage(content=note)] + messages[split:]
+        return [HumanMessage(content=SUMMARY_PREFIX + summary)] + messages[split:]
+
+    def _record(self, before: int, after: int, compacted: bool, summary_computed: bool = False,
+                summary_cached: bool = False) -> None:
+        with _totals_lock:
+            _totals["model_calls"] += 1
+            _totals["compacted_calls"] += int(compacted)
+            _totals["tokens_before"] += before
+            _totals["tokens_after"] += after
+            _totals["summaries_computed"] += int(summary_computed)
+            _totals["summaries_cached"] += int(summary_cached)
+
+    def _prepare(self, messages: List[AnyMessage]) -> Tuple[List[AnyMessage], int, int]:
+        """Strips old tool outputs. Returns the messages, the index of the recent turns, and the tokens before."""
+        before = count_tokens_approximately(messages)
+        split = self._split(messages)
+        if before <= self.token_budget or split == 0:
+            return messages, 0, before
+        return self._strip(messages, split), split, before
+
+    def compact(self, messages: List[AnyMessage]) -> List[AnyMessage]:
+        """Compacts the history to fit the token budget, summarizing old messages if needed."""
+        stripped, split, before = self._prepare(messages)
+        if split == 0 or count_tokens_approximately(stripped) <= self.token_budget:
+            self._record(before, count_tokens_approximately(stripped), stripped is not messages)
+            return stripped
+        summary, computed, cached = None, False, False
+        if self.summary_model is not None:
+            key, summary, covered, complete = self._cached_summary(stripped[:split])
+            cached = complete is not None
+            if not cached:
+                prompt = self._summary_prompt(summary, stripped[covered:split])
+                summary = self.summary_model.invoke(prompt, config=_SUMMARY_CONFIG).content
+                self._store_summary(key, summary)
+                computed = True
+        compacted = self._compacted(stripped, split, summary)
+        self._record(before, count_tokens_approximately(compacted), True, computed, cached)
+        return compacted
+
+    async def acompact(self, messages: List[AnyMessage]) -> List[AnyMessage]:
+        """Async variant of compact()."""
+        stripped, split, before = self._prepare(messages)
+        if split == 0 or count_tokens_approximately(stripped) <= self.token_budget:
+            self._record(before, count_tokens_approximately(stripped), stripped is not messages)
+            return stripped
+        summary, computed, cached = None, False, False
+        if self.summary_model is not None:
+            key, summary, covered, complete = self._cached_summary(stripped[:split])
+            cached = complete is not None
+            if not cached:
+                prompt = self._summary_prompt(summary, stripped[covered:split])
+                summary = (await self.summary_model.ainvoke(prompt, config=_SUMMARY_CONFIG)).content
+                self._store_summary(key, summary)
+                computed = True
+        compacted = self._compacted(stripped, split, summary)
+        self._record(before, count_tokens_approximately(compacted), True, computed, cached)
+        return compacted
+
+    def wrap_model_call(self, request: ModelRequest, handler: Callable[[ModelRequest], ModelResponse]) -> Any:
+        return handler(request.override(messages=self.compact(request.messages)))
+
+    async def awrap_model_call(
+            self, request: ModelRequest, handler: Callable[[ModelRequest], Awaitable[ModelResponse]]
+    ) -> Any:
+        return await handler(request.override(messages=await self.acompact(request.messages)))
+
+
+def get_history_compaction_metrics() -> Dict[str, Any]:
+    """Returns the number of compacted model calls and the approximate tokens saved in the process."""
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["saved_tokens"] = totals["tokens_before"] - totals["tokens_after"]
+    return totals
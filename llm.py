@@ -2,20 +2,43 @@ import os
 
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from config import config
+from llm_scheduler import (DEFAULT_BASE_DELAY, DEFAULT_MAX_DELAY, DEFAULT_MAX_RETRIES, LLMScheduler,
+                           ScheduledChatOpenAI, get_shared_scheduler)
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """
+    Provides the scheduler admitting the requests of all chat models within the OpenAI rate limits.
+
+    Returns:
+        LLMScheduler: The scheduler shared by the process
+    """
+    return get_shared_scheduler(
+        requests_per_minute=int(config.get("LLM_REQUESTS_PER_MINUTE", 0)),
+        tokens_per_minute=int(config.get("LLM_TOKENS_PER_MINUTE", 0)),
+        max_retries=int(config.get("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+        base_delay=float(config.get("LLM_RETRY_BASE_DELAY", DEFAULT_BASE_DELAY)),
+        max_delay=float(config.get("LLM_RETRY_MAX_DELAY", DEFAULT_MAX_DELAY)),
+    )
 
 
 def get_chat_llm() -> ChatOpenAI:
     """
     Creates a ChatOpenAI LLM using the provided OpenAI API key and model.
 
+    Its requests wait for the shared scheduler, which also retries them after rate limit errors.
+
     Returns:
         ChatOpenAI: The ChatOpenAI LLM
     """
-    return ChatOpenAI(
+    return ScheduledChatOpenAI(
         openai_api_key=config["OPENAI_API_KEY"],
         model_name=config["OPENAI_MODEL"],
         streaming=True,
         temperature=0,
+        # Retries are left to the scheduler, which backs off all requests after a rate limit error
+        max_retries=0,
+        scheduler=get_llm_scheduler(),
     )
 
 
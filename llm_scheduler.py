@@ -0,0 +1,409 @@
+"""
+Admission control for the requests to the OpenAI API.
+
+All chat models created by llm.get_chat_llm share one LLMScheduler. A request is admitted once
+token buckets for the requests and the tokens per minute allow it, the tokens being estimated
+from the prompt and corrected by the usage reported in the response. Waiting requests are admitted
+by priority, so the turns of interactive users go before evaluation runs, and in arrival order
+within a priority. A rate limit error (429) pauses the admission of all requests and the failed
+request is retried after a jittered exponential backoff, so bursts make requests wait instead of
+failing the turn.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import enum
+import functools
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import openai
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+from pydantic import Field
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_DELAY = 1.0  # seconds
+DEFAULT_MAX_DELAY = 60.0  # seconds
+# Expected length of an answer if the model has no max_tokens
+DEFAULT_COMPLETION_TOKENS = 500
+# Waiting requests that are not next in line check again after this time
+POLL_INTERVAL = 0.05  # seconds
+
+
+class Priority(enum.IntEnum):
+    """Priorities of LLM requests, lower values are admitted first."""
+    INTERACTIVE = 0
+    EVALUATION = 1
+
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("llm_priority", default=Priority.INTERACTIVE)
+
+
+@contextlib.contextmanager
+def llm_priority(priority: Priority) -> Iterator[None]:
+    """
+    Sets the priority of the LLM requests made in this context, including tasks and threads started from it.
+
+    Args:
+        priority: The priority of the requests.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at a rate per minute, holding at most one minute of tokens.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.clock = clock
+        self.level = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until the amount is available, amounts above the capacity wait for a full bucket."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        """Returns overestimated tokens, a negative amount takes the underestimated ones."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    # An exhausted quota is reported as 429 as well, but waiting does not help
+    return isinstance(error, openai.RateLimitError) and getattr(error, "code", None) != "insufficient_quota"
+
+
+def is_retryable(error: BaseException) -> bool:
+    return is_rate_limit_error(error) or isinstance(error, (openai.APIConnectionError, openai.InternalServerError))
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """The delay requested by the Retry-After header of the error's response, in seconds."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """
+    Admits LLM requests by priority within request and token rate limits, and retries failed requests.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: int = 0,
+            tokens_per_minute: int = 0,
+            max_retries: int = DEFAULT_MAX_RETRIES,
+            base_delay: float = DEFAULT_BASE_DELAY,
+            max_delay: float = DEFAULT_MAX_DELAY,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            requests_per_minute: Requests admitted per minute, 0 for no limit.
+            tokens_per_minute: Estimated prompt and completion tokens admitted per minute, 0 for no limit.
+            max_retries: Number of retries of a request failing with a rate limit or a transient error.
+            base_delay: Backoff of the first retry in seconds, doubled for every further retry.
+            max_delay: Upper bound of the backoff in seconds.
+            clock: Source of the current time in seconds.
+        """
+        self.requests = TokenBucket(requests_per_minute, clock) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, clock) if tokens_per_minute > 0 else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self._condition = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._counters = {"admitted": 0, "retries": 0, "rate_limited": 0, "failed": 0, "max_queue_depth": 0}
+        self._waiting_seconds = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """Stops admitting requests for the given time, e.g. after the API reported a rate limit."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def _enqueue(self, priority: Optional[Priority]) -> Tuple[int, int]:
+        ticket = (int(current_priority() if priority is None else priority), next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+            self._counters["max_queue_depth"] = max(self._counters["max_queue_depth"], len(self._queue))
+        return ticket
+
+    def _dequeue(self, ticket: Tuple[int, int]) -> None:
+        with self._condition:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+    def _try_admit(self, ticket: Tuple[int, int], tokens: int) -> float:
+        """Admits the request if it is next in line and within the limits, otherwise returns the time to wait."""
+        if self._queue[0] != ticket:
+            return POLL_INTERVAL
+        wait = max(0.0, self._paused_until - self.clock())
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        if wait > 0:
+            return wait
+        heapq.heappop(self._queue)
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        self._counters["admitted"] += 1
+        self._condition.notify_all()
+        return 0.0
+
+    def acquire(self, tokens: int, priority: Optional[Priority] = None) -> None:
+        """Blocks until a request with the estimated number of tokens is admitted."""
+        start = self.clock()
+        ticket = self._enqueue(priority)
+        try:
+            with self._condition:
+                while (wait := self._try_admit(ticket, tokens)) > 0:
+                    self._condition.wait(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        with self._condition:
+            self._waiting_seconds += self.clock() - start
+
+    async def aacquire(self, tokens: int, priority: Optional[Priority] = None) -> None:
+        """Waits without blocking the event loop until a request with the estimated number of tokens is admitted."""
+        start = self.clock()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_admit(ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        with self._condition:
+            self._waiting_seconds += self.clock() - start
+
+    def settle(self, estimated: int, used: Optional[int]) -> None:
+        """Corrects the token bucket by the tokens a request actually used."""
+        if self.tokens is not None and used is not None:
+            with self._condition:
+                self.tokens.give_back(estimated - used)
+
+    def retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        The backoff before retrying a failed request, None if it must not be retried.
+
+        Args:
+            error: The error of the request.
+            attempt: The number of retries of the request so far.
+
+        Returns:
+            Optional[float]: The delay in seconds
+        """
+        if not is_retryable(error):
+            return None
+        with self._condition:
+            if attempt >= self.max_retries:
+                self._counters["failed"] += 1
+                return None
+            backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+            # Half of the backoff is jittered, so requests failing together do not retry together
+            delay = max(backoff / 2 + random.uniform(0, backoff / 2), _retry_after(error) or 0.0)
+            self._counters["retries"] += 1
+            if is_rate_limit_error(error):
+                self._counters["rate_limited"] += 1
+                self.pause(delay)
+        return delay
+
+    def call(self, request: Callable[[], Any], tokens: int, priority: Optional[Priority] = None) -> Any:
+        """Runs a request once it is admitted, retrying it after rate limit and transient errors."""
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            try:
+                return request()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def acall(self, request: Callable[[], Awaitable[Any]], tokens: int,
+                    priority: Optional[Priority] = None) -> Any:
+        """Async variant of call()."""
+        for attempt in itertools.count():
+            await self.aacquire(tokens, priority)
+            try:
+                return await request()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def stream(self, request: Callable[[], Iterator], tokens: int, priority: Optional[Priority] = None) -> Iterator:
+        """Streams a request once it is admitted. It is only retried if it fails before its first item."""
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            started = False
+            try:
+                for item in request():
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                delay = None if started else self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def astream(self, request: Callable[[], AsyncIterator], tokens: int,
+                      priority: Optional[Priority] = None) -> AsyncIterator:
+        """Async variant of stream()."""
+        for attempt in itertools.count():
+            await self.aacquire(tokens, priority)
+            started = False
+            try:
+                async for item in request():
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                delay = None if started else self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            depth = {p.name.lower(): sum(1 for t in self._queue if t[0] == p) for p in Priority}
+            metrics = dict(self._counters, queue_depth=len(self._queue), queue_depth_by_priority=depth)
+            metrics["paused_seconds"] = max(0.0, self._paused_until - self.clock())
+            admitted = metrics["admitted"]
+            metrics["mean_waiting_seconds"] = self._waiting_seconds / admitted if admitted else 0.0
+        return metrics
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose requests are admitted and retried by an LLMScheduler.
+    """
+
+    scheduler: Optional[Any] = Field(default=None, exclude=True)
+
+    def _estimate_tokens(self, messages: List[BaseMessage]) -> int:
+        return count_tokens_approximately(messages) + (self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+    @staticmethod
+    def _used_tokens(result: ChatResult) -> Optional[int]:
+        return ((result.llm_output or {}).get("token_usage") or {}).get("total_tokens")
+
+    @staticmethod
+    def _chunk_tokens(chunk: ChatGenerationChunk) -> Optional[int]:
+        usage = getattr(chunk.message, "usage_metadata", None)
+        return usage["total_tokens"] if usage else None
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.scheduler is None:
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        estimate = self._estimate_tokens(messages)
+        result = self.scheduler.call(functools.partial(super()._generate, messages, stop, run_manager, **kwargs),
+                                     estimate)
+        self.scheduler.settle(estimate, self._used_tokens(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.scheduler is None:
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        estimate = self._estimate_tokens(messages)
+        result = await self.scheduler.acall(
+            functools.partial(super()._agenerate, messages, stop, run_manager, **kwargs), estimate)
+        self.scheduler.settle(estimate, self._used_tokens(result))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        if self.scheduler is None:
+            yield from super()._stream(messages, stop, run_manager, **kwargs)
+            return
+        estimate, used = self._estimate_tokens(messages), None
+        for chunk in self.scheduler.stream(functools.partial(super()._stream, messages, stop, run_manager, **kwargs),
+                                           estimate):
+            used = self._chunk_tokens(chunk) or used
+            yield chunk
+        self.scheduler.settle(estimate, used)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        if self.scheduler is None:
+            async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+        estimate, used = self._estimate_tokens(messages), None
+        async for chunk in self.scheduler.astream(
+                functools.partial(super()._astream, messages, stop, run_manager, **kwargs), estimate):
+            used = self._chunk_tokens(chunk) or used
+            yield chunk
+        self.scheduler.settle(estimate, used)
+
+
+_shared_scheduler: Optional[LLMScheduler] = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def get_shared_scheduler(**limits: Any) -> LLMScheduler:
+    """
+    Provides the scheduler shared by all chat models of the process.
+
+    Args:
+        limits: The arguments of LLMScheduler, used when the scheduler is created on the first call.
+
+    Returns:
+        LLMScheduler: The shared scheduler
+    """
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = LLMScheduler(**limits)
+        return _shared_scheduler
+
+
+def get_llm_scheduler_metrics() -> Dict[str, Any]:
+    """Returns the queue depth, waiting times, and retries of the shared scheduler."""
+    return _shared_scheduler.metrics() if _shared_scheduler is not None else {}
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import os
 import re
-from typing import List, Iterable, Type
+from typing import List, Iterable, Optional, Type
 from langchain_core.prompts import PromptTemplate
 
 import yaml
@@ -14,6 +14,7 @@ current_directory = os.path.dirname(current_file_path)
 prompts_directory = os.path.join(current_directory, 'prompts')
 
 graph_metadata_file = os.path.join(prompts_directory, "graph_schema_metadata.yml")
+example_questions_file = os.path.join(prompts_directory, "example_questions.yml")
 
 
 class ToolDescriptions:
@@ -57,6 +58,7 @@ class Prompt:
             self.parameters = set(self.data['parameters'])
         else:
             self.parameters = set()
+        self.defaults = {}
         self.prompt_name = os.path.splitext(os.path.basename(prompt_file))[0]
         if not re.match(r"[a-z_]+", self.prompt_name):
             raise ValueError("File name of the prompt file must only contain letters and underscores.")
@@ -66,12 +68,25 @@ class Prompt:
             raise MemoryError("Cannot append the same Prompt to itself!")
         self.prompt += "\n" + other.prompt
         self.parameters = self.parameters.union(other.parameters)
+        self.defaults.update(other.defaults)
 
-    def inject_examples(self, examples: CypherExampleCollection):
+    def inject_examples(self, examples: CypherExampleCollection, per_call: bool = False):
+        """
+        Injects all examples of the collection into the placeholder named after the collection.
+
+        :param examples: The collection of Cypher examples.
+        :param per_call: If True, the placeholder is renamed to the generic "examples" and all examples are only
+            its default, so that single calls of the prompt template can pass a selection of the examples.
+        """
         assert len(examples.examples) > 0
         placeholder_name = examples.get_placeholder_name()
         assert placeholder_name in self.parameters
-        self.partial_apply({placeholder_name: examples.format_examples_as_markdown()})
+        if per_call:
+            self.prompt = self.prompt.format_map(DefaultDict({placeholder_name: "{examples}"}))
+            self.parameters = (set(self.parameters) - {placeholder_name}) | {"examples"}
+            self.partial_apply_defaults({"examples": examples.format_examples_as_markdown()})
+        else:
+            self.partial_apply({placeholder_name: examples.format_examples_as_markdown()})
 
     def has_parameter(self, parameter: str) -> bool:
         return parameter in self.parameters
@@ -89,8 +104,24 @@ class Prompt:
         self.prompt = self.prompt.format_map(DefaultDict(parameters))
         self.parameters = set(self.parameters) - params_key_set
 
+    def partial_apply_defaults(self, parameters: dict):
+        """
+        Like partial_apply, but the values are kept as defaults of the prompt template,
+        so that single calls of the template can still replace them, e.g. with a shorter version.
+        """
+        params_key_set = set(parameters.keys())
+        assert params_key_set.issubset(set(self.parameters))
+        self.defaults.update(parameters)
+        self.parameters = set(self.parameters) - params_key_set
+
+    @property
+    def full_text(self) -> str:
+        """The prompt with all default values applied."""
+        return self.prompt.format_map(DefaultDict(self.defaults))
+
     def get_prompt_template(self) -> PromptTemplate:
-        return PromptTemplate(input_variable=list(self.parameters), template=self.prompt)
+        return PromptTemplate(input_variable=list(self.parameters), template=self.prompt,
+                              partial_variables=dict(self.defaults))
 
 
 # noinspection PyMethodParameters
@@ -124,10 +155,10 @@ class Prompts:
         if "cypher_search" not in cls._cached_prompts.keys():
             # create plotmap specific prompt with injected few-shot examples
             csearch_prompt = Prompt(os.path.join(prompts_directory, "cyphersearch_prompt.yml"))
-            csearch_prompt.inject_examples(CypherExampleCollections.general_cypher_queries)
+            csearch_prompt.inject_examples(CypherExampleCollections.general_cypher_queries, per_call=True)
             # create general cypher prompt with included schema metadata
             prompt_cypher_search = Prompt(os.path.join(prompts_directory, "cypher_prompt.yml"))
-            prompt_cypher_search.partial_apply({"meta": get_graph_meta_data()})
+            prompt_cypher_search.partial_apply_defaults({"meta": get_graph_meta_data()})
             # combine general cypher prompt with cypher search prompt
             prompt_cypher_search.append(csearch_prompt)
             cls._cached_prompts["cypher_search"] = prompt_cypher_search
@@ -142,10 +173,10 @@ class Prompts:
         if "geographic_map" not in cls._cached_prompts.keys():
             # create plotmap specific prompt with injected few-shot examples
             map_prompt = Prompt(os.path.join(prompts_directory, "geographicmap_prompt.yml"))
-            map_prompt.inject_examples(CypherExampleCollections.map_cypher_queries)
+            map_prompt.inject_examples(CypherExampleCollections.map_cypher_queries, per_call=True)
             # create general cypher prompt with included schema metadata
             prompt_geographic_map = Prompt(os.path.join(prompts_directory, "cypher_prompt.yml"))
-            prompt_geographic_map.partial_apply({"meta": get_graph_meta_data()})
+            prompt_geographic_map.partial_apply_defaults({"meta": get_graph_meta_data()})
             # combine general cypher prompt with plotmap prompt
             prompt_geographic_map.append(map_prompt)
             cls._cached_prompts["geographic_map"] = prompt_geographic_map
@@ -165,7 +196,7 @@ class Prompts:
             plot_prompt.inject_examples(CypherExampleCollections.plot_cypher_queries)
             # create general cypher prompt with included schema metadata, again???
             prompt_scientific_plot = Prompt(os.path.join(prompts_directory, "cypher_prompt.yml"))
-            prompt_scientific_plot.partial_apply({"meta": get_graph_meta_data()})
+            prompt_scientific_plot.partial_apply_defaults({"meta": get_graph_meta_data()})
             # combine general cypher prompt with plotmap prompt
             prompt_scientific_plot.append(plot_prompt)
             cls._cached_prompts["scientific_plot"] = prompt_scientific_plot
@@ -205,12 +236,19 @@ class CypherExampleCollection:
         """
         return self.example_name
 
-    def format_examples_as_markdown(self) -> str:
+    def format_examples_as_markdown(self, examples: Optional[List[dict]] = None) -> str:
+        """
+        Formats the examples as numbered Markdown code blocks.
+
+        :param examples: A selection of the examples, by default all examples of the collection.
+        """
+        if examples is None:
+            examples = self.examples
         result_lines = []
-        for i in range(len(self.examples)):
-            result_lines.append(f"{i}. {self.examples[i]['information']}")
+        for i in range(len(examples)):
+            result_lines.append(f"{i}. {examples[i]['information']}")
             result_lines.append("```cypher")
-            result_lines.append(self.examples[i]['cypher'])
+            result_lines.append(examples[i]['cypher'])
             # if i < len(self.examples) - 1: # todo: @PS why did you do this? resulted in the omission of backticks for the last example
             result_lines.append("```\n")
         return "\n".join(result_lines)
@@ -274,6 +312,16 @@ class CypherExampleCollections:
         return CypherExampleCollection(os.path.join(prompts_directory, "scientificplot_examples.cypher"))
 
 
+def get_example_questions() -> List[str]:
+    """
+    Reads the example questions offered to the users.
+
+    :return: The example questions.
+    """
+    with open(example_questions_file) as f:
+        return yaml.safe_load(f)["questions"]
+
+
 def get_graph_meta_data() -> str:
     """
     Reads the graph metadata from a specified file.
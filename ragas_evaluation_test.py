@@ -10,6 +10,7 @@ from typing import List
 import langchain_core.messages as m
 from forked_convert_langchain_to_ragas import convert_to_ragas_messages
 from config import config
+from llm_scheduler import Priority, llm_priority
 import json
 ragas = pytest.importorskip("ragas")
 
@@ -25,7 +26,9 @@ async def _invoke_agent_async(question):
         dict: Agent response payload, including messages.
     """
     agent = EcoToxFred()
-    return await asyncio.to_thread(agent.invoke, {"messages": [m.HumanMessage(content=question)]})
+    # Interactive users of the same process go first
+    with llm_priority(Priority.EVALUATION):
+        return await asyncio.to_thread(agent.invoke, {"messages": [m.HumanMessage(content=question)]})
 
 
 async def evaluate(ragas_messages:List[HumanMessage | AIMessage | ToolMessage], config, reference_tool_calls=None, reference_answer=""):
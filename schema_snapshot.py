@@ -0,0 +1,147 @@
+"""
+Persisted snapshots of the Neo4j graph schema.
+
+Introspecting the schema through APOC takes several seconds. Since the schema only changes when
+the graph database is reloaded, we store it on disk, keyed by a fingerprint of the database, and
+load it from there on startup. Reloading the graph requires invalidating the snapshot, and with it the
+cached query results, explicitly:
+
+    python schema_snapshot.py --invalidate
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+from typing import Any, Dict, Optional
+
+from config import config
+from tools.result_cache import invalidate_result_cache
+from utils import get_database_version
+
+logger = logging.getLogger("ETF")
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+default_snapshot_directory = os.path.join(current_directory, ".cache", "schema")
+
+# The fingerprint identifying the state of the database can either be derived from the image tag
+# of the Neo4j container in values.yaml, or from the number of nodes and relationships per label and type.
+FINGERPRINT_IMAGE_TAG = "image_tag"
+FINGERPRINT_COUNTS = "counts"
+
+_counts_query = """
+CALL apoc.meta.stats() YIELD labels, relTypesCount
+RETURN labels, relTypesCount
+"""
+
+
+def get_snapshot_directory() -> str:
+    return config.get("SCHEMA_SNAPSHOT_DIR", default_snapshot_directory)
+
+
+def get_database_fingerprint(graph) -> str:
+    """
+    Computes the fingerprint that identifies the current state of the graph database.
+
+    Args:
+        graph: The Neo4j graph, only queried if the fingerprint is built from counts.
+
+    Returns:
+        str: A short hash usable as part of a file name
+    """
+    method = config.get("SCHEMA_FINGERPRINT", FINGERPRINT_IMAGE_TAG)
+    if method == FINGERPRINT_COUNTS:
+        counts = graph.query(_counts_query)
+        source = json.dumps(counts, sort_keys=True, default=str)
+    elif method == FINGERPRINT_IMAGE_TAG:
+        source = get_database_version()
+    else:
+        raise ValueError(f"Unknown schema fingerprint method '{method}'. "
+                         f"Use '{FINGERPRINT_IMAGE_TAG}' or '{FINGERPRINT_COUNTS}'.")
+    return hashlib.sha256(f"{method}:{source}".encode()).hexdigest()[:16]
+
+
+def _snapshot_file(fingerprint: str) -> str:
+    return os.path.join(get_snapshot_directory(), f"schema_{fingerprint}.json")
+
+
+def read_snapshot(fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    Reads the schema snapshot for the given fingerprint.
+
+    Returns:
+        The snapshot with the keys structured_schema and schema, or None if no valid snapshot exists.
+    """
+    try:
+        with open(_snapshot_file(fingerprint)) as f:
+            snapshot = json.load(f)
+        if snapshot.get("fingerprint") != fingerprint:
+            return None
+        return snapshot
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_snapshot(fingerprint: str, structured_schema: Dict[str, Any], schema: str) -> None:
+    """
+    Writes the schema snapshot atomically so that concurrent processes never read half a file.
+    """
+    directory = get_snapshot_directory()
+    os.makedirs(directory, exist_ok=True)
+    snapshot = {"fingerprint": fingerprint, "structured_schema": structured_schema, "schema": schema}
+    fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f, default=str)
+        os.replace(tmp_file, _snapshot_file(fingerprint))
+    except Exception:
+        os.remove(tmp_file)
+        raise
+
+
+def load_schema(graph) -> None:
+    """
+    Sets the schema of the graph from its snapshot, and introspects the database only if there is none.
+
+    Args:
+        graph: A Neo4jGraph created with refresh_schema=False
+    """
+    fingerprint = get_database_fingerprint(graph)
+    snapshot = read_snapshot(fingerprint)
+    if snapshot is not None:
+        logger.debug(f"Loaded schema snapshot {fingerprint}")
+        graph.structured_schema = snapshot["structured_schema"]
+        graph.schema = snapshot["schema"]
+    else:
+        logger.debug(f"No schema snapshot for {fingerprint}, introspecting the database")
+        graph.refresh_schema()
+        try:
+            write_snapshot(fingerprint, graph.structured_schema, graph.schema)
+        except OSError as e:
+            logger.warning(f"Could not write schema snapshot: {e}")
+    graph.schema_fingerprint = fingerprint
+
+
+def invalidate_snapshots() -> int:
+    """
+    Removes all stored schema snapshots and cached query results. Must be called whenever the graph
+    database is reloaded, since the default fingerprint, the image tag, does not change with the data.
+
+    Returns:
+        int: The number of removed snapshots
+    """
+    files = glob.glob(os.path.join(get_snapshot_directory(), "schema_*.json"))
+    for file in files:
+        os.remove(file)
+    invalidate_result_cache(config)
+    return len(files)
+
+
+if __name__ == "__main__":
+    if "--invalidate" in sys.argv:
+        print(f"Removed {invalidate_snapshots()} schema snapshot(s).")
+    else:
+        print("Usage: python schema_snapshot.py --invalidate")
@@ -0,0 +1,161 @@
+"""
+Single-flight execution of identical questions.
+
+The example questions of the sidebar are often asked by many users at once, each starting a full
+agent run with several LLM calls and graph queries. Requests with the same key, the normalized
+question and the conversation it is asked in, attach to the run that is already in flight instead.
+The events of the run are kept for its duration and fanned out to all subscribers, so a subscriber
+joining late first receives the events it missed. The run is driven by its own task, so a slow
+subscriber does not hold up the others, and it is cancelled once all subscribers have left. Only
+runs in flight are shared, a question asked after a run completed starts a new one.
+"""
+
+import asyncio
+import hashlib
+import threading
+import unicodedata
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AnyMessage, get_buffer_string
+
+_totals = {"runs": 0, "subscribers": 0, "coalesced": 0}
+_totals_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """Normalizes the case, Unicode forms, and whitespace of a question."""
+    return " ".join(unicodedata.normalize("NFKC", question).casefold().split())
+
+
+def flight_key(question: str, context: Sequence[AnyMessage] = ()) -> str:
+    """
+    The key under which identical questions share a run.
+
+    Args:
+        question: The question of the user.
+        context: The messages of the conversation before the question, the answer depends on them.
+
+    Returns:
+        str: The key
+    """
+    digest = hashlib.sha256(normalize_question(question).encode())
+    digest.update(b"\0" + get_buffer_string(list(context)).encode())
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    Runs of event streams shared by all subscribers with the same key, bound to one event loop.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def _run(self, key: str, flight: _Flight, start: Callable[[], AsyncIterator]) -> None:
+        stream = start()
+        try:
+            async for event in stream:
+                async with flight.condition:
+                    flight.events.append(event)
+                    flight.condition.notify_all()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+            # Questions asked from now on start a new run
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    async def subscribe(
+            self,
+            key: str,
+            start: Callable[[], AsyncIterator],
+            follower_done: Optional[Callable[[List[Any]], Awaitable[Any]]] = None,
+    ) -> AsyncIterator:
+        """
+        Yields the events of the run with the key, starting the run if none is in flight.
+
+        Args:
+            key: The key of the run, e.g. from flight_key.
+            start: Creates the event stream of a new run.
+            follower_done: Awaited with all events of the run once it completed successfully, if this
+                subscriber attached to a run started by another one, e.g. to store the answer in its own
+                conversation.
+        """
+        flight = self._flights.get(key)
+        follower = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, start))
+        flight.subscribers += 1
+        with _totals_lock:
+            _totals["runs"] += int(not follower)
+            _totals["subscribers"] += 1
+            _totals["coalesced"] += int(follower)
+
+        index = 0
+        try:
+            while True:
+                async with flight.condition:
+                    await flight.condition.wait_for(lambda: index < len(flight.events) or flight.done)
+                    events, done = flight.events[index:], flight.done
+                for event in events:
+                    yield event
+                index += len(events)
+                if done and index == len(flight.events):
+                    break
+            if flight.error is not None:
+                raise flight.error
+            if follower and follower_done is not None:
+                await follower_done(flight.events)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody waits for the answer anymore
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+
+_single_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SingleFlight]" = weakref.WeakKeyDictionary()
+_single_flights_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Provides the SingleFlight of the running event loop, e.g. the background loop serving all Streamlit sessions.
+    """
+    loop = asyncio.get_running_loop()
+    with _single_flights_lock:
+        if loop not in _single_flights:
+            _single_flights[loop] = SingleFlight()
+        return _single_flights[loop]
+
+
+def get_single_flight_metrics() -> Dict[str, Any]:
+    """Returns the number of runs and of subscribers that attached to a run in flight."""
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["runs_saved_ratio"] = totals["coalesced"] / totals["subscribers"] if totals["subscribers"] else 0.0
+    return totals
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langgraph.types import Command
+
+from answer_replay import AnswerStore, answers_fingerprint, reduce_events, restore_events, warm_up
+from single_flight import flight_key
+
+FIGURE = {"data": [{"type": "scattermap", "lat": [48.2], "lon": [16.4]}], "layout": {}}
+
+
+def stream_event(text, node="model"):
+    return {"event": "on_chat_model_stream", "name": "ChatOpenAI", "run_id": "m",
+            "metadata": {"langgraph_node": node}, "data": {"chunk": AIMessageChunk(content=text)}}
+
+
+def agent_events(question):
+    answer = AIMessage(content="Diuron is a herbicide.")
+    return [
+        {"event": "on_chain_start", "name": "LangGraph", "run_id": "root", "parent_ids": [], "data": {}},
+        {"event": "on_tool_start", "name": "write_todos", "run_id": "t0", "data": {"input": {"todos": []}}},
+        {"event": "on_tool_end", "name": "write_todos", "run_id": "t0",
+         "data": {"output": Command(update={"todos": [{"content": "Map", "status": "completed"}],
+                                            "messages": [ToolMessage(content="ok", tool_call_id="c0")]})}},
+        {"event": "on_tool_start", "name": "GeographicMap", "run_id": "t1", "data": {"input": {"query": question}}},
+        {"event": "on_tool_end", "name": "GeographicMap", "run_id": "t1",
+         "data": {"output": ToolMessage(content="A map", artifact=FIGURE, tool_call_id="c1")}},
+        stream_event("Diuron "),
+        stream_event("summary", node="history_summary"),
+        stream_event("is a herbicide."),
+        {"event": "on_chain_end", "name": "LangGraph", "run_id": "root", "parent_ids": [],
+         "data": {"output": {"messages": [AIMessage(content="Hi"), HumanMessage(content=question), answer]}}},
+    ]
+
+
+class FakeAgent:
+    def __init__(self):
+        self.questions = []
+
+    async def astream_events(self, messages, replay_answers=True):
+        question = messages["messages"][-1].content
+        self.questions.append(question)
+        if question == "fail":
+            raise RuntimeError("OpenAI API unavailable")
+        for event in agent_events(question):
+            yield event
+
+
+def test_reduced_events_are_json_and_merge_the_answer_tokens():
+    reduced = json.loads(json.dumps(reduce_events(agent_events("What is Diuron?"))))
+    streams = [e for e in reduced if e["event"] == "on_chat_model_stream"]
+    assert [e["data"]["chunk"] for e in streams] == ["Diuron is a herbicide."]
+    assert reduced[-1]["data"]["output"]["messages"][0]["data"]["content"] == "What is Diuron?"
+
+
+def test_restored_events_keep_tool_outputs_and_artifacts():
+    events = restore_events(json.loads(json.dumps(reduce_events(agent_events("What is Diuron?")))))
+    outputs = {e["name"]: e["data"]["output"] for e in events if e["event"] == "on_tool_end"}
+    assert outputs["write_todos"] == {"update": {"todos": [{"content": "Map", "status": "completed"}]}}
+    assert isinstance(outputs["GeographicMap"], ToolMessage) and outputs["GeographicMap"].artifact == FIGURE
+    chunk = next(e for e in events if e["event"] == "on_chat_model_stream")["data"]["chunk"]
+    assert chunk.content == "Diuron is a herbicide."
+    assert [type(m) for m in events[-1]["data"]["output"]["messages"]] == [HumanMessage, AIMessage]
+
+
+def test_stored_answers_are_loaded_by_other_processes(tmp_path):
+    AnswerStore(str(tmp_path), "abc").put("key", "What is Diuron?", agent_events("What is Diuron?"))
+    store = AnswerStore(str(tmp_path), "abc")
+    assert len(store) == 1 and store.get("key")[-1]["event"] == "on_chain_end"
+    assert store.get("other") is None
+
+
+def test_a_new_fingerprint_replaces_the_stored_answers(tmp_path):
+    AnswerStore(str(tmp_path), "old").put("key", "What is Diuron?", agent_events("What is Diuron?"))
+    store = AnswerStore(str(tmp_path), "new")
+    assert store.get("key") is None
+    store.put("key", "What is Diuron?", agent_events("What is Diuron?"))
+    # Processes of another version may still use the old answers, only the warm-up command removes them
+    assert sorted(os.listdir(tmp_path)) == ["answers_new.json", "answers_old.json"]
+    assert store.remove_stale_files() == 1
+    assert os.listdir(tmp_path) == ["answers_new.json"]
+
+
+def test_the_fingerprint_depends_on_the_prompts_and_the_model(tmp_path):
+    (tmp_path / "agent.yml").write_text("prompt: v1")
+    before = answers_fingerprint(str(tmp_path), "gpt-4o")
+    (tmp_path / "example_questions.yml").write_text("questions: []")
+    assert answers_fingerprint(str(tmp_path), "gpt-4o") == before
+    assert answers_fingerprint(str(tmp_path), "gpt-4.1") != before
+    (tmp_path / "agent.yml").write_text("prompt: v2")
+    assert answers_fingerprint(str(tmp_path), "gpt-4o") != before
+
+
+def test_warm_up_stores_the_missing_answers_and_skips_failures(tmp_path):
+    store, agent = AnswerStore(str(tmp_path), "abc"), FakeAgent()
+    assert asyncio.run(warm_up(agent, ["What is Diuron?", "fail"], store)) == 1
+    assert store.get(flight_key("what is diuron?")) is not None
+    assert asyncio.run(warm_up(agent, ["What is Diuron?"], store)) == 0
+    assert asyncio.run(warm_up(agent, ["What is Diuron?"], store, refresh=True)) == 1
+    assert agent.questions == ["What is Diuron?", "fail", "What is Diuron?"]
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import plotly.graph_objects as go
+from aiohttp.test_utils import TestClient, TestServer
+from langchain_core.messages import AIMessageChunk, ToolMessage
+
+from api import create_app, sse_event
+from figure_artifacts import encode_figure
+
+ARTIFACT = encode_figure(go.Figure(go.Scattergeo(lat=[float(i) for i in range(10)]), layout={"template": "plotly"}))
+
+
+class FakeAgent:
+    def __init__(self, release: asyncio.Event = None):
+        self.release = release
+        self.calls = []
+
+    async def astream_events(self, messages):
+        self.calls.append(messages["messages"])
+        if self.release is not None:
+            await self.release.wait()
+        yield {"event": "on_chat_model_stream", "metadata": {"langgraph_node": "model"},
+               "data": {"chunk": AIMessageChunk(content="Diuron is ")}}
+        yield {"event": "on_tool_start", "name": "GeographicMap", "run_id": "1", "data": {"input": {"query": "q"}}}
+        yield {"event": "on_tool_end", "name": "GeographicMap", "run_id": "1",
+               "data": {"output": ToolMessage(content="map", tool_call_id="c", artifact=ARTIFACT)}}
+        yield {"event": "on_chat_model_stream", "metadata": {"langgraph_node": "model"},
+               "data": {"chunk": AIMessageChunk(content="a herbicide.")}}
+
+
+def parse_events(text: str):
+    events = []
+    for block in text.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def run_with_client(app, test):
+    async def main():
+        async with TestClient(TestServer(app)) as client:
+            return await test(client)
+
+    return asyncio.run(main())
+
+
+def test_sse_event_encoding():
+    assert sse_event("token", {"text": "a\nb"}) == b'event: token\ndata: {"text": "a\\nb"}\n\n'
+
+
+def test_turn_is_streamed_and_kept_in_the_session():
+    agent = FakeAgent()
+
+    async def test(client):
+        response = await client.post("/chat", json={"message": "What is Diuron?"})
+        assert response.headers["Content-Type"] == "text/event-stream"
+        events = parse_events(await response.text())
+        session_id = events[0][1]["session_id"]
+        await client.post("/chat", json={"message": "Where?", "session_id": session_id})
+        return events
+
+    events = run_with_client(create_app(agent), test)
+    assert [name for name, _ in events] == ["session", "token", "tool_start", "tool_end", "artifact", "token", "done"]
+    figure = events[4][1]["figure"]
+    assert events[4][1]["hash"] == ARTIFACT["hash"]
+    assert figure["data"][0]["lat"] == [float(i) for i in range(10)]
+    assert isinstance(figure["layout"]["template"], dict)
+    second_turn = agent.calls[1]
+    assert [m.content for m in second_turn[1:]] == ["What is Diuron?", "Diuron is a herbicide.", "Where?"]
+    assert second_turn[2].artifact == ARTIFACT
+
+
+def test_turns_beyond_the_queue_are_rejected():
+    async def test(client):
+        agent.release = asyncio.Event()
+        first = asyncio.create_task(client.post("/chat", json={"message": "first"}))
+        while not agent.calls:
+            await asyncio.sleep(0.01)
+        rejected = await client.post("/chat", json={"message": "second"})
+        health = await (await client.get("/health")).json()
+        agent.release.set()
+        await (await first).text()
+        return rejected, health
+
+    agent = FakeAgent()
+    rejected, health = run_with_client(create_app(agent, max_concurrent_turns=1, max_queued_turns=0), test)
+    assert rejected.status == 503
+    assert health["running"] == 1 and health["rejected"] == 1
+    assert {"cypher_caches", "cypher_templates", "schema_slicers", "llm_scheduler", "single_flight"} <= set(health)
+
+
+def test_invalid_requests():
+    async def test(client):
+        return (await client.post("/chat", json={"session_id": "x"})).status, \
+            (await client.delete("/sessions/unknown")).status
+
+    assert run_with_client(create_app(FakeAgent()), test) == (400, 404)
@@ -0,0 +1,62 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import START, MessagesState, StateGraph
+
+from checkpointing import SqliteCheckpointSaver, conversation_messages
+
+
+def create_graph(checkpointer):
+    def answer(state: MessagesState):
+        return {"messages": [AIMessage(content=f"Answer {len(state['messages'])}")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("answer", answer)
+    builder.add_edge(START, "answer")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def contents(state):
+    return [m.content for m in state.values["messages"]]
+
+
+def test_conversations_are_resumed_from_the_database(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    config = {"configurable": {"thread_id": "t1"}}
+    graph = create_graph(SqliteCheckpointSaver(path))
+    graph.invoke({"messages": [HumanMessage(content="first")]}, config)
+    graph.invoke({"messages": [HumanMessage(content="second")]}, config)
+
+    # Another worker, or the same one after a restart
+    saver = SqliteCheckpointSaver(path)
+    resumed = create_graph(saver)
+    assert contents(resumed.get_state(config)) == ["first", "Answer 1", "second", "Answer 3"]
+    asyncio.run(resumed.ainvoke({"messages": [HumanMessage(content="third")]}, config))
+    assert contents(resumed.get_state(config))[-1] == "Answer 5"
+    assert len(list(saver.list(config, limit=2))) == 2
+
+    saver.delete_thread("t1")
+    assert resumed.get_state(config).values == {}
+
+
+def test_threads_are_separate(tmp_path):
+    graph = create_graph(SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite")))
+    graph.invoke({"messages": [HumanMessage(content="a")]}, {"configurable": {"thread_id": "a"}})
+    graph.invoke({"messages": [HumanMessage(content="b")]}, {"configurable": {"thread_id": "b"}})
+    assert contents(graph.get_state({"configurable": {"thread_id": "b"}})) == ["b", "Answer 1"]
+
+
+def test_conversation_messages_keep_answers_and_their_figures():
+    messages = [
+        HumanMessage(content="Where was Diuron measured?"),
+        AIMessage(content="", tool_calls=[{"name": "GeographicMap", "args": {}, "id": "c1"}]),
+        ToolMessage(content="map", tool_call_id="c1", artifact={"hash": "h"}),
+        AIMessage(content="Here is the map."),
+        HumanMessage(content="Thanks"),
+        AIMessage(content="You are welcome."),
+    ]
+    shown = conversation_messages(messages)
+    assert [m.content for m in shown] == ["Where was Diuron measured?", "Here is the map.", "Thanks",
+                                          "You are welcome."]
+    assert shown[1].artifact == {"hash": "h"}
+    assert "artifact" not in shown[3].model_extra
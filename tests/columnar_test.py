@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from tools.columnar import ColumnarResult
+
+RECORDS = [
+    {"SiteName": "a", "Lat": 50.1, "Year": 2010, "Concentration": 1.5},
+    {"SiteName": "b", "Lat": 51.2, "Year": 2011, "Concentration": None},
+    {"SiteName": "b", "Lat": 51.2, "Year": 2012},
+]
+
+
+def test_columns_are_typed_like_pandas():
+    columns = ColumnarResult.from_records(RECORDS)
+    assert columns["Year"].dtype == np.int64
+    assert columns["Concentration"].dtype == np.float64
+    assert columns["SiteName"].dtype == object
+    assert list(columns.to_frame().dtypes) == list(pd.DataFrame(RECORDS).dtypes)
+
+
+def test_rows_from_the_driver_match_records():
+    rows = [tuple(r.get(k) for k in RECORDS[0]) for r in RECORDS]
+    columns = ColumnarResult.from_rows(list(RECORDS[0]), iter(rows), limit=2)
+    assert len(columns) == 2
+    assert columns == ColumnarResult.from_records(RECORDS[:2])
+
+
+def test_summary_matches_pandas():
+    columns = ColumnarResult.from_records(RECORDS)
+    expected = pd.DataFrame(RECORDS).describe(include="all").to_json(default_handler=str)
+    assert columns.describe_json() == expected
+
+
+def test_summary_is_accumulated_while_the_rows_arrive():
+    rows = [tuple(r.get(k) for k in RECORDS[0]) for r in RECORDS]
+    columns = ColumnarResult.from_rows(list(RECORDS[0]), iter(rows))
+    assert columns.summary is not None
+    expected = pd.DataFrame(RECORDS).describe(include="all").to_json(default_handler=str)
+    assert columns.describe_json() == expected
+    assert columns.with_lower_case_keys().describe_json() == expected.replace("SiteName", "sitename") \
+        .replace("Lat", "lat").replace("Year", "year").replace("Concentration", "concentration")
+
+
+def test_lower_case_keys_share_the_columns():
+    columns = ColumnarResult.from_records(RECORDS)
+    lower = columns.with_lower_case_keys()
+    assert lower.keys() == ["sitename", "lat", "year", "concentration"]
+    assert lower["lat"] is columns["Lat"]
@@ -0,0 +1,69 @@
+from typing import List
+
+from tools.cypher_cache import SemanticCypherCache
+from tools.cypher_templates import SlotExtractor
+
+
+class FakeEmbeddings:
+    """Embeds a text as its bag of lower-case words over a small vocabulary."""
+
+    vocabulary = ["diuron", "atrazine", "sites", "measured", "where", "show", "map"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        words = text.lower().replace("?", "").split()
+        return [float(words.count(w)) for w in self.vocabulary]
+
+
+def test_rephrased_question_is_a_hit():
+    cache = SemanticCypherCache(FakeEmbeddings(), "cypher_search", "hash", similarity_threshold=0.9)
+    cypher, embedding = cache.lookup("Where was Diuron measured?")
+    assert cypher is None
+    cache.store("Where was Diuron measured?", "MATCH (s:Substance) RETURN s", embedding)
+    cypher, _ = cache.lookup("Diuron measured where")
+    assert cypher == "MATCH (s:Substance) RETURN s"
+    cypher, _ = cache.lookup("Where was Atrazine measured?")
+    assert cypher is None
+    assert cache.metrics()["hits"] == 1
+    assert cache.metrics()["misses"] == 2
+
+
+def test_identical_question_skips_embedding():
+    embeddings = FakeEmbeddings()
+    cache = SemanticCypherCache(embeddings, "cypher_search", "hash")
+    cache.store("Where was Diuron measured?", "MATCH (n) RETURN n")
+    calls = embeddings.calls
+    cypher, _ = cache.lookup("  where was DIURON measured? ")
+    assert cypher == "MATCH (n) RETURN n"
+    assert embeddings.calls == calls
+
+
+def test_lru_and_ttl_eviction():
+    cache = SemanticCypherCache(FakeEmbeddings(), "geographic_map", "hash", max_entries=2)
+    cache.store("show diuron", "A")
+    cache.store("show atrazine", "B")
+    cache.lookup("show diuron")
+    cache.store("map sites", "C")
+    assert cache.lookup("show diuron")[0] == "A"
+    assert cache.lookup("show atrazine")[0] is None
+    cache.time_to_live = -1
+    assert cache.lookup("show diuron")[0] is None
+    assert cache.metrics()["size"] == 0
+
+
+def test_questions_differing_only_in_the_substance_do_not_share_cypher():
+    class NameBlindEmbeddings(FakeEmbeddings):
+        # Like real embeddings, the substance names hardly change the vector
+        vocabulary = ["sites", "measured", "where", "show", "map"]
+
+    extractor = SlotExtractor({"substance": ["Diuron", "Atrazine"]})
+    cache = SemanticCypherCache(NameBlindEmbeddings(), "cypher_search", "hash", similarity_threshold=0.95,
+                                entity_extractor=extractor.entities)
+    cache.store("Where was Diuron measured?", "MATCH (s:Substance {Name: 'Diuron'}) RETURN s")
+    cypher, _ = cache.lookup("Where was Atrazine measured?")
+    assert cypher is None
+    cypher, _ = cache.lookup("Diuron measured where")
+    assert cypher == "MATCH (s:Substance {Name: 'Diuron'}) RETURN s"
@@ -0,0 +1,267 @@
+import asyncio
+from typing import Any, Dict, List
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import get_buffer_string
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_neo4j.graphs.graph_store import GraphStore
+from neo4j.exceptions import CypherSyntaxError
+
+from tools.cypher_validator import CypherValidator
+from tools.forked_cypherQA_chain import GraphCypherQAChain, configure_chain, limit_cypher
+
+
+class FakeGraph(GraphStore):
+    """In-memory stand-in for the Neo4j graph that records all queries it receives."""
+
+    _enhanced_schema = False
+    get_schema = ""
+    get_structured_schema = {
+        "node_props": {"Site": [{"property": "name", "type": "STRING"}]},
+        "rel_props": {},
+        "relationships": [],
+    }
+
+    def __init__(self, number_of_rows: int = 20):
+        self.number_of_rows = number_of_rows
+        self.queries: List[str] = []
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        self.queries.append(query)
+        if "INVALID" in query:
+            raise CypherSyntaxError("Invalid input")
+        return [{"name": f"site {i}"} for i in range(self.number_of_rows)]
+
+    async def aquery(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        return self.query(query, params)
+
+    def refresh_schema(self) -> None:
+        pass
+
+    def add_graph_documents(self, graph_documents, include_source: bool = False) -> None:
+        pass
+
+
+class RecordingChatModel(FakeListChatModel):
+    """Fake chat model that records the prompts it receives."""
+
+    prompts: List[str] = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        self.prompts.append(get_buffer_string(messages))
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+
+def create_chain(graph: GraphStore, responses: List[str], top_k: int = 5) -> GraphCypherQAChain:
+    chain = GraphCypherQAChain.from_llm(
+        RecordingChatModel(responses=responses),
+        graph=graph,
+        cypher_prompt=PromptTemplate.from_template("{schema}\n{question}"),
+        return_intermediate_steps=True,
+        allow_dangerous_requests=True,
+    )
+    chain.return_direct = True
+    chain.top_k = top_k
+    return chain
+
+
+def test_chain_corrects_invalid_cypher():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) INVALID", "```cypher\nMATCH (l:Site) RETURN l.name AS name\n```"])
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert result["intermediate_steps"][-1]["query"].strip() == "MATCH (l:Site) RETURN l.name AS name"
+    assert len(result["result"]) == 5
+
+
+def test_async_chain_matches_sync_chain():
+    sync_graph, async_graph = FakeGraph(), FakeGraph()
+    responses = ["MATCH (l:Site) INVALID", "MATCH (l:Site) RETURN l.name AS name"]
+    sync_result = create_chain(sync_graph, responses).invoke({"query": "Which sites exist?"})
+    async_result = asyncio.run(create_chain(async_graph, responses).ainvoke({"query": "Which sites exist?"}))
+    assert sync_result == async_result
+    assert sync_graph.queries == async_graph.queries
+
+
+def test_offline_validation_skips_explain():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) RETURN l.name AS name"])
+    chain.cypher_validator = CypherValidator(graph.get_structured_schema)
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+    assert graph.queries == ["MATCH (l:Site) RETURN l.name AS name LIMIT 5"]
+
+
+def test_offline_errors_feed_the_correction_prompt_without_explain():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Sites) RETURN l.name AS name", "MATCH (l:Site) RETURN l.name AS name"])
+    chain.cypher_validator = CypherValidator(graph.get_structured_schema)
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+    # Like EXPLAIN, which only notifies about unknown labels, the graph would have accepted the first draft
+    assert "Node label 'Sites' does not exist" in chain.cypher_llm.prompts[-1]
+    assert graph.queries == ["MATCH (l:Site) RETURN l.name AS name LIMIT 5"]
+
+
+def test_properties_missing_from_the_schema_are_confirmed_by_the_database():
+    class DriftedGraph(FakeGraph):
+        def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+            if query == "CALL db.propertyKeys()":
+                self.queries.append(query)
+                return [{"propertyKey": "name"}, {"propertyKey": "region"}]
+            return super().query(query, params)
+
+    config = {"CYPHER_EXAMPLE_RETRIEVAL_ENABLED": False, "SCHEMA_SLICING_ENABLED": False,
+              "CYPHER_TEMPLATES_ENABLED": False, "CYPHER_CACHE_ENABLED": False, "RESULT_CACHE_ENABLED": False}
+    graph = DriftedGraph()
+    chain = configure_chain(create_chain(graph, ["MATCH (l:Site) RETURN l.region AS region",
+                                                 "MATCH (l:Site) RETURN l.regio AS region",
+                                                 "MATCH (l:Site) RETURN l.name AS name"]),
+                            config, "cypher_search", None, "prompt", None)
+    result = chain.invoke({"query": "Which regions exist?"})
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.region AS region"
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+    assert "Property 'regio' does not exist on 'Site'" in chain.cypher_llm.prompts[-1]
+    assert graph.queries.count("CALL db.propertyKeys()") == 1
+
+
+def test_database_errors_only_use_the_corrections_left():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) INVALID"] * 3 + ["MATCH (l:Site) RETURN l.name AS name INVALID",
+                                                                 "MATCH (l:Site) RETURN l.name AS name"])
+    chain.cypher_validator = CypherValidator(graph.get_structured_schema)
+    result = chain.invoke({"query": "Which sites exist?"})
+    # The generation spent all corrections, the database error of the last one costs no further call
+    assert result["intermediate_steps"][-1]["query"] == ""
+    assert chain.cypher_llm.i == 4
+
+
+def test_database_errors_are_corrected_after_offline_validation():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) RETURN l.name AS name INVALID", "MATCH (l:Site) RETURN l.name"])
+    chain.cypher_validator = CypherValidator(graph.get_structured_schema)
+    result = asyncio.run(chain.ainvoke({"query": "Which sites exist?"}))
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name"
+    assert len(result["result"]) == 5
+
+
+def test_template_match_skips_generation():
+    class FixedMatcher:
+        def match(self, question):
+            return "MATCH (l:Site) RETURN l.name AS name", 1.0, None
+
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) INVALID"])
+    chain.template_matcher = FixedMatcher()
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+    assert graph.queries == ["MATCH (l:Site) RETURN l.name AS name LIMIT 5"]
+
+
+def test_speculative_candidates_use_first_valid_and_cancel_the_rest():
+    calls, cancelled = [], []
+
+    async def invalid_draft(_, **kwargs):
+        return "MATCH (l:Sites) RETURN l.name AS name"
+
+    async def speculative_draft(_, **kwargs):
+        calls.append(True)
+        if len(calls) == 1:
+            await asyncio.sleep(0.01)
+            return "MATCH (l:Site) RETURN l.name AS name"
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) INVALID"])
+    chain.cypher_generation_chain = RunnableLambda(invalid_draft)
+    chain.speculative_generation_chain = RunnableLambda(speculative_draft)
+    chain.speculative_candidates = 3
+    chain.cypher_validator = CypherValidator(graph.get_structured_schema)
+    result = asyncio.run(chain.ainvoke({"query": "Which sites exist?"}))
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+    assert graph.queries == ["MATCH (l:Site) RETURN l.name AS name LIMIT 5"]
+    assert cancelled == [True]
+
+
+def test_sync_chain_generates_a_single_candidate():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) RETURN l.name AS name"])
+    chain.speculative_generation_chain = RunnableLambda(lambda _: "MATCH (l:Site) INVALID")
+    chain.speculative_candidates = 3
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+    assert not any("INVALID" in query for query in graph.queries)
+
+
+def test_examples_passed_as_none_keep_the_example_retrieval():
+    class FixedIndex:
+        def select(self, question, embedding):
+            return ["retrieved"]
+
+        def format(self, examples):
+            return "0. " + examples[0]
+
+    chain = create_chain(FakeGraph(), ["MATCH (l:Site) RETURN l.name AS name"])
+    chain.example_index = FixedIndex()
+    args = chain._select_examples(chain._prepare_args({"query": "Which sites exist?", "examples": None}), None)
+    assert args["examples"] == "0. retrieved"
+
+
+def test_limit_is_pushed_into_the_query():
+    assert limit_cypher("MATCH (l:Site) RETURN l.name // all sites", 10) == "MATCH (l:Site) RETURN l.name LIMIT 10"
+    assert limit_cypher("MATCH (l:Site) RETURN l LIMIT 20000", 10) == "MATCH (l:Site) RETURN l LIMIT 10"
+    assert limit_cypher("MATCH (l:Site) RETURN l LIMIT 3", 10) == "MATCH (l:Site) RETURN l LIMIT 3"
+    assert limit_cypher("MATCH (l:Site) WITH l LIMIT 3 CALL { RETURN 1 AS x } RETURN l, x", 10) == \
+           "MATCH (l:Site) WITH l LIMIT 3 CALL { RETURN 1 AS x } RETURN l, x LIMIT 10"
+    assert limit_cypher("MATCH (a) RETURN a UNION MATCH (b) RETURN b AS a", 10) == \
+           "CALL { MATCH (a) RETURN a UNION MATCH (b) RETURN b AS a } RETURN * LIMIT 10"
+
+
+def test_columnar_results():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) RETURN l.name AS name"])
+    chain.columnar = True
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert len(result["result"]) == 5
+    assert result["result"]["name"].tolist() == [f"site {i}" for i in range(5)]
+
+
+def test_query_rewriter_changes_the_executed_query_only():
+    graph = FakeGraph()
+    chain = create_chain(graph, ["MATCH (l:Site) RETURN l.name AS name"])
+    chain.query_rewriter = lambda cypher: cypher.replace("RETURN", "RETURN DISTINCT")
+    result = chain.invoke({"query": "Which sites exist?"})
+    assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+    assert graph.queries[-1] == "MATCH (l:Site) RETURN DISTINCT l.name AS name LIMIT 5"
+
+
+def test_failing_rewrites_run_the_statement_as_generated():
+    class DistinctFails(FakeGraph):
+        def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+            if "DISTINCT" in query and not query.startswith("EXPLAIN"):
+                query += " INVALID"
+            return super().query(query, params)
+
+    invalid, failing = lambda cypher: cypher + " INVALID", lambda cypher: cypher.replace("RETURN", "RETURN DISTINCT")
+    for graph, rewriter in [(FakeGraph(), invalid), (DistinctFails(), failing)]:
+        chain = create_chain(graph, ["MATCH (l:Site) RETURN l.name AS name"])
+        chain.query_rewriter = rewriter
+        result = asyncio.run(chain.ainvoke({"query": "Which sites exist?"}))
+        assert result["intermediate_steps"][-1]["query"] == "MATCH (l:Site) RETURN l.name AS name"
+        assert len(result["result"]) == 5
+        assert graph.queries[-1] == "MATCH (l:Site) RETURN l.name AS name LIMIT 5"
+
+
+def test_configure_chain_attaches_the_enabled_stages_of_a_tool():
+    config = {"CYPHER_EXAMPLE_RETRIEVAL_ENABLED": False, "SCHEMA_SLICING_ENABLED": False,
+              "CYPHER_TEMPLATES_ENABLED": False, "CYPHER_CACHE_ENABLED": False, "RESULT_CACHE_ENABLED": False,
+              "CYPHER_VALIDATE_OFFLINE": True, "GEOGRAPHIC_MAP_CANDIDATES": 3}
+    chain = configure_chain(create_chain(FakeGraph(), []), config, "geographic_map", None, "prompt", None)
+    assert isinstance(chain.cypher_validator, CypherValidator)
+    assert chain.speculative_candidates == 3
+    assert chain.example_index is None and chain.cypher_cache is None and chain.result_cache is None
@@ -0,0 +1,55 @@
+from prompts import CypherExampleCollections
+from tools.cypher_templates import CypherTemplate, TemplateMatcher
+
+vocabulary = {
+    "substance": ["Diuron", "Atrazine", "Carbamazepine", "2,4-D"],
+    "country": ["France", "Germany"],
+    "waterbody": ["Rhine", "Elbe"],
+    "riverbasin": ["Danube"],
+}
+
+
+def test_thresholds_are_not_turned_into_templates():
+    example = {
+        "information": "Find sites where Diuron exceeds a threshold",
+        "cypher": "MATCH (s:Substance)-[r:MEASURED_AT]->(l:Site) "
+                  "WHERE s.Name = 'Diuron' AND r.median_concentration > 0.001 RETURN l.name",
+    }
+    assert CypherTemplate.compile(example) is None
+
+
+def test_template_fills_slots():
+    example = {
+        "information": "Show the distribution of the maxtu for algae since 2010.",
+        "cypher": "MATCH (l:Site)-[r:SUMMARIZED_IMPACT_ON]->(s:Species)\n"
+                  "  WHERE s.name = 'algae' AND r.year >= 2010\nRETURN r.maxTU",
+    }
+    template = CypherTemplate.compile(example)
+    assert template.slot_names == {"species", "year_from"}
+    assert template.fill({"species": "fish", "year_from": "2015"}) == \
+           "MATCH (l:Site)-[r:SUMMARIZED_IMPACT_ON]->(s:Species) WHERE s.name = 'fish' AND r.year >= 2015 RETURN r.maxTU"
+
+
+def test_matcher_uses_confident_matches_only():
+    matcher = TemplateMatcher(CypherExampleCollections.general_cypher_queries, vocabulary)
+    cypher, confidence, _ = matcher.match("Find all substances measured in Germany")
+    assert "l.country = 'Germany'" in cypher
+    assert confidence >= matcher.confidence_threshold
+    assert matcher.match("Find sites where Diuron exceeds 0.1 ug/l") is None
+    assert matcher.match("Which substance is most toxic to algae in the Elbe?") is None
+    assert matcher.metrics()["hit_rate"] == 1 / 3
+
+
+def test_matcher_finds_multi_word_names_and_species_synonyms():
+    matcher = TemplateMatcher(CypherExampleCollections.map_cypher_queries, vocabulary)
+    values, _ = matcher.extract_slots("Show the maxTU of Daphnia for 2,4-D since 2012")
+    assert values == {"substance": "2,4-D", "species": "crustacean", "year_from": "2012"}
+
+
+def test_matcher_rejects_negations_and_words_the_template_lacks():
+    matcher = TemplateMatcher(CypherExampleCollections.general_cypher_queries, vocabulary)
+    assert matcher.match("Find all substances measured in Germany, ordered by concentration") is None
+    map_matcher = TemplateMatcher(CypherExampleCollections.map_cypher_queries, vocabulary)
+    assert map_matcher.match("Show sites where Diuron was not measured") is None
+    assert map_matcher.match("Show sites where Diuron wasn't measured") is None
+    assert map_matcher.match("Show sites where Diuron has been measured on the European map") is not None
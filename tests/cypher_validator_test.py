@@ -0,0 +1,62 @@
+import pytest
+
+from prompts import CypherExampleCollections
+from tools.cypher_validator import CypherValidator
+
+
+def properties(*names):
+    return [{"property": name, "type": "STRING"} for name in names]
+
+
+structured_schema = {
+    "node_props": {
+        "Substance": properties("Name", "DTXSID", "casrn", "use_groups", "IN_REACH"),
+        "Site": properties("name", "lat", "lon", "country", "water_body", "river_basin"),
+        "Species": properties("name", "classification"),
+    },
+    "rel_props": {
+        "MEASURED_AT": properties("year", "quarter", "time_point", "median_concentration", "concentration_unit",
+                                  "TU_algae"),
+        "SUMMARIZED_IMPACT_ON": properties("year", "quarter", "species", "sumTU", "ratioTU", "maxTU"),
+    },
+    "relationships": [
+        {"start": "Substance", "type": "MEASURED_AT", "end": "Site"},
+        {"start": "Site", "type": "SUMMARIZED_IMPACT_ON", "end": "Species"},
+    ],
+}
+
+
+@pytest.fixture
+def validator():
+    return CypherValidator(structured_schema)
+
+
+def test_valid_map_example(validator):
+    example = CypherExampleCollections.map_cypher_queries.examples[1]
+    assert validator.validate(example["cypher"]) == []
+
+
+def test_syntax_errors(validator):
+    assert "Unclosed bracket '('." in validator.validate("MATCH (s:Substance RETURN s")
+    assert validator.validate("MATCH (s:Substance) WHERE s.Name = 'Diuron)' RETURN s") == []
+    assert any("no RETURN" in e for e in validator.validate("MATCH (s:Substance)"))
+    assert any("only read data" in e for e in validator.validate("MATCH (s:Substance) DETACH DELETE s RETURN 1"))
+
+
+def test_unknown_labels_types_and_properties(validator):
+    errors = validator.validate("MATCH (l:Site)-[r:SUMMARIZED_IMPACT_ON]->(s:species) RETURN s.name")
+    assert any("label 'species'" in e for e in errors)
+    errors = validator.validate("MATCH (s:Substance)-[r:MEASURED_IN]->(l:Site) RETURN s.Name")
+    assert any("type 'MEASURED_IN'" in e for e in errors)
+    errors = validator.validate("MATCH (s:Substance)-[r:MEASURED_AT]->(l:Site) RETURN s.name, r.sumTU")
+    assert any("'name' does not exist on 'Substance'" in e for e in errors)
+    assert any("'sumTU' does not exist on 'MEASURED_AT'" in e for e in errors)
+
+
+def test_relationship_direction(validator):
+    errors = validator.validate("MATCH (l:Site)-[r:MEASURED_AT]->(s:Substance) RETURN l.name")
+    assert any("wrong direction" in e for e in errors)
+    assert validator.validate("MATCH (l:Site)<-[r:MEASURED_AT]-(s:Substance) RETURN l.name") == []
+    assert validator.validate("MATCH (l:Site)-[:MEASURED_AT]-(s:Substance) RETURN l.name") == []
+    errors = validator.validate("MATCH (s:Substance) MATCH (s)-[:SUMMARIZED_IMPACT_ON]->(x:Species) RETURN x.name")
+    assert any("does not connect" in e for e in errors)
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+import pytest
+
+from event_loop import BackgroundEventLoop, on_loop_shutdown, on_running_loop_shutdown
+
+
+def test_coroutines_of_several_turns_share_the_loop():
+    event_loop = BackgroundEventLoop()
+    try:
+        async def current_loop():
+            return asyncio.get_running_loop(), threading.current_thread()
+
+        first, second = event_loop.run(current_loop()), event_loop.run(current_loop())
+        assert first == second
+        assert first[1] is not threading.current_thread()
+    finally:
+        event_loop.shutdown()
+
+
+def test_stopping_the_iteration_cancels_the_stream():
+    event_loop = BackgroundEventLoop()
+    closed = threading.Event()
+
+    async def stream():
+        try:
+            for i in range(1000):
+                yield i
+                await asyncio.sleep(0.001)
+        finally:
+            closed.set()
+
+    try:
+        items = []
+        for item in event_loop.iterate(stream()):
+            items.append(item)
+            if len(items) == 3:
+                break
+        assert items == [0, 1, 2]
+        assert closed.wait(1)
+    finally:
+        event_loop.shutdown()
+
+
+def test_errors_are_raised_in_the_caller():
+    event_loop = BackgroundEventLoop()
+
+    async def failing():
+        yield 1
+        raise ValueError("failed")
+
+    try:
+        items = []
+        with pytest.raises(ValueError, match="failed"):
+            for item in event_loop.iterate(failing()):
+                items.append(item)
+        assert items == [1]
+    finally:
+        event_loop.shutdown()
+
+
+def test_shutdown_awaits_hooks_and_stops_the_thread():
+    event_loop = BackgroundEventLoop()
+    called = []
+
+    async def hook():
+        called.append(asyncio.get_running_loop())
+
+    on_loop_shutdown(hook)
+    event_loop.shutdown()
+    assert called == [event_loop.loop]
+    assert event_loop.closed and event_loop.loop.is_closed()
+
+
+def test_running_loop_hooks_run_when_any_loop_shuts_down():
+    closed = []
+
+    async def close():
+        closed.append(asyncio.get_running_loop())
+
+    async def register():
+        guard = await on_running_loop_shutdown(close)
+        return asyncio.get_running_loop(), guard
+
+    loop, guard = asyncio.run(register())
+    assert closed == [loop]
+
+    event_loop = BackgroundEventLoop()
+    _, guard = event_loop.run(register())
+    event_loop.shutdown()
+    assert closed[-1] is event_loop.loop
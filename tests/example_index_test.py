@@ -0,0 +1,37 @@
+import re
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from prompts import CypherExampleCollections, Prompts
+from tools.example_index import ExampleIndex
+
+
+class WordEmbeddings(Embeddings):
+    """Bag-of-words embeddings over a fixed vocabulary."""
+
+    vocabulary = ["map", "driver", "measured", "country", "river", "toxic", "species", "information"]
+
+    def embed_query(self, text: str) -> List[float]:
+        words = re.findall(r"[a-z]+", text.lower())
+        return [float(sum(w.startswith(v) for w in words)) for v in self.vocabulary] + [0.1]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(t) for t in texts]
+
+
+def test_index_selects_most_similar_examples():
+    index = ExampleIndex(CypherExampleCollections.general_cypher_queries, WordEmbeddings(), k=2)
+    examples = index.select("Which substances are drivers at sites in the Rhine?")
+    assert len(examples) == 2
+    assert "driver" in examples[0]["information"]
+    formatted = index.format(examples)
+    assert formatted.startswith("0. ") and "1. " in formatted
+
+
+def test_prompt_takes_examples_per_call():
+    template = Prompts.cypher_search.get_prompt_template()
+    default = template.format(schema="", question="Q")
+    selected = template.format(schema="", question="Q", examples="0. Only this example")
+    assert "0. Only this example" in selected
+    assert len(selected) < len(default)
@@ -0,0 +1,60 @@
+import base64
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io
+
+from figure_artifacts import FigureCache, decode_figure, encode_figure, plotly_json
+
+
+def create_figure(template: str = "plotly") -> go.Figure:
+    random = np.random.default_rng(0)
+    # The template is pinned, the default one depends on whether streamlit was imported
+    return go.Figure(go.Scattergeo(lat=random.uniform(40, 60, 100), lon=list(random.uniform(-5, 25, 100)),
+                                   text=[f"site {i}" for i in range(100)]), layout={"template": template})
+
+
+def values(array) -> list:
+    if isinstance(array, dict):
+        return np.frombuffer(base64.b64decode(array["bdata"]), dtype=array["dtype"]).tolist()
+    return list(array)
+
+
+def test_artifact_restores_the_figure():
+    fig = create_figure()
+    for compress in [True, False]:
+        restored = decode_figure(json.loads(json.dumps(encode_figure(fig, compress))))
+        for column in ["lat", "lon", "text"]:
+            assert values(restored.data[0][column]) == values(fig.data[0][column])
+        assert restored.layout.template == fig.layout.template
+
+
+def test_artifact_is_smaller_than_plotly_json():
+    fig = create_figure()
+    artifact = encode_figure(fig, compress=False)
+    assert '"template":"plotly"' in artifact["data"]
+    assert '"bdata"' in artifact["data"]
+    assert len(encode_figure(fig)["data"]) < len(artifact["data"]) < len(plotly.io.to_json(fig)) / 2
+
+
+def test_figures_are_decoded_once():
+    cache = FigureCache()
+    artifact = encode_figure(create_figure())
+    assert cache.get(artifact) is cache.get(dict(artifact))
+    assert cache.get(plotly.io.to_json(create_figure())) is not None
+    assert cache.metrics() == {"figures": 2, "hits": 1, "decodes": 2}
+
+
+def test_other_templates_stay_embedded():
+    fig = create_figure("seaborn")
+    artifact = encode_figure(fig, compress=False)
+    assert '"template":"seaborn"' not in artifact["data"]
+    assert decode_figure(artifact).layout.template == fig.layout.template
+
+
+def test_plain_plotly_json_has_lists_and_the_template():
+    fig = create_figure()
+    figure = plotly_json(encode_figure(fig))
+    assert figure["data"][0]["lat"] == values(fig.data[0]["lat"])
+    assert figure["layout"]["template"] == json.loads(plotly.io.to_json(fig))["layout"]["template"]
@@ -0,0 +1,46 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from history_compaction import HistoryCompactionMiddleware
+
+
+def create_history(turns: int):
+    messages = []
+    for i in range(turns):
+        messages += [
+            HumanMessage(content=f"Question {i}"),
+            AIMessage(content="", tool_calls=[{"name": "CypherSearch", "args": {"query": f"q{i}"}, "id": f"call{i}"}]),
+            ToolMessage(content=f"<data>{'x' * 4000}</data><summary>rows {i}</summary>", tool_call_id=f"call{i}"),
+            AIMessage(content=f"Answer {i}"),
+        ]
+    return messages
+
+
+def test_short_histories_are_unchanged():
+    middleware = HistoryCompactionMiddleware(token_budget=100000)
+    messages = create_history(3)
+    assert middleware.compact(messages) is messages
+
+
+def test_old_tool_payloads_are_removed_first():
+    middleware = HistoryCompactionMiddleware(token_budget=2000, recent_turns=1)
+    messages = create_history(3)
+    compacted = middleware.compact(messages)
+    assert len(compacted) == len(messages)
+    assert compacted[2].content == "<data>(removed from the history)</data><summary>rows 0</summary>"
+    assert compacted[-2] is messages[-2]
+
+
+def test_rolling_summary_is_computed_once_per_message():
+    model = FakeListChatModel(responses=["summary of two turns", "summary of three turns"])
+    middleware = HistoryCompactionMiddleware(model, token_budget=50, recent_turns=1)
+    messages = create_history(3)
+    compacted = middleware.compact(messages)
+    assert compacted[0].content.endswith("summary of two turns")
+    assert compacted[1:] == messages[8:]
+    # The same history again takes the summary from the cache
+    assert middleware.compact(messages)[0].content.endswith("summary of two turns")
+    # One more turn only summarizes the turn that became old
+    compacted = middleware.compact(create_history(4))
+    assert compacted[0].content.endswith("summary of three turns")
+    assert model.i == 0  # both responses were used exactly once
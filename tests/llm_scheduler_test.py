@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from llm_scheduler import LLMScheduler, Priority, TokenBucket, llm_priority
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://api.openai.com"))
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_token_bucket_refills_per_minute():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    bucket.take(60)
+    assert bucket.wait_time(6) == pytest.approx(6)
+    clock.now = 3
+    assert bucket.wait_time(6) == pytest.approx(3)
+    # Overestimated tokens are given back
+    bucket.give_back(10)
+    assert bucket.wait_time(6) == 0
+
+
+def test_interactive_requests_are_admitted_before_evaluation():
+    scheduler = LLMScheduler()
+    admitted = []
+
+    async def request(name, priority):
+        with llm_priority(priority):
+            await scheduler.aacquire(100)
+        admitted.append(name)
+
+    async def main():
+        scheduler.pause(0.1)
+        tasks = [asyncio.create_task(request("evaluation", Priority.EVALUATION))]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(request("interactive", Priority.INTERACTIVE)))
+        await asyncio.sleep(0.01)
+        depth = scheduler.metrics()["queue_depth_by_priority"]
+        await asyncio.gather(*tasks)
+        return depth
+
+    assert asyncio.run(main()) == {"interactive": 1, "evaluation": 1}
+    assert admitted == ["interactive", "evaluation"]
+
+
+def test_rate_limited_requests_are_retried_with_backoff():
+    scheduler = LLMScheduler(base_delay=0.001, max_delay=0.01)
+    errors = [rate_limit_error(), rate_limit_error(retry_after=0.02)]
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return "answer"
+
+    assert scheduler.call(request, 100) == "answer"
+    metrics = scheduler.metrics()
+    assert (metrics["admitted"], metrics["retries"], metrics["rate_limited"]) == (3, 2, 2)
+
+
+def test_requests_fail_after_the_last_retry():
+    scheduler = LLMScheduler(max_retries=1, base_delay=0.001)
+
+    def request():
+        raise rate_limit_error()
+
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call(request, 100)
+    assert scheduler.metrics()["failed"] == 1
+
+
+def test_streams_are_not_retried_after_their_first_chunk():
+    scheduler = LLMScheduler(base_delay=0.001)
+
+    def request():
+        yield "first"
+        raise rate_limit_error()
+
+    chunks = []
+    with pytest.raises(openai.RateLimitError):
+        for chunk in scheduler.stream(request, 100):
+            chunks.append(chunk)
+    assert chunks == ["first"]
@@ -2,7 +2,7 @@ import pandas as pd
 import plotly.express as px
 import plotly.io as pio
 
-from utils import connect_to_neo4j_for_test
+from neo4j_test_utils import connect_to_neo4j_for_test
 
 def test_location_map():
     locations_cypher = \
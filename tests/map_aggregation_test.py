@@ -0,0 +1,37 @@
+from tools.map_aggregation import aggregate_map_query, returned_columns
+
+CONCENTRATION_MAP = """
+MATCH (s:Substance)-[r:MEASURED_AT]->(l:Site)
+  WHERE s.Name = 'Diuron'
+RETURN s.Name AS chemicalname, r.median_concentration AS Concentration, r.year AS year, r.quarter AS quarter,
+       l.name AS sitename, l.water_body AS waterbody, l.lat AS lat, l.lon AS lon
+  ORDER BY r.median_concentration DESC
+"""
+
+
+def test_returned_columns():
+    assert returned_columns("MATCH (l:Site) RETURN DISTINCT l.name AS name, count(l) AS `number of sites` "
+                            "ORDER BY name") == ["name", "number of sites"]
+    assert returned_columns("MATCH (l:Site) RETURN *") is None
+    assert returned_columns("MATCH (l:Site) RETURN l.name") is None
+
+
+def test_map_query_is_aggregated_per_site():
+    cypher = aggregate_map_query(CONCENTRATION_MAP)
+    assert cypher.startswith("CALL { MATCH (s:Substance)")
+    assert cypher.endswith(
+        "RETURN sitename, lat, lon, waterbody, percentileCont(Concentration, 0.5) AS concentration, "
+        "head(collect(chemicalname)) AS chemicalname, "
+        "CASE WHEN min(year) = max(year) THEN toString(min(year)) "
+        "ELSE toString(min(year)) + '-' + toString(max(year)) END AS year")
+
+
+def test_occurrence_map_is_grouped_by_substance():
+    cypher = aggregate_map_query("MATCH (s:Substance)-[:MEASURED_AT]->(l:Site) "
+                                 "RETURN s.Name AS chemicalname, l.name AS sitename, l.lat AS lat, l.lon AS lon")
+    assert cypher.endswith("RETURN sitename, lat, lon, chemicalname")
+
+
+def test_queries_without_sites_are_unchanged():
+    cypher = "MATCH (s:Substance) RETURN s.Name AS chemicalname"
+    assert aggregate_map_query(cypher) == cypher
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from tools.map_binning import bin_sites, choose_cell_size
+
+
+def create_sites(number_of_sites: int) -> pd.DataFrame:
+    random = np.random.default_rng(0)
+    return pd.DataFrame({
+        "sitename": [f"site {i}" for i in range(number_of_sites)],
+        "lat": random.uniform(40, 60, number_of_sites),
+        "lon": random.uniform(-5, 25, number_of_sites),
+        "concentration": random.exponential(size=number_of_sites),
+        "waterbody": "Rhine",
+    })
+
+
+def test_few_sites_are_not_binned():
+    assert bin_sites(create_sites(100), "concentration", ["waterbody"], max_points=100) is None
+    assert bin_sites(create_sites(100), "concentration", ["waterbody"], max_points=0) is None
+
+
+def test_cells_do_not_exceed_max_points():
+    sites = create_sites(5000)
+    cell_degrees, cells = choose_cell_size(sites["lat"].to_numpy(), sites["lon"].to_numpy(), 500)
+    assert len(np.unique(cells)) <= 500
+    finer = choose_cell_size(sites["lat"].to_numpy(), sites["lon"].to_numpy(), 10000)[0]
+    assert finer < cell_degrees
+
+
+def test_binned_cells_summarize_their_sites():
+    binned, _ = bin_sites(create_sites(5000), "concentration", ["waterbody"], max_points=500)
+    assert len(binned) <= 500
+    assert binned["sites"].sum() == 5000
+    assert (binned["concentration min"] <= binned["concentration"]).all()
+    assert (binned["concentration"] <= binned["concentration max"]).all()
+    assert (binned["waterbody"] == "Rhine").all()
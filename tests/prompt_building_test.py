@@ -35,4 +35,13 @@ def test_cypher_example_injection():
     prompt.inject_examples(cypher_examples)
     assert len(prompt.prompt) == (old_prompt_len +
                                   len(cypher_examples.format_examples_as_markdown()) -
-                                  len(f"({cypher_examples.get_placeholder_name()})"))
\ No newline at end of file
+                                  len(f"({cypher_examples.get_placeholder_name()})"))
+
+def test_default_parameters_can_be_replaced_per_call():
+    prompt = Prompt(os.path.join(prompts_directory, "cypher_prompt.yml"))
+    prompt.partial_apply_defaults({"meta": "Full meta data"})
+    assert prompt.parameters == {"schema"}
+    assert "Full meta data" in prompt.full_text
+    template = prompt.get_prompt_template()
+    assert "Full meta data" in template.format(schema="")
+    assert "Sliced meta data" in template.format(schema="", meta="Sliced meta data")
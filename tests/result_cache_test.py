@@ -0,0 +1,78 @@
+from tools.result_cache import DiskResultStore, QueryResultCache, canonicalize_cypher, create_cache_key, \
+    get_marker_file, invalidate_result_cache
+
+
+def test_canonical_cypher_ignores_comments_and_whitespace():
+    formatted = """
+        MATCH (s:Substance)-[r:MEASURED_AT]->(l:Site)
+          WHERE s.Name = 'Diuron'  // only Diuron
+        RETURN s.Name AS chemicalname, /* plot title */
+               l.name   AS sitename;
+    """
+    compact = "MATCH (s:Substance)-[r:MEASURED_AT]->(l:Site) WHERE s.Name = 'Diuron' " \
+              "RETURN s.Name AS chemicalname, l.name AS sitename"
+    assert canonicalize_cypher(formatted) == compact
+
+
+def test_canonical_cypher_keeps_string_literals():
+    cypher = "MATCH (l:Site) WHERE l.name = 'a  // b' RETURN l"
+    assert canonicalize_cypher(cypher) == cypher
+    assert create_cache_key(cypher, None, 10, "v1") != create_cache_key(cypher.replace("a  //", "a //"), None, 10, "v1")
+
+
+def test_cache_key_depends_on_dataset_version_and_limit():
+    cypher = "MATCH (n) RETURN n"
+    assert create_cache_key(cypher, None, 10, "v1") != create_cache_key(cypher, None, 10, "v2")
+    assert create_cache_key(cypher, None, 10, "v1") != create_cache_key(cypher, None, 20, "v1")
+
+
+def test_byte_budget_evicts_least_recently_used():
+    rows = [{"name": "x" * 100}]
+    cache = QueryResultCache(max_bytes=300)
+    cache.put("a", rows)
+    cache.put("b", rows)
+    cache.get("a")
+    cache.put("c", rows)
+    assert cache.get("a") == rows
+    assert cache.get("b") is None
+    assert cache.metrics()["bytes"] <= 300
+
+
+def test_cached_results_are_copies():
+    cache = QueryResultCache()
+    cache.put("a", [{"name": "site"}])
+    cache.get("a")[0]["name"] = "changed"
+    assert cache.get("a") == [{"name": "site"}]
+
+
+def test_disk_store_is_shared_between_caches(tmp_path):
+    first = QueryResultCache(disk_store=DiskResultStore(str(tmp_path)))
+    second = QueryResultCache(disk_store=DiskResultStore(str(tmp_path)))
+    first.put("a", [{"count": 1}])
+    assert second.get("a") == [{"count": 1}]
+    assert second.metrics()["disk_hits"] == 1
+
+
+def test_results_expire_after_the_time_to_live(tmp_path):
+    cache = QueryResultCache(time_to_live=0, disk_store=DiskResultStore(str(tmp_path), time_to_live=0))
+    cache.put("a", [{"count": 1}])
+    assert cache.get("a") is None
+    assert cache.metrics()["bytes"] == 0
+
+
+def test_invalidation_clears_the_shared_disk_store(tmp_path):
+    cache = QueryResultCache(disk_store=DiskResultStore(str(tmp_path)))
+    cache.put("a", [{"count": 1}])
+    invalidate_result_cache({"RESULT_CACHE_DIR": str(tmp_path)})
+    assert QueryResultCache(disk_store=DiskResultStore(str(tmp_path))).get("a") is None
+
+
+def test_invalidation_drops_the_results_other_processes_keep_in_memory(tmp_path):
+    marker_file = get_marker_file({"RESULT_CACHE_DIR": str(tmp_path)})
+    cache = QueryResultCache(marker_file=marker_file)
+    cache.put("a", [{"count": 1}])
+    for _ in range(2):
+        invalidate_result_cache({"RESULT_CACHE_DIR": str(tmp_path)})
+        assert cache.get("a") is None
+        cache.put("a", [{"count": 1}])
+    assert cache.get("a") == [{"count": 1}]
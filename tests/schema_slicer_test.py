@@ -0,0 +1,39 @@
+import yaml
+
+from prompts import get_graph_meta_data
+from tools.schema_slicer import SchemaSlicer
+
+metadata = get_graph_meta_data()
+structured_schema = {
+    "node_props": {
+        n["name"]: [{"property": p["name"], "type": "STRING"} for p in n["properties"]]
+        for n in yaml.safe_load(metadata)["schema"]["nodes"]
+    },
+    "rel_props": {
+        r["name"]: [{"property": p["name"], "type": "STRING"} for p in r["properties"]]
+        for r in yaml.safe_load(metadata)["schema"]["relationships"]
+    },
+    "relationships": [
+        {"start": "Substance", "type": "MEASURED_AT", "end": "Site"},
+        {"start": "Substance", "type": "TESTED_FOR_TOXICITY", "end": "Species"},
+        {"start": "Substance", "type": "IS_DRIVER", "end": "Site"},
+        {"start": "Site", "type": "SUMMARIZED_IMPACT_ON", "end": "Species"},
+    ],
+}
+
+
+def test_slice_contains_relationships_with_their_labels():
+    slicer = SchemaSlicer(structured_schema, metadata)
+    assert slicer.select("Where was Diuron measured in 2015?") == {"Substance", "MEASURED_AT", "Site"}
+    schema, meta = slicer.slice("What is the toxicity of Atrazine for daphnia?")
+    assert "TESTED_FOR_TOXICITY" in schema and "SUMMARIZED_IMPACT_ON" not in schema
+    assert "name: Species" in meta and "name: Site" not in meta
+
+
+def test_unmatched_questions_get_the_full_schema():
+    slicer = SchemaSlicer(structured_schema, metadata, always_include=["Site"])
+    schema, meta = slicer.slice("Tell me about Diuron")
+    assert meta == metadata
+    assert slicer.metrics()["saved_tokens"] == 0
+    slicer.slice("How many sites are in Germany?")
+    assert slicer.metrics()["saved_tokens"] > 0
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from single_flight import SingleFlight, flight_key
+
+
+class Source:
+    def __init__(self, events, fail=False):
+        self.events = events
+        self.fail = fail
+        self.runs = 0
+        self.release = asyncio.Event()
+        self.closed = False
+
+    async def stream(self):
+        self.runs += 1
+        try:
+            for event in self.events:
+                yield event
+                await self.release.wait()
+            if self.fail:
+                raise RuntimeError("OpenAI API unavailable")
+        finally:
+            self.closed = True
+
+
+async def collect(single_flight, key, source, follower_done=None):
+    return [e async for e in single_flight.subscribe(key, source.stream, follower_done)]
+
+
+def test_flight_key_normalizes_the_question_within_its_conversation():
+    assert flight_key("What is  Diuron?") == flight_key("what is diuron? ")
+    assert flight_key("What is Diuron?") != flight_key("What is Diuron?", [AIMessage(content="Hi")])
+
+
+def test_concurrent_identical_requests_share_one_run():
+    async def main():
+        single_flight, source = SingleFlight(), Source([1, 2, 3])
+        followers = []
+
+        async def store(events):
+            followers.append(events)
+
+        first = asyncio.create_task(collect(single_flight, "k", source))
+        await asyncio.sleep(0.01)
+        # Joins after the first event and still receives all of them
+        second = asyncio.create_task(collect(single_flight, "k", source, store))
+        await asyncio.sleep(0.01)
+        source.release.set()
+        results = await asyncio.gather(first, second)
+        return results, source.runs, followers, len(single_flight)
+
+    results, runs, followers, in_flight = asyncio.run(main())
+    assert results == [[1, 2, 3], [1, 2, 3]]
+    assert runs == 1
+    assert followers == [[1, 2, 3]]
+    assert in_flight == 0
+
+
+def test_errors_reach_all_subscribers():
+    async def main():
+        single_flight, source = SingleFlight(), Source([1], fail=True)
+        source.release.set()
+        return await asyncio.gather(collect(single_flight, "k", source), collect(single_flight, "k", source),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_run_is_cancelled_when_all_subscribers_left():
+    async def main():
+        single_flight, source = SingleFlight(), Source([1, 2])
+        subscription = single_flight.subscribe("k", source.stream)
+        assert await subscription.__anext__() == 1
+        await subscription.aclose()
+        await asyncio.sleep(0.01)
+        return source.closed, len(single_flight)
+
+    assert asyncio.run(main()) == (True, 0)
+
+
+def test_completed_runs_are_not_reused():
+    async def main():
+        single_flight, source = SingleFlight(), Source([1])
+        source.release.set()
+        await collect(single_flight, "k", source)
+        await collect(single_flight, "k", source)
+        return source.runs
+
+    assert asyncio.run(main()) == 2
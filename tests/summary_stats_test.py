@@ -0,0 +1,47 @@
+import datetime
+import random
+
+import pandas as pd
+
+from tools.summary_stats import SummaryAccumulator, summarize_records
+
+
+def describe(records, **kwargs) -> str:
+    return pd.DataFrame(records).describe(include='all').to_json(default_handler=str, **kwargs)
+
+
+def test_summary_matches_pandas_describe():
+    rng = random.Random(1)
+    records = [
+        {
+            "ChemicalName": rng.choice(["Diuron", "Atrazine", "Citalopram"]),
+            "Concentration": rng.choice([None, rng.random() * 10]),
+            "Year": rng.randint(2000, 2020),
+            "SiteName": f"site {rng.randint(0, 5)}",
+            "Date": datetime.date(2010, 1, rng.randint(1, 3)),
+        }
+        for _ in range(57)
+    ]
+    assert summarize_records(records) == describe(records)
+
+
+def test_numeric_and_categorical_only_results():
+    numbers = [{"a": 123456789012, "b": 0.5}, {"a": 3, "b": None}, {"a": 7, "b": 1e-9}]
+    assert summarize_records(numbers) == describe(numbers)
+    names = [{"name": name} for name in ["b", "a", "a", "b", "c"]]
+    assert summarize_records(names) == describe(names)
+
+
+def test_quantiles_are_estimated_in_bounded_memory():
+    accumulator = SummaryAccumulator(max_samples=1000)
+    accumulator.add_all({"x": float(i)} for i in range(100001))
+    column = accumulator.columns["x"]
+    assert len(column.samples) == 1000
+    summary = accumulator.summary()["x"]
+    assert summary["count"] == 100001 and summary["mean"] == 50000
+    assert abs(summary["50%"] - 50000) < 5000
+
+
+def test_columns_appearing_later_are_missing_before():
+    records = [{"a": 1.5}, {"a": 2.5}, {"a": 4.0, "b": 3.25}, {"a": 1.0, "b": 0.1}]
+    assert summarize_records(records) == describe(records)
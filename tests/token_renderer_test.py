@@ -0,0 +1,56 @@
+from token_renderer import TokenRenderer
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.text = ""
+
+    def write(self, text: str) -> None:
+        self.text = text
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_renderer(interval: float = 0.05, characters: int = 200):
+    placeholders, clock = [], FakeClock()
+
+    def new_placeholder():
+        placeholders.append(FakePlaceholder())
+        return placeholders[-1]
+
+    return TokenRenderer(new_placeholder, interval, characters, clock), placeholders, clock
+
+
+def test_chunks_are_rendered_on_a_size_budget():
+    renderer, placeholders, _ = create_renderer(characters=20)
+    for _ in range(100):
+        renderer.add("word ")
+    renderer.close()
+    assert renderer.chunks == 100
+    assert renderer.renders == 25
+    assert "".join(p.text for p in placeholders) == "word " * 100
+
+
+def test_chunks_are_rendered_on_a_time_budget():
+    renderer, placeholders, clock = create_renderer()
+    renderer.add("Hello")
+    assert renderer.renders == 0
+    clock.now = 0.1
+    renderer.add(" world")
+    assert renderer.renders == 1
+    assert placeholders[0].text == "Hello world"
+
+
+def test_completed_paragraphs_are_not_rendered_again():
+    renderer, placeholders, _ = create_renderer(characters=1)
+    for chunk in ["First paragraph.", "\n\n", "```\ncode\n\nmore code\n```", "\n\nLast", " paragraph."]:
+        renderer.add(chunk)
+    renderer.close()
+    assert [p.text for p in placeholders] == [
+        "First paragraph.\n", "\n```\ncode\n\nmore code\n```\n", "\nLast paragraph."]
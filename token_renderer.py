@@ -0,0 +1,114 @@
+"""
+Throttled rendering of streamed answer tokens.
+
+Writing the accumulated answer into a Streamlit placeholder for every streamed chunk renders the
+whole Markdown again each time, so the rendering work and the websocket payload grow
+quadratically with the length of the answer. The TokenRenderer collects chunks until a time or
+size budget is exhausted and renders only then. Completed paragraphs are rendered a last time
+into their own placeholder, so each render only covers the paragraph that is still growing.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict
+
+DEFAULT_INTERVAL = 0.05  # seconds
+DEFAULT_CHARACTERS = 200
+
+_totals = {"answers": 0, "chunks": 0, "renders": 0}
+_totals_lock = threading.Lock()
+
+
+def _last_paragraph_break(text: str) -> int:
+    """Position of the last blank line that is not inside a fenced code block, or -1."""
+    position, last = 0, -1
+    in_code = False
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        elif not line.strip() and line.endswith("\n") and not in_code and position > 0:
+            last = position
+        position += len(line)
+    return last
+
+
+class TokenRenderer:
+    """
+    Renders a streamed answer into Streamlit placeholders on a time or size budget.
+    """
+
+    def __init__(
+            self,
+            new_placeholder: Callable[[], Any],
+            interval: float = DEFAULT_INTERVAL,
+            characters: int = DEFAULT_CHARACTERS,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param new_placeholder: Creates the next placeholder below the previous ones, e.g. container.empty.
+        :param interval: Seconds after the last render at which new chunks are rendered.
+        :param characters: Number of new characters that are rendered without waiting for the interval.
+        :param clock: Source of the current time in seconds.
+        """
+        self.new_placeholder = new_placeholder
+        self.interval = interval
+        self.characters = characters
+        self.clock = clock
+        self.text = ""
+        self._placeholder = None
+        self._block_start = 0
+        self._rendered = 0
+        self._last_render = clock()
+        self.chunks = 0
+        self.renders = 0
+
+    def add(self, chunk: str) -> None:
+        """Adds a streamed chunk and renders if the budget is exhausted."""
+        if not chunk:
+            return
+        self.text += chunk
+        self.chunks += 1
+        if len(self.text) - self._rendered >= self.characters or self.clock() - self._last_render >= self.interval:
+            self.flush()
+
+    def _render(self, text: str) -> None:
+        if self._placeholder is None:
+            self._placeholder = self.new_placeholder()
+        self._placeholder.write(text)
+        self.renders += 1
+
+    def flush(self) -> None:
+        """Renders everything not rendered yet, e.g. before a tool is called and at the end of the answer."""
+        if self._rendered == len(self.text):
+            return
+        block = self.text[self._block_start:]
+        split = _last_paragraph_break(block)
+        if split > 0:
+            # The completed paragraphs are final, the next renders only cover the rest
+            self._render(block[:split])
+            self._placeholder = None
+            self._block_start += split
+            block = block[split:]
+        if block.strip():
+            self._render(block)
+        self._rendered = len(self.text)
+        self._last_render = self.clock()
+
+    def close(self) -> None:
+        """Renders the rest of the answer and adds the counters to the totals of the process."""
+        self.flush()
+        with _totals_lock:
+            _totals["answers"] += 1
+            _totals["chunks"] += self.chunks
+            _totals["renders"] += self.renders
+
+    def metrics(self) -> Dict[str, int]:
+        return {"chunks": self.chunks, "renders": self.renders, "characters": len(self.text)}
+
+
+def get_token_rendering_metrics() -> Dict[str, Any]:
+    """Returns the number of streamed chunks and of renders of all answers of the process."""
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["renders_per_answer"] = totals["renders"] / totals["answers"] if totals["answers"] else 0.0
+    return totals
@@ -0,0 +1,166 @@
+"""
+Column-oriented query results.
+
+The records of a query are written straight into one typed array per column: int64 for integer
+columns without missing values, float64 with NaN for other numeric columns, and object arrays for
+everything else, which is what pandas infers for the same records. The summary statistics are
+accumulated in the same pass over the rows, see summary_stats.py. The aggregation of map data and
+the DataFrames used for plotting read the arrays without building a dictionary per row first.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from tools.summary_stats import SummaryAccumulator, summary_to_json
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def typed_array(values: List[Any]) -> np.ndarray:
+    """Converts the values of a column into the array type pandas would infer for them."""
+    numbers = [v for v in values if v is not None]
+    if numbers and all(_is_number(v) for v in numbers):
+        if len(numbers) == len(values) and all(isinstance(v, int) for v in numbers):
+            try:
+                return np.array(values, dtype=np.int64)
+            except OverflowError:
+                return np.array(values, dtype=np.float64)
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        # Element-wise, so lists stay values instead of becoming a second dimension
+        array[i] = value
+    return array
+
+
+class ColumnarResult:
+    """
+    The result of a query as named, equally long, typed columns.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], summary: Optional[Dict[str, Dict[str, Any]]] = None,
+                 lower_case_keys: bool = False):
+        """
+        :param columns: The typed array of each column.
+        :param summary: The statistics of the columns if they were accumulated while the rows arrived.
+        :param lower_case_keys: Whether the keys are those of the summary in lower case.
+        """
+        self.columns = columns
+        self.length = len(next(iter(columns.values()))) if columns else 0
+        self.summary = summary
+        self.lower_case_keys = lower_case_keys
+
+    @classmethod
+    def from_rows(
+            cls,
+            keys: Sequence[str],
+            rows: Iterable[Sequence[Any]],
+            limit: Optional[int] = None,
+            sanitize: Optional[Callable[[Any], Any]] = None,
+    ) -> "ColumnarResult":
+        """
+        Builds the columns from rows of values, e.g. the records of the Neo4j driver.
+
+        :param keys: The column names, in the order of the values in each row.
+        :param rows: The rows of values.
+        :param limit: The maximal number of rows read.
+        :param sanitize: Applied to every value, e.g. to drop large lists.
+        """
+        builder = ColumnarBuilder(keys, sanitize)
+        for row in rows:
+            builder.add(row)
+            if limit is not None and len(builder) >= limit:
+                break
+        return builder.build()
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "ColumnarResult":
+        """
+        Builds the columns from dictionaries. Keys missing from some records become missing values.
+        """
+        values: Dict[str, List[Any]] = {}
+        rows = 0
+        for record in records:
+            for key, value in record.items():
+                if key not in values:
+                    values[key] = [None] * rows
+                values[key].append(value)
+            rows += 1
+            for column in values.values():
+                if len(column) < rows:
+                    column.append(None)
+        return cls({key: typed_array(column) for key, column in values.items()})
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, ColumnarResult) and self.to_records() == other.to_records()
+
+    def keys(self) -> List[str]:
+        return list(self.columns)
+
+    def with_lower_case_keys(self) -> "ColumnarResult":
+        """The same columns, without copying, named in lower case."""
+        return ColumnarResult({key.lower(): column for key, column in self.columns.items()},
+                              self.summary, self.summary is not None)
+
+    def head(self, n: int) -> "ColumnarResult":
+        """The first n rows, as views of the columns."""
+        return ColumnarResult({key: column[:n] for key, column in self.columns.items()})
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns, copy=False)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        columns = {key: column.tolist() for key, column in self.columns.items()}
+        for key, column in self.columns.items():
+            if column.dtype == np.float64:
+                columns[key] = [None if v != v else v for v in columns[key]]
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def describe_json(self, default_handler=str) -> str:
+        """
+        Serializes the summary statistics like df.describe(include='all').to_json(default_handler=str).
+        """
+        if self.summary is None:
+            # The columns were not built from rows, e.g. they are the first rows of a result
+            accumulator = SummaryAccumulator(keys=self.keys())
+            for row in zip(*(column.tolist() for column in self.columns.values())):
+                accumulator.add_row(row)
+            self.summary = accumulator.summary()
+        return summary_to_json(self.summary, default_handler, self.lower_case_keys)
+
+
+class ColumnarBuilder:
+    """
+    Collects rows of values into a ColumnarResult.
+    """
+
+    def __init__(self, keys: Sequence[str], sanitize: Optional[Callable[[Any], Any]] = None):
+        self.keys = list(keys)
+        self.sanitize = sanitize
+        self._values: List[List[Any]] = [[] for _ in self.keys]
+        # The statistics are accumulated while the rows arrive
+        self._summary = SummaryAccumulator(keys=self.keys)
+
+    def __len__(self) -> int:
+        return len(self._values[0]) if self._values else 0
+
+    def add(self, row: Sequence[Any]) -> None:
+        if self.sanitize is not None:
+            row = [self.sanitize(value) for value in row]
+        for column, value in zip(self._values, row):
+            column.append(value)
+        self._summary.add_row(row)
+
+    def build(self) -> ColumnarResult:
+        return ColumnarResult({key: typed_array(values) for key, values in zip(self.keys, self._values)},
+                              self._summary.summary())
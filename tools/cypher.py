@@ -1,15 +1,15 @@
 from typing import Any, Type, Optional, Dict
 
-import pandas as pd
-from tools.forked_cypherQA_chain import GraphCypherQAChain
+from tools.forked_cypherQA_chain import GraphCypherQAChain, configure_chain
 from langchain_community.tools import BaseTool
-from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
 from langchain_core.tools import ToolException
 from pydantic import BaseModel, Field, model_validator
 
+from config import config
 from graph import connect_to_neo4j
-from llm import get_chat_llm
-from prompts import Prompts, ToolDescriptions
+from llm import get_chat_llm, embeddings
+from prompts import CypherExampleCollections, Prompts, ToolDescriptions
 
 
 class CypherSearchCore(BaseModel):
@@ -30,14 +30,26 @@ class CypherSearchCore(BaseModel):
             verbose=True,
             cypher_prompt=values["prompt"].get_prompt_template(),
             return_intermediate_steps=True,
+            speculative_temperature=config.get("CYPHER_SEARCH_CANDIDATE_TEMPERATURE", 0.7),
             allow_dangerous_requests=True
         )
+        configure_chain(values["cypher_chain"], config, "cypher_search", CypherExampleCollections.general_cypher_queries,
+                        values["prompt"].full_text, embeddings, ())
         values["cypher_chain"].return_direct = True
+        values["cypher_chain"].columnar = True
         values["cypher_chain"].top_k = 1000
         return values
 
     def run(self, query: str) -> str:
         results = self.cypher_chain.invoke({"query": query})
+        return self.create_answer(results)
+
+    async def arun(self, query: str) -> str:
+        results = await self.cypher_chain.ainvoke({"query": query})
+        return self.create_answer(results)
+
+    @staticmethod
+    def create_answer(results: dict) -> str:
         max_results_shown = 5
         results_cropped = False
 
@@ -46,11 +58,11 @@ class CypherSearchCore(BaseModel):
         # the missing pieces, refine the question and run the tool again.
         generated_cypher = results["intermediate_steps"][-1]["query"]
         if "result" in results and len(results["result"]) > 0:
-            df = pd.DataFrame(results["result"])
-            df_description = df.describe(include='all').to_json(default_handler=str)
-            if df.shape[0] > max_results_shown:
-                df = df[:max_results_shown]
+            # The statistics are computed from the columns, only the rows shown become a DataFrame
+            df_description = results["result"].describe_json()
+            if len(results["result"]) > max_results_shown:
                 results_cropped = True
+            df = results["result"].head(max_results_shown).to_frame()
             df_json = df.to_json(default_handler=str)
 
         else:
@@ -104,3 +116,7 @@ class CypherSearch(BaseTool):
     def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> Any:
         result = self.search_core.run(query)
         return result
+
+    async def _arun(self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> Any:
+        result = await self.search_core.arun(query)
+        return result
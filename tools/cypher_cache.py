@@ -0,0 +1,214 @@
+"""
+Semantic cache from questions to the Cypher statements generated for them.
+
+Rephrasings of an already answered question are recognised by the cosine similarity of their
+embeddings, so we can skip the LLM call that translates the question into Cypher. Embeddings rate
+questions that only differ in a name as near-identical, so a similar question is only a hit if it also
+mentions the same entities, e.g. substances, countries, and years, as the cached one.
+Every prompt gets its own cache, identified by the prompt's scope and a hash of its text,
+so changing a prompt never serves Cypher generated with the old one.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TIME_TO_LIVE = 24 * 60 * 60  # seconds
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+def hash_prompt(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()[:16]
+
+
+class CacheEntry:
+    def __init__(self, question: str, cypher: str, embedding: np.ndarray, entities: Any = None):
+        self.question = question
+        self.cypher = cypher
+        self.embedding = embedding
+        self.entities = entities
+        self.created = time.monotonic()
+
+
+class SemanticCypherCache:
+    """
+    Nearest-neighbour lookup of previously generated Cypher statements with LRU and TTL eviction.
+
+    Identical questions (ignoring case and whitespace) are answered without computing an embedding.
+    """
+
+    def __init__(
+            self,
+            embeddings: Any,
+            scope: str,
+            prompt_hash: str,
+            similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            time_to_live: float = DEFAULT_TIME_TO_LIVE,
+            entity_extractor: Optional[Callable[[str], Any]] = None,
+    ):
+        """
+        :param embeddings: LangChain embeddings model used to embed the questions.
+        :param scope: Name of the prompt the cached Cypher was generated with, e.g. cypher_search.
+        :param prompt_hash: Hash of the prompt text.
+        :param similarity_threshold: Minimal cosine similarity for a cache hit.
+        :param max_entries: Maximal number of cached questions, least recently used ones are evicted first.
+        :param time_to_live: Seconds after which a cached entry expires.
+        :param entity_extractor: Finds the entities a question mentions, e.g. SlotExtractor.entities. A similar
+            question is only a hit if it mentions the same entities.
+        """
+        self.embeddings = embeddings
+        self.scope = scope
+        self.prompt_hash = prompt_hash
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.time_to_live = time_to_live
+        self.entity_extractor = entity_extractor
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now - entry.created > self.time_to_live]
+        for key in expired:
+            del self._entries[key]
+        self.evictions += len(expired)
+
+    def _entities(self, question: str) -> Any:
+        return self.entity_extractor(question) if self.entity_extractor is not None else None
+
+    def _find(self, key: str, embedding: Optional[np.ndarray], entities: Any = None) -> Optional[str]:
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(key)
+            if entry is None and embedding is not None and self._entries:
+                keys = [k for k, e in self._entries.items() if e.entities == entities]
+                if keys:
+                    matrix = np.vstack([self._entries[k].embedding for k in keys])
+                    similarities = matrix @ embedding
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        key = keys[best]
+                        entry = self._entries[key]
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.cypher
+
+    def _has_exact(self, key: str) -> bool:
+        with self._lock:
+            self._evict_expired()
+            return key in self._entries
+
+    @staticmethod
+    def _unit_vector(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Finds the Cypher statement cached for the question or the most similar one.
+
+        :return: The cached Cypher statement or None, and the embedding of the question that can be
+            passed on to store() to avoid computing it twice.
+        """
+        key = normalize_question(question)
+        if self._has_exact(key):
+            return self._find(key, None), None
+        embedding = self._unit_vector(self.embeddings.embed_query(question))
+        return self._find(key, embedding, self._entities(question)), embedding
+
+    async def alookup(self, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Async variant of lookup()."""
+        key = normalize_question(question)
+        if self._has_exact(key):
+            return self._find(key, None), None
+        embedding = self._unit_vector(await self.embeddings.aembed_query(question))
+        return self._find(key, embedding, self._entities(question)), embedding
+
+    def store(self, question: str, cypher: str, embedding: Optional[np.ndarray] = None) -> None:
+        """
+        Caches a validated Cypher statement for the question.
+        """
+        if embedding is None:
+            embedding = self._unit_vector(self.embeddings.embed_query(question))
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = CacheEntry(question, cypher, embedding, self._entities(question))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "scope": self.scope,
+                "prompt_hash": self.prompt_hash,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+# One cache per prompt and process, shared by all sessions
+_caches: Dict[Tuple[str, str], SemanticCypherCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_semantic_cypher_cache(scope: str, prompt: str, embeddings: Any, **settings) -> SemanticCypherCache:
+    """
+    Provides the process-wide semantic cache for a prompt.
+
+    :param scope: Name of the prompt, e.g. cypher_search, geographic_map, or scientific_plot.
+    :param prompt: The text of the prompt the Cypher statements are generated with.
+    :param embeddings: LangChain embeddings model used to embed the questions.
+    :param settings: Further arguments of SemanticCypherCache, only used when the cache is created.
+    """
+    key = (scope, hash_prompt(prompt))
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = SemanticCypherCache(embeddings, scope, key[1], **settings)
+        return _caches[key]
+
+
+def get_cache_settings(config) -> Dict[str, Any]:
+    """
+    Reads the settings of the semantic Cypher cache from the configuration.
+    """
+    return {
+        "similarity_threshold": float(config.get("CYPHER_CACHE_SIMILARITY_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD)),
+        "max_entries": int(config.get("CYPHER_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        "time_to_live": float(config.get("CYPHER_CACHE_TIME_TO_LIVE", DEFAULT_TIME_TO_LIVE)),
+    }
+
+
+def get_cache_metrics() -> List[Dict[str, Any]]:
+    """
+    Reports hits, misses, and size of all semantic Cypher caches of this process.
+    """
+    with _caches_lock:
+        caches = list(_caches.values())
+    return [cache.metrics() for cache in caches]
@@ -0,0 +1,346 @@
+"""
+Fast path that answers common questions from parameterised templates instead of calling the LLM.
+
+The hand-curated Cypher examples are compiled into templates whose literal filters become slots:
+substance, country, water body, river basin, species, and years. A question is matched by filling
+the same slots from the question and comparing the remaining words with the example's description.
+Every remaining word of the question must occur in the description, and negations or modifiers like
+"not" or "ordered" must occur in both, since the template would silently ignore them. Only confident
+matches are used; everything else falls through to the Cypher generation chain.
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from prompts import CypherExampleCollection
+from tools.result_cache import canonicalize_cypher
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.6
+
+# Properties whose literal values become slots, keyed by node label and property name
+SLOT_PROPERTIES = {
+    ("Substance", "Name"): "substance",
+    ("Substance", "name"): "substance",
+    ("Site", "country"): "country",
+    ("Site", "water_body"): "waterbody",
+    ("Site", "river_basin"): "riverbasin",
+    ("Species", "name"): "species",
+}
+SPECIES_SYNONYMS = {
+    "algae": "algae", "alga": "algae",
+    "crustacean": "crustacean", "crustaceans": "crustacean", "daphnia": "crustacean",
+    "fish": "fish", "fishes": "fish",
+}
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "been", "by", "can", "certain", "did", "do", "does", "for", "from",
+    "has", "have", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "please", "s", "the", "their",
+    "there", "to", "was", "were", "what", "which", "with", "you", "your",
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december", "between", "since", "after", "until", "before", "year", "years",
+}
+
+_node = re.compile(r"\(\s*([A-Za-z_]\w*)\s*:\s*([A-Za-z_]\w*)")
+_string_filter = re.compile(r"\b([A-Za-z_]\w*)\.(\w+)\s*=\s*'((?:[^'\\]|\\.)*)'")
+_year_filter = re.compile(r"\b[A-Za-z_]\w*\.year\s*(>=|<=|=)\s*(\d{4})\b")
+_number = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+_year = re.compile(r"\b(19\d{2}|20\d{2})\b")
+_year_from_cue = re.compile(r"\b(since|after|from|starting)\s+(?:the\s+year\s+)?(19\d{2}|20\d{2})\b")
+_year_to_cue = re.compile(r"\b(until|till|before|up\s+to)\s+(?:the\s+year\s+)?(19\d{2}|20\d{2})\b")
+# Words that change the meaning of a question, a template lacking them would answer another question
+MODIFIERS = {
+    "not", "no", "never", "none", "nor", "without", "except", "excluding", "exclude", "other", "than",
+    "order", "ordered", "sort", "sorted", "rank", "ranked", "top", "highest", "lowest", "most", "least",
+    "first", "last", "only", "ascending", "descending", "increasing", "decreasing",
+}
+_word = re.compile(r"[a-z0-9]+")
+
+
+def quote_cypher_string(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def modifier_words(text: str) -> Set[str]:
+    """The negations and modifiers in a text, contractions like "wasn't" count as "not"."""
+    return set(_word.findall(re.sub(r"n't\b", " not", text.lower()))) & MODIFIERS
+
+
+def content_words(text: str) -> Set[str]:
+    """Lower-case words without stopwords and with a crude plural stemming."""
+    words = set()
+    for word in _word.findall(text.lower()):
+        if word in STOPWORDS or word.isdigit():
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+class CypherTemplate:
+    """
+    A Cypher example whose literal filters have been replaced by slots.
+    """
+
+    def __init__(self, information: str, cypher: str, slots: List[Tuple[str, int, int]], values: Dict[str, str]):
+        self.information = information
+        self.cypher = cypher
+        self.slots = slots
+        self.slot_names = frozenset(name for name, _, _ in slots)
+        # Placeholders like "a certain substance" stand for the slot value a question names instead
+        description = re.sub(r"\ba certain \w+", " ", information, flags=re.IGNORECASE)
+        for value in values.values():
+            description = re.sub(re.escape(value), " ", description, flags=re.IGNORECASE)
+        self.words = content_words(description)
+        self.modifiers = modifier_words(description)
+
+    @classmethod
+    def compile(cls, example: dict) -> Optional["CypherTemplate"]:
+        """
+        Compiles an example into a template.
+
+        :return: The template, or None if the example has no slots or filters on literals that
+            are not slots, e.g. thresholds, which a template would silently reuse for any question.
+        """
+        cypher = canonicalize_cypher(example["cypher"])
+        labels = {variable: label for variable, label in _node.findall(cypher)}
+        slots, values = [], {}
+        for match in _string_filter.finditer(cypher):
+            slot = SLOT_PROPERTIES.get((labels.get(match.group(1)), match.group(2)))
+            if slot is None or slot in values:
+                return None
+            slots.append((slot, match.start(3) - 1, match.end(3) + 1))
+            values[slot] = match.group(3)
+        for match in _year_filter.finditer(cypher):
+            slot = {">=": "year_from", "<=": "year_to", "=": "year"}[match.group(1)]
+            if slot in values:
+                return None
+            slots.append((slot, match.start(2), match.end(2)))
+            values[slot] = match.group(2)
+        if not slots:
+            return None
+        covered = [(start, end) for _, start, end in slots]
+        masked = re.sub(r"'(?:[^'\\]|\\.)*'", lambda m: "'" + " " * (len(m.group()) - 2) + "'", cypher)
+        for match in _number.finditer(masked):
+            if match.group() != "0" and not any(start <= match.start() < end for start, end in covered):
+                return None
+        return cls(example["information"], cypher, sorted(slots, key=lambda s: s[1]), values)
+
+    def fill(self, values: Dict[str, Any]) -> str:
+        result, position = [], 0
+        for name, start, end in self.slots:
+            result.append(self.cypher[position:start])
+            value = values[name]
+            result.append(str(int(value)) if name.startswith("year") else quote_cypher_string(value))
+            position = end
+        result.append(self.cypher[position:])
+        return "".join(result)
+
+
+class SlotExtractor:
+    """
+    Finds the values of the slots in questions: known names of substances, countries, water bodies,
+    and river basins, species, and years.
+    """
+
+    def __init__(self, vocabulary: Dict[str, List[str]]):
+        """
+        :param vocabulary: Known values for the slots substance, country, waterbody, and riverbasin.
+        """
+        self.vocabulary: Dict[str, Dict[Tuple[str, ...], str]] = {
+            slot: {tuple(_word.findall(value.lower())): value for value in values if value}
+            for slot, values in vocabulary.items()
+        }
+        self.max_ngram = max((len(k) for v in self.vocabulary.values() for k in v), default=1)
+
+    def _scan(self, text: str) -> Tuple[Dict[str, Any], List[Tuple[str, str]], str]:
+        values: Dict[str, Any] = {}
+        mentions: List[Tuple[str, str]] = []
+        years = sorted(set(_year.findall(text)))
+        if len(years) == 2:
+            values["year_from"], values["year_to"] = years
+        elif len(years) == 1:
+            if _year_from_cue.search(text):
+                values["year_from"] = years[0]
+            elif _year_to_cue.search(text):
+                values["year_to"] = years[0]
+            else:
+                values["year"] = years[0]
+        elif len(years) > 2:
+            values["unsupported"] = True
+        words = _word.findall(text)
+        used = [False] * len(words)
+        for length in range(self.max_ngram, 0, -1):
+            for i in range(len(words) - length + 1):
+                if any(used[i:i + length]):
+                    continue
+                ngram = tuple(words[i:i + length])
+                for slot, known in self.vocabulary.items():
+                    if ngram in known:
+                        mentions.append((slot, known[ngram]))
+                        if slot in values:
+                            # A second value of a slot stays part of the question, no template has two
+                            continue
+                        values[slot] = known[ngram]
+                        used[i:i + length] = [True] * length
+                        break
+        for i, word in enumerate(words):
+            if word in SPECIES_SYNONYMS:
+                mentions.append(("species", SPECIES_SYNONYMS[word]))
+                if not used[i] and "species" not in values:
+                    values["species"] = SPECIES_SYNONYMS[word]
+                    used[i] = True
+        remaining = " ".join(w for w, u in zip(words, used) if not u)
+        return values, mentions, remaining
+
+    def extract(self, question: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Finds slot values in the question.
+
+        :return: The slot values and the question with these values removed.
+        """
+        values, _, remaining = self._scan(question.lower())
+        if any(w.isdigit() and w != "0" and not _year.fullmatch(w) for w in remaining.split()):
+            # Thresholds or counts in the question cannot be expressed by any template
+            values["unsupported"] = True
+        return values, remaining
+
+    def entities(self, question: str) -> Tuple[Tuple[str, str], ...]:
+        """
+        All names, species, and numbers the question mentions, e.g. to tell apart questions that are
+        worded alike but ask for different substances.
+        """
+        text = question.lower()
+        _, mentions, _ = self._scan(text)
+        numbers = [("number", n) for n in _number.findall(text)]
+        return tuple(sorted(set(mentions + numbers)))
+
+
+class TemplateMatcher:
+    """
+    Matches questions against the templates compiled from a CypherExampleCollection.
+    """
+
+    def __init__(
+            self,
+            examples: CypherExampleCollection,
+            vocabulary: Dict[str, List[str]],
+            confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD,
+    ):
+        """
+        :param examples: The collection of curated Cypher examples.
+        :param vocabulary: Known values for the slots substance, country, waterbody, and riverbasin.
+        :param confidence_threshold: Minimal word overlap (F1 score) between question and template description.
+        """
+        self.templates = [t for t in (CypherTemplate.compile(e) for e in examples.examples) if t is not None]
+        self.confidence_threshold = confidence_threshold
+        self.slots = SlotExtractor(vocabulary)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def extract_slots(self, question: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Finds slot values in the question, see SlotExtractor.extract.
+        """
+        return self.slots.extract(question)
+
+    def match(self, question: str) -> Optional[Tuple[str, float, CypherTemplate]]:
+        """
+        Finds the best matching template and fills its slots.
+
+        :return: The Cypher statement, the confidence, and the template, or None if no template matches confidently.
+        """
+        values, remaining = self.extract_slots(question)
+        best, best_score = None, 0.0
+        if "unsupported" not in values:
+            question_words = content_words(remaining)
+            question_modifiers = modifier_words(question)
+            for template in self.templates:
+                if template.slot_names != frozenset(values.keys()):
+                    continue
+                # Words of the question the template does not express would be dropped silently
+                if not question_words or not question_words <= template.words:
+                    continue
+                if not question_modifiers <= template.modifiers:
+                    continue
+                recall = len(question_words) / len(template.words)
+                score = 2 * recall / (1 + recall)
+                if score > best_score:
+                    best, best_score = template, score
+        with self._lock:
+            if best is None or best_score < self.confidence_threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return best.fill(values), best_score, best
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "templates": len(self.templates),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_vocabulary_queries = {
+    "substance": "MATCH (s:Substance) WHERE s.Name IS NOT NULL RETURN DISTINCT s.Name AS value",
+    "country": "MATCH (l:Site) WHERE l.country IS NOT NULL RETURN DISTINCT l.country AS value",
+    "waterbody": "MATCH (l:Site) WHERE l.water_body IS NOT NULL RETURN DISTINCT l.water_body AS value",
+    "riverbasin": "MATCH (l:Site) WHERE l.river_basin IS NOT NULL RETURN DISTINCT l.river_basin AS value",
+}
+_vocabularies: Dict[str, Dict[str, List[str]]] = {}
+_vocabularies_lock = threading.Lock()
+
+
+def load_vocabulary(graph) -> Dict[str, List[str]]:
+    """
+    Reads the known substance, country, water body, and river basin names once per dataset version.
+    """
+    version = getattr(graph, "schema_fingerprint", None) or ""
+    with _vocabularies_lock:
+        if version not in _vocabularies:
+            _vocabularies[version] = {
+                slot: [str(row["value"]) for row in graph.query(query)]
+                for slot, query in _vocabulary_queries.items()
+            }
+        return _vocabularies[version]
+
+
+def get_slot_extractor(graph) -> SlotExtractor:
+    """Provides the slot extraction with the vocabulary of the graph's dataset version."""
+    return SlotExtractor(load_vocabulary(graph))
+
+
+_template_matchers: Dict[str, TemplateMatcher] = {}
+_template_matchers_lock = threading.Lock()
+
+
+def get_template_matcher(
+        scope: str,
+        examples: CypherExampleCollection,
+        graph,
+        confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD,
+) -> TemplateMatcher:
+    """
+    Provides the template matcher shared by all instances of a tool.
+
+    :param scope: Name of the tool, e.g. "cypher_search".
+    :param examples: The Cypher examples the templates are compiled from.
+    :param graph: The graph the slot vocabulary is read from.
+    :param confidence_threshold: Minimal word overlap between question and template description.
+    """
+    key = f"{scope}:{getattr(graph, 'schema_fingerprint', None) or ''}"
+    with _template_matchers_lock:
+        if key not in _template_matchers:
+            _template_matchers[key] = TemplateMatcher(examples, load_vocabulary(graph), confidence_threshold)
+        return _template_matchers[key]
+
+
+def get_template_metrics() -> Dict[str, Dict[str, Any]]:
+    """Returns the share of questions answered by the template fast path for each tool."""
+    with _template_matchers_lock:
+        return {key: matcher.metrics() for key, matcher in _template_matchers.items()}
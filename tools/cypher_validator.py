@@ -0,0 +1,196 @@
+"""
+Offline validation of generated Cypher statements against the structured graph schema.
+
+The validator catches the typical mistakes of generated Cypher (unbalanced brackets, unknown labels,
+relationship types, or properties, and relationships in the wrong direction) without a round trip
+to the database. Its error messages are meant to be fed into the correction prompt.
+Only properties missing from the schema may be confirmed against the database, since the schema
+is sampled and may lack rarely set properties.
+"""
+
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from tools.result_cache import canonicalize_cypher
+
+_write_clauses = re.compile(r"\b(CREATE|MERGE|DELETE|DETACH|SET|REMOVE|DROP|LOAD\s+CSV)\b", re.IGNORECASE)
+_read_start = re.compile(r"^(EXPLAIN\s+|PROFILE\s+)?(OPTIONAL\s+MATCH|MATCH|WITH|UNWIND|CALL|RETURN)\b",
+                         re.IGNORECASE)
+_return_clause = re.compile(r"\b(RETURN|YIELD)\b", re.IGNORECASE)
+_node = r"\(\s*(?P<{0}_var>[A-Za-z_]\w*)?\s*(?::\s*(?P<{0}_labels>[\w:|&!]+))?[^()]*\)"
+_relationship = re.compile(
+    "(?=(" + _node.format("left") +
+    r"\s*(?P<incoming><)?-\s*\[\s*(?P<rel_var>[A-Za-z_]\w*)?\s*(?::\s*(?P<types>[\w|:!&]+))?[^\[\]]*\]\s*-(?P<outgoing>>)?\s*" +
+    _node.format("right") + "))"
+)
+_node_pattern = re.compile(_node.format("node"))
+_rel_pattern = re.compile(r"\[\s*(?P<var>[A-Za-z_]\w*)?\s*:\s*(?P<types>[\w|:!&]+)")
+_property_access = re.compile(r"(?<![\w.$])(?P<var>[A-Za-z_]\w*)\.(?P<property>[A-Za-z_]\w*)\b(?!\s*\()")
+
+
+def _split_names(names: str) -> List[str]:
+    return [n for n in re.split(r"[:|&!]", names or "") if n]
+
+
+def _mask_string_literals(cypher: str) -> str:
+    return re.sub(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"", "''", cypher)
+
+
+class CypherValidator:
+    """
+    Checks Cypher statements against the structured schema of a Neo4jGraph.
+    """
+
+    def __init__(self, structured_schema: Dict[str, Any],
+                 property_keys: Optional[Callable[[], Iterable[str]]] = None):
+        """
+        :param structured_schema: The structured schema of the graph.
+        :param property_keys: Optionally provides all property keys of the database. It is called once,
+            when the first property is missing from the schema, and properties it knows are not reported.
+        """
+        self.node_properties: Dict[str, Set[str]] = {
+            label: {p["property"] for p in properties}
+            for label, properties in structured_schema.get("node_props", {}).items()
+        }
+        self.relationship_properties: Dict[str, Set[str]] = {
+            rel_type: {p["property"] for p in properties}
+            for rel_type, properties in structured_schema.get("rel_props", {}).items()
+        }
+        self.relationships: Set[Tuple[str, str, str]] = {
+            (r["start"], r["type"], r["end"]) for r in structured_schema.get("relationships", [])
+        }
+        self.relationship_types: Set[str] = {t for _, t, _ in self.relationships} | set(self.relationship_properties)
+        self._property_keys = property_keys
+        self._database_property_keys: Optional[Set[str]] = None
+
+    @staticmethod
+    def check_syntax(cypher: str) -> List[str]:
+        """Checks balanced brackets and quotes, read-only clauses, and a RETURN clause."""
+        errors = []
+        if not cypher:
+            return ["The Cypher statement is empty."]
+        stack = []
+        pairs = {")": "(", "]": "[", "}": "{"}
+        quote = None
+        escaped = False
+        for c in cypher:
+            if quote:
+                if escaped:
+                    escaped = False
+                elif c == "\\":
+                    escaped = True
+                elif c == quote:
+                    quote = None
+            elif c in "'\"`":
+                quote = c
+            elif c in "([{":
+                stack.append(c)
+            elif c in pairs:
+                if not stack or stack.pop() != pairs[c]:
+                    errors.append(f"Unbalanced bracket '{c}'.")
+                    break
+        if quote:
+            errors.append(f"Unterminated string literal starting with {quote}.")
+        elif stack and not errors:
+            errors.append(f"Unclosed bracket '{stack[-1]}'.")
+        masked = _mask_string_literals(cypher)
+        if _write_clauses.search(masked):
+            errors.append("The statement must only read data, write clauses like CREATE, MERGE, SET, "
+                          "or DELETE are not allowed.")
+        if not _read_start.match(masked):
+            errors.append("The statement must start with MATCH, OPTIONAL MATCH, WITH, UNWIND, CALL, or RETURN.")
+        if not _return_clause.search(masked):
+            errors.append("The statement has no RETURN clause.")
+        return errors
+
+    def check_schema(self, cypher: str) -> List[str]:
+        """Checks labels, relationship types, directions, and properties against the schema."""
+        errors = []
+        if not self.node_properties:
+            # Without a schema there is nothing to compare to
+            return errors
+        masked = _mask_string_literals(cypher).replace("`", "")
+        variables: Dict[str, Set[str]] = {}
+        relationship_variables: Dict[str, Set[str]] = {}
+
+        for match in _node_pattern.finditer(masked):
+            labels = _split_names(match.group("node_labels"))
+            for label in labels:
+                if label not in self.node_properties:
+                    errors.append(f"Node label '{label}' does not exist. "
+                                  f"Available labels are: {', '.join(sorted(self.node_properties))}.")
+            if match.group("node_var") and labels:
+                variables.setdefault(match.group("node_var"), set()).update(labels)
+
+        for match in _rel_pattern.finditer(masked):
+            types = _split_names(match.group("types"))
+            for rel_type in types:
+                if rel_type not in self.relationship_types:
+                    errors.append(f"Relationship type '{rel_type}' does not exist. "
+                                  f"Available types are: {', '.join(sorted(self.relationship_types))}.")
+            if match.group("var") and types:
+                relationship_variables.setdefault(match.group("var"), set()).update(types)
+
+        for match in _relationship.finditer(masked):
+            errors.extend(self._check_direction(match, variables))
+
+        for match in _property_access.finditer(masked):
+            variable, property_name = match.group("var"), match.group("property")
+            if variable in variables:
+                known = set().union(*(self.node_properties.get(label, set()) for label in variables[variable]))
+                owner = "/".join(sorted(variables[variable]))
+            elif variable in relationship_variables:
+                known = set().union(*(self.relationship_properties.get(t, set())
+                                      for t in relationship_variables[variable]))
+                owner = "/".join(sorted(relationship_variables[variable]))
+            else:
+                continue
+            if property_name not in known and not self._in_database(property_name):
+                errors.append(f"Property '{property_name}' does not exist on '{owner}'. "
+                              f"Available properties are: {', '.join(sorted(known))}.")
+
+        # Report every problem only once, but keep their order
+        return list(dict.fromkeys(errors))
+
+    def _in_database(self, property_name: str) -> bool:
+        """Whether the database has the property, although the sampled schema lacks it."""
+        if self._property_keys is None:
+            return False
+        if self._database_property_keys is None:
+            self._database_property_keys = set(self._property_keys())
+        return property_name in self._database_property_keys
+
+    def _check_direction(self, match: re.Match, variables: Dict[str, Set[str]]) -> List[str]:
+        types = _split_names(match.group("types"))
+        left = set(_split_names(match.group("left_labels"))) or variables.get(match.group("left_var"), set())
+        right = set(_split_names(match.group("right_labels"))) or variables.get(match.group("right_var"), set())
+        if not types or not left or not right or any(t not in self.relationship_types for t in types):
+            return []
+        incoming, outgoing = match.group("incoming"), match.group("outgoing")
+        if incoming and not outgoing:
+            left, right = right, left
+        errors = []
+        for rel_type in types:
+            forward = any((s, rel_type, e) in self.relationships for s in left for e in right)
+            backward = any((e, rel_type, s) in self.relationships for s in left for e in right)
+            if forward or (backward and not (incoming or outgoing)):
+                continue
+            start, end = "/".join(sorted(left)), "/".join(sorted(right))
+            if backward:
+                errors.append(f"Relationship '{rel_type}' has the wrong direction. "
+                              f"Use (:{end})-[:{rel_type}]->(:{start}) instead of (:{start})-[:{rel_type}]->(:{end}).")
+            else:
+                errors.append(f"Relationship '{rel_type}' does not connect '{start}' and '{end}'.")
+        return errors
+
+    def validate(self, cypher: str) -> List[str]:
+        """
+        Validates a Cypher statement without accessing the database.
+
+        :return: The list of errors, empty if the statement is valid.
+        """
+        cypher = canonicalize_cypher(cypher)
+        errors = self.check_syntax(cypher)
+        if errors:
+            return errors
+        return self.check_schema(cypher)
@@ -0,0 +1,90 @@
+"""
+In-memory retrieval index over a CypherExampleCollection.
+
+Instead of putting every curated example into each Cypher generation prompt, only the examples
+whose descriptions are most similar to the question are used. The descriptions are embedded once
+when the index is built, so each question costs a single embedding, which the semantic Cypher
+cache usually has computed already.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from prompts import CypherExampleCollection, CypherExampleCollections
+
+DEFAULT_TOP_K = 5
+
+
+def _unit_vectors(embeddings: List[List[float]]) -> np.ndarray:
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class ExampleIndex:
+    """
+    Selects the examples of a collection that are most similar to a question.
+    """
+
+    def __init__(self, collection: CypherExampleCollection, embeddings: Any, k: int = DEFAULT_TOP_K):
+        """
+        :param collection: The collection of curated Cypher examples.
+        :param embeddings: LangChain embeddings model used to embed the example descriptions and questions.
+        :param k: Number of examples selected for each question.
+        """
+        self.collection = collection
+        self.embeddings = embeddings
+        self.k = k
+        self.matrix = _unit_vectors(embeddings.embed_documents([e["information"] for e in collection.examples]))
+
+    def _top_k(self, embedding: np.ndarray) -> List[dict]:
+        similarities = self.matrix @ embedding
+        best = np.argsort(-similarities, kind="stable")[: self.k]
+        return [self.collection.examples[i] for i in best]
+
+    def select(self, question: str, embedding: Optional[np.ndarray] = None) -> List[dict]:
+        """
+        Selects the k most similar examples, the most similar first.
+
+        :param question: The question of the user.
+        :param embedding: The normalized embedding of the question, if it is known already.
+        """
+        if embedding is None:
+            embedding = _unit_vectors(self.embeddings.embed_query(question))
+        return self._top_k(embedding)
+
+    async def aselect(self, question: str, embedding: Optional[np.ndarray] = None) -> List[dict]:
+        """Async variant of select()."""
+        if embedding is None:
+            embedding = _unit_vectors(await self.embeddings.aembed_query(question))
+        return self._top_k(embedding)
+
+    def format(self, examples: List[dict]) -> str:
+        return self.collection.format_examples_as_markdown(examples)
+
+
+_example_indexes: Dict[tuple, ExampleIndex] = {}
+_example_indexes_lock = threading.Lock()
+
+
+def get_example_index(collection: CypherExampleCollection, embeddings: Any, k: int = DEFAULT_TOP_K) -> ExampleIndex:
+    """
+    Provides the index of the collection shared by all tools and sessions of the process.
+    The index is rebuilt when the examples in the file change.
+    """
+    key = (collection.get_placeholder_name(), k,
+           tuple((e["information"], e["cypher"]) for e in collection.examples))
+    with _example_indexes_lock:
+        if key not in _example_indexes:
+            _example_indexes[key] = ExampleIndex(collection, embeddings, k)
+        return _example_indexes[key]
+
+
+def prebuild_example_indexes(embeddings: Any, k: int = DEFAULT_TOP_K) -> None:
+    """
+    Builds the indexes of the example collections used by the tools, so the first questions do not wait for them.
+    """
+    for collection in [CypherExampleCollections.general_cypher_queries, CypherExampleCollections.map_cypher_queries]:
+        get_example_index(collection, embeddings, k)
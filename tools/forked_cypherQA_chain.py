@@ -2,10 +2,16 @@
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Union
+import asyncio
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from langchain_classic.chains.base import Chain
-from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+)
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.messages import (
     AIMessage,
@@ -25,6 +31,10 @@ from neo4j_graphrag.retrievers.text2cypher import extract_cypher
 from neo4j_graphrag.schema import format_schema
 from pydantic import Field
 
+from tools.columnar import ColumnarResult
+from tools.cypher_validator import CypherValidator
+from tools.result_cache import canonicalize_cypher, create_cache_key
+
 from langchain_neo4j.chains.graph_qa.cypher_utils import (
     CypherQueryCorrector,
     Schema,
@@ -34,10 +44,15 @@ from langchain_neo4j.chains.graph_qa.prompts import (
     CYPHER_QA_PROMPT,
 )
 from langchain_neo4j.graphs.graph_store import GraphStore
-from neo4j.exceptions import CypherSyntaxError
+from neo4j.exceptions import CypherSyntaxError, Neo4jError
+
+logger = logging.getLogger("ETF")
 
 INTERMEDIATE_STEPS_KEY = "intermediate_steps"
 
+# LLM calls spent at most on correcting the Cypher statement of one question
+MAX_CORRECTIONS = 3
+
 FUNCTION_RESPONSE_SYSTEM = """You are an assistant that helps to form nice and human 
 understandable answers based on the provided information from tools.
 Do not add any other information that wasn't present in the tools, and use 
@@ -76,6 +91,32 @@ def construct_schema(
     return format_schema(filtered_schema, is_enhanced)
 
 
+_constructed_schemas: Dict[tuple, str] = {}
+
+
+def construct_schema_cached(
+        graph: GraphStore,
+        include_types: List[str],
+        exclude_types: List[str],
+) -> str:
+    """Construct the filtered schema once per schema snapshot and type filter.
+
+    Graphs without a schema fingerprint are not cached."""
+    fingerprint = getattr(graph, "schema_fingerprint", None)
+    key = (fingerprint, tuple(include_types), tuple(exclude_types), graph._enhanced_schema)
+    if fingerprint is None or key not in _constructed_schemas:
+        schema = construct_schema(
+            graph.get_structured_schema,
+            include_types,
+            exclude_types,
+            graph._enhanced_schema,
+        )
+        if fingerprint is None:
+            return schema
+        _constructed_schemas[key] = schema
+    return _constructed_schemas[key]
+
+
 def get_function_response(
         question: str, context: List[Dict[str, Any]]
 ) -> List[BaseMessage]:
@@ -115,6 +156,117 @@ def try_cypher(graph, cypher_statement: str) -> list:
 
     return errors
 
+
+async def aquery_graph(graph, cypher_statement: str) -> List[Dict[str, Any]]:
+    """
+    Runs a Cypher query without blocking the event loop.
+    Graphs without a native async driver are queried in a worker thread.
+    """
+    if hasattr(graph, "aquery"):
+        return await graph.aquery(cypher_statement)
+    return await asyncio.to_thread(graph.query, cypher_statement)
+
+
+def _top_level(cypher: str) -> str:
+    """Blank out string literals, quoted names, and everything inside brackets, keeping the positions."""
+    masked = re.sub(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`", lambda m: " " * len(m.group()), cypher)
+    result, depth = [], 0
+    for c in masked:
+        if c in "([{":
+            depth += 1
+        result.append(c if depth == 0 else " ")
+        if c in ")]}":
+            depth = max(depth - 1, 0)
+    return "".join(result)
+
+
+_trailing_limit = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+
+
+def limit_cypher(cypher_statement: str, limit: int) -> str:
+    """
+    Makes the database return at most limit rows.
+
+    A LIMIT is appended to the final RETURN, or an existing larger LIMIT is lowered. UNION queries
+    are wrapped in a subquery. Statements without a final RETURN are left unchanged.
+    """
+    cypher = canonicalize_cypher(cypher_statement)
+    top_level = _top_level(cypher)
+    if re.search(r"\bUNION\b", top_level, re.IGNORECASE):
+        return f"CALL {{ {cypher} }} RETURN * LIMIT {limit}"
+    returns = list(re.finditer(r"\bRETURN\b", top_level, re.IGNORECASE))
+    if not returns:
+        return cypher
+    existing = _trailing_limit.search(top_level)
+    if existing:
+        if int(existing.group(1)) <= limit:
+            return cypher
+        return cypher[:existing.start(1)] + str(limit)
+    if re.search(r"\bLIMIT\b", top_level[returns[-1].end():], re.IGNORECASE):
+        # A limit given by a parameter or an expression is kept, the rows are limited while streaming
+        return cypher
+    return f"{cypher} LIMIT {limit}"
+
+
+def query_graph_limited(
+        graph, cypher_statement: str, limit: int, columnar: bool = False
+) -> Union[List[Dict[str, Any]], ColumnarResult]:
+    """
+    Runs a Cypher query that returns at most limit rows, as records or as typed columns.
+    Graphs with a streaming cursor stop pulling records once the limit is reached.
+    """
+    cypher_statement = limit_cypher(cypher_statement, limit)
+    if hasattr(graph, "stream_query"):
+        if columnar:
+            return graph.stream_query(cypher_statement, limit=limit, columnar=True)
+        return graph.stream_query(cypher_statement, limit=limit)
+    records = graph.query(cypher_statement)[:limit]
+    return ColumnarResult.from_records(records) if columnar else records
+
+
+async def aquery_graph_limited(
+        graph, cypher_statement: str, limit: int, columnar: bool = False
+) -> Union[List[Dict[str, Any]], ColumnarResult]:
+    """
+    Async variant of query_graph_limited.
+    """
+    cypher_statement = limit_cypher(cypher_statement, limit)
+    if hasattr(graph, "astream_query"):
+        if columnar:
+            return await graph.astream_query(cypher_statement, limit=limit, columnar=True)
+        return await graph.astream_query(cypher_statement, limit=limit)
+    records = (await aquery_graph(graph, cypher_statement))[:limit]
+    return ColumnarResult.from_records(records) if columnar else records
+
+
+async def atry_cypher(graph, cypher_statement: str) -> list:
+    """
+    Async variant of try_cypher.
+    """
+
+    errors = []
+
+    try:
+        await aquery_graph(graph, f"EXPLAIN {cypher_statement}")
+    except CypherSyntaxError as e:
+        errors.append(e.message)
+
+    return errors
+
+
+CYPHER_CORRECTION_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content="You are a Cypher query expert. Fix the syntax errors in the provided Cypher query."),
+    HumanMessagePromptTemplate.from_template(
+        "Original question: {question}\n\n"
+        "Graph schema:\n{schema}\n\n"
+        "Failed Cypher query:\n{failed_cypher}\n\n"
+        "Errors:\n{errors}\n\n"
+        "Please provide a corrected Cypher query that fixes these errors. "
+        "Return only the corrected Cypher query without any explanation."
+    )
+])
+
+
 class GraphCypherQAChain(Chain):
     """Chain for question-answering against a graph by generating Cypher statements.
 
@@ -149,6 +301,27 @@ class GraphCypherQAChain(Chain):
     """Whether or not to return the result of querying the graph directly."""
     cypher_query_corrector: Optional[CypherQueryCorrector] = None
     """Optional cypher validation tool"""
+    cypher_validator: Optional[CypherValidator] = Field(default=None, exclude=True)
+    """Optional offline validation against the schema that replaces the EXPLAIN round trip"""
+    speculative_candidates: int = 1
+    """Number of Cypher statements generated concurrently by the async path, the first valid one is used"""
+    speculative_generation_chain: Optional[Runnable[Dict[str, Any], str]] = None
+    """Optional chain for the additional candidates, e.g. with a higher temperature so they differ"""
+    example_index: Optional[Any] = Field(default=None, exclude=True)
+    """Optional retrieval of the examples most similar to the question, unless examples are passed per call"""
+    schema_slicer: Optional[Any] = Field(default=None, exclude=True)
+    """Optional selection of the schema and metadata relevant to the question, to shorten the prompts"""
+    template_matcher: Optional[Any] = Field(default=None, exclude=True)
+    """Optional fast path that fills templates compiled from the Cypher examples instead of calling the LLM"""
+    cypher_cache: Optional[Any] = Field(default=None, exclude=True)
+    """Optional semantic cache from questions to validated Cypher statements"""
+    result_cache: Optional[Any] = Field(default=None, exclude=True)
+    """Optional cache for the results of executed Cypher statements"""
+    columnar: bool = False
+    """Whether direct results are returned as typed columns instead of a list of records"""
+    query_rewriter: Optional[Callable[[str], str]] = Field(default=None, exclude=True)
+    """Optional rewriting of the validated statement before it is run, e.g. to aggregate in the database.
+    Rewritten statements that are invalid or fail are replaced by the statement as generated."""
     use_function_response: bool = False
     """Whether to wrap the database context as tool/function response"""
     allow_dangerous_requests: bool = False
@@ -212,6 +385,8 @@ class GraphCypherQAChain(Chain):
             exclude_types: List[str] = [],
             include_types: List[str] = [],
             validate_cypher: bool = False,
+            validate_offline: bool = False,
+            speculative_temperature: Optional[float] = None,
             qa_llm_kwargs: Optional[Dict[str, Any]] = None,
             cypher_llm_kwargs: Optional[Dict[str, Any]] = None,
             use_function_response: bool = False,
@@ -301,6 +476,13 @@ class GraphCypherQAChain(Chain):
         cypher_generation_chain = (
                 cypher_prompt | cypher_llm.bind(**use_cypher_llm_kwargs) | StrOutputParser()
         )
+        speculative_generation_chain = None
+        if speculative_temperature is not None:
+            speculative_generation_chain = (
+                    cypher_prompt
+                    | cypher_llm.bind(**{**use_cypher_llm_kwargs, "temperature": speculative_temperature})
+                    | StrOutputParser()
+            )
 
         if exclude_types and include_types:
             raise ValueError(
@@ -308,11 +490,10 @@ class GraphCypherQAChain(Chain):
                 "can be provided, but not both"
             )
         graph = kwargs["graph"]
-        graph_schema = construct_schema(
-            graph.get_structured_schema,
+        graph_schema = construct_schema_cached(
+            graph,
             include_types,
             exclude_types,
-            graph._enhanced_schema,
         )
 
         cypher_query_corrector = None
@@ -323,122 +504,435 @@ class GraphCypherQAChain(Chain):
             ]
             cypher_query_corrector = CypherQueryCorrector(corrector_schema)
 
+        cypher_validator = None
+        if validate_offline:
+            cypher_validator = CypherValidator(graph.get_structured_schema)
+
         return cls(
             graph_schema=graph_schema,
             qa_chain=qa_chain,
             cypher_generation_chain=cypher_generation_chain,
+            speculative_generation_chain=speculative_generation_chain,
             cypher_llm=cypher_llm,
             cypher_query_corrector=cypher_query_corrector,
+            cypher_validator=cypher_validator,
             use_function_response=use_function_response,
             **kwargs,
         )
 
-    def _call(
-            self,
-            inputs: Dict[str, Any],
-            run_manager: Optional[CallbackManagerForChainRun] = None,
-    ) -> Dict[str, Any]:
-        """Generate Cypher statement, use it to look up in db and answer question."""
-        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
-        callbacks = _run_manager.get_child()
-        question = inputs[self.input_key]
-        examples = inputs.get(self.example_key, None)
+    def _prepare_args(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Collect the input variables of the Cypher generation prompt."""
         args = {
-            "question": question,
-            "examples": examples,
+            "question": inputs[self.input_key],
             "schema": self.graph_schema,
         }
-        args.update(inputs)
-
-        intermediate_steps: List = []
+        if inputs.get(self.example_key) is not None:
+            # Otherwise, the prompt uses its default examples
+            args["examples"] = inputs[self.example_key]
+        if self.schema_slicer is not None:
+            # The sliced metadata replaces the full metadata the prompt holds as default
+            args["schema"], args["meta"] = self.schema_slicer.slice(inputs[self.input_key])
+        # Inputs passed as None, e.g. examples=None, keep the defaults and the example retrieval
+        args.update({key: value for key, value in inputs.items() if value is not None})
+        return args
 
+    def _select_examples(self, args: Dict[str, Any], embedding: Optional[Any]) -> Dict[str, Any]:
+        """Add the examples most similar to the question if none were passed."""
+        if self.example_index is None or "examples" in args:
+            return args
+        examples = self.example_index.select(args["question"], embedding)
+        return {**args, "examples": self.example_index.format(examples)}
 
-        generated_cypher = self.cypher_generation_chain.invoke(
-            args, callbacks=callbacks
-        )
+    async def _aselect_examples(self, args: Dict[str, Any], embedding: Optional[Any]) -> Dict[str, Any]:
+        """Async variant of _select_examples."""
+        if self.example_index is None or "examples" in args:
+            return args
+        examples = await self.example_index.aselect(args["question"], embedding)
+        return {**args, "examples": self.example_index.format(examples)}
 
+    def _postprocess_cypher(self, generated_cypher: str) -> str:
+        """Extract the Cypher statement from the LLM response and correct it if enabled."""
         # Extract Cypher code if it is wrapped in backticks
         generated_cypher = extract_cypher(generated_cypher)
 
         # Correct Cypher query if enabled
         if self.cypher_query_corrector:
             generated_cypher = self.cypher_query_corrector(generated_cypher)
+        return generated_cypher
+
+    def _correction_args(self, question: str, failed_cypher: str, errors: List[str]) -> Dict[str, Any]:
+        schema = self.graph_schema
+        if self.schema_slicer is not None:
+            schema, _ = self.schema_slicer.slice(question)
+        return {
+            "question": question,
+            "schema": schema,
+            "failed_cypher": failed_cypher,
+            "errors": "\n".join(errors)
+        }
+
+    def _log_cypher(self, run_manager, generated_cypher: str) -> None:
+        run_manager.on_text("Generated Cypher:", end="\n", verbose=self.verbose)
+        run_manager.on_text(
+            generated_cypher, color="green", end="\n", verbose=self.verbose
+        )
+
+    def _log_context(self, run_manager, context: List[Dict[str, Any]]) -> None:
+        run_manager.on_text("Full Context:", end="\n", verbose=self.verbose)
+        run_manager.on_text(
+            str(context), color="green", end="\n", verbose=self.verbose
+        )
+
+    def _result_cache_key(self, cypher: str) -> str:
+        # The schema fingerprint identifies the version of the dataset
+        dataset_version = getattr(self.graph, "schema_fingerprint", None) or ""
+        return create_cache_key(cypher, None, self.top_k, dataset_version, self._result_format)
+
+    @property
+    def _result_format(self) -> str:
+        # The QA chain reads the context as records
+        return "columnar" if self.columnar and self.return_direct else "records"
+
+    def _rewrite_cypher(self, cypher: str) -> Optional[str]:
+        """Rewrite the validated statement if a rewriter is set, None if it is unchanged or invalid."""
+        if self.query_rewriter is None:
+            return None
+        rewritten = self.query_rewriter(cypher)
+        if rewritten == cypher:
+            return None
+        errors = self._validate_cypher(rewritten)
+        if errors:
+            logger.warning("The rewritten Cypher statement is invalid, running it as generated: %s", errors)
+            return None
+        return rewritten
+
+    async def _arewrite_cypher(self, cypher: str) -> Optional[str]:
+        """Async variant of _rewrite_cypher."""
+        if self.query_rewriter is None:
+            return None
+        rewritten = self.query_rewriter(cypher)
+        if rewritten == cypher:
+            return None
+        errors = await self._avalidate_cypher(rewritten)
+        if errors:
+            logger.warning("The rewritten Cypher statement is invalid, running it as generated: %s", errors)
+            return None
+        return rewritten
+
+    def _query_context(self, cypher: str) -> List[Dict[str, Any]]:
+        """Run the Cypher statement, or take its result from the cache, limited to top_k rows.
+
+        If the rewritten statement fails, the statement is run as generated, so that the
+        corrections of a failure receive the statement that failed."""
+        rewritten = self._rewrite_cypher(cypher)
+        if rewritten is not None:
+            try:
+                return self._query_cached(rewritten)
+            except Neo4jError as e:
+                logger.warning("The rewritten Cypher statement failed, running it as generated: %s", e)
+        return self._query_cached(cypher)
+
+    async def _aquery_context(self, cypher: str) -> List[Dict[str, Any]]:
+        """Async variant of _query_context."""
+        rewritten = await self._arewrite_cypher(cypher)
+        if rewritten is not None:
+            try:
+                return await self._aquery_cached(rewritten)
+            except Neo4jError as e:
+                logger.warning("The rewritten Cypher statement failed, running it as generated: %s", e)
+        return await self._aquery_cached(cypher)
+
+    def _query_cached(self, cypher: str) -> List[Dict[str, Any]]:
+        if self.result_cache is None:
+            return query_graph_limited(self.graph, cypher, self.top_k, self._result_format == "columnar")
+        key = self._result_cache_key(cypher)
+        context = self.result_cache.get(key)
+        if context is None:
+            context = query_graph_limited(self.graph, cypher, self.top_k, self._result_format == "columnar")
+            self.result_cache.put(key, context)
+        return context
+
+    async def _aquery_cached(self, cypher: str) -> List[Dict[str, Any]]:
+        if self.result_cache is None:
+            return await aquery_graph_limited(self.graph, cypher, self.top_k, self._result_format == "columnar")
+        key = self._result_cache_key(cypher)
+        context = self.result_cache.get(key)
+        if context is None:
+            context = await aquery_graph_limited(self.graph, cypher, self.top_k, self._result_format == "columnar")
+            self.result_cache.put(key, context)
+        return context
+
+    def _chain_result(self, final_result: Any, intermediate_steps: List) -> Dict[str, Any]:
+        chain_result: Dict[str, Any] = {self.output_key: final_result}
+        if self.return_intermediate_steps:
+            chain_result[INTERMEDIATE_STEPS_KEY] = intermediate_steps
+        return chain_result
+
+    def _template_cypher(self, question: str) -> Optional[str]:
+        """Fill a template for the question if one matches confidently and passes the offline validation."""
+        if self.template_matcher is None:
+            return None
+        match = self.template_matcher.match(question)
+        if match is None:
+            return None
+        cypher = match[0]
+        if self.cypher_validator is not None and self.cypher_validator.validate(cypher):
+            return None
+        return cypher
+
+    def _validate_cypher(self, cypher: str) -> List[str]:
+        """Validate offline if enabled, otherwise ask the database to EXPLAIN the statement.
+
+        Offline errors go straight into the correction prompt, EXPLAIN would not report unknown
+        labels, relationship types, or properties anyway."""
+        if self.cypher_validator is not None:
+            return self.cypher_validator.validate(cypher)
+        return try_cypher(self.graph, cypher)
+
+    async def _avalidate_cypher(self, cypher: str) -> List[str]:
+        """Async variant of _validate_cypher."""
+        if self.cypher_validator is not None:
+            return self.cypher_validator.validate(cypher)
+        return await atry_cypher(self.graph, cypher)
 
-        # Error correction loop
+    def _candidate_chain(self, index: int) -> Runnable[Dict[str, Any], str]:
+        if index == 0 or self.speculative_generation_chain is None:
+            return self.cypher_generation_chain
+        return self.speculative_generation_chain
+
+    async def _aspeculate_cypher(
+            self,
+            args: Dict[str, Any],
+            run_manager: AsyncCallbackManagerForChainRun,
+    ) -> Tuple[str, List[str]]:
+        """Generate and validate several candidates concurrently.
+
+        Returns the first valid candidate, or the first candidate that finished together with its errors.
+        The candidates still in flight are cancelled. Threads could not be cancelled once they started,
+        so only the async path speculates."""
+        callbacks = run_manager.get_child()
+
+        async def candidate(index: int) -> Tuple[str, List[str]]:
+            cypher = self._postprocess_cypher(
+                await self._candidate_chain(index).ainvoke(args, callbacks=callbacks))
+            return cypher, await self._avalidate_cypher(cypher)
+
+        tasks = [asyncio.ensure_future(candidate(i)) for i in range(self.speculative_candidates)]
+        first, first_error = None, None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    cypher, errors = await next_done
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                if not errors:
+                    return cypher, errors
+                first = first or (cypher, errors)
+        finally:
+            for task in tasks:
+                task.cancel()
+        if first is None:
+            raise first_error
+        return first
+
+    def _correct_cypher(
+            self,
+            question: str,
+            generated_cypher: str,
+            errors: List[str],
+            run_manager: CallbackManagerForChainRun,
+            validate: Callable[[str], List[str]],
+            max_corrections: int = MAX_CORRECTIONS,
+    ) -> Tuple[str, List[str], int]:
+        """Let the LLM correct the Cypher statement until it is valid or we run out of attempts.
+
+        Returns the statement, its remaining errors, and the number of corrections spent."""
+        callbacks = run_manager.get_child()
         no_corrections = 0
-        max_corrections = 3
-        errors = try_cypher(self.graph, generated_cypher)
 
         while errors and no_corrections < max_corrections:
-            _run_manager.on_text("Correcting cypher statement:", end="\n", verbose=self.verbose)
+            run_manager.on_text("Correcting cypher statement:", end="\n", verbose=self.verbose)
             no_corrections += 1
 
-            # Create correction prompt
-            correction_prompt = ChatPromptTemplate.from_messages([
-                SystemMessage(content="You are a Cypher query expert. Fix the syntax errors in the provided Cypher query."),
-                HumanMessagePromptTemplate.from_template(
-                    "Original question: {question}\n\n"
-                    "Graph schema:\n{schema}\n\n"
-                    "Failed Cypher query:\n{failed_cypher}\n\n"
-                    "Errors:\n{errors}\n\n"
-                    "Please provide a corrected Cypher query that fixes these errors. "
-                    "Return only the corrected Cypher query without any explanation."
-                )
-            ])
-
             # Create correction chain using the stored cypher LLM
-            correction_chain = correction_prompt | self.cypher_llm | StrOutputParser()
+            correction_chain = CYPHER_CORRECTION_PROMPT | self.cypher_llm | StrOutputParser()
 
             # Attempt correction
             try:
-                generated_cypher = correction_chain.invoke({
-                    "question": question,
-                    "schema": self.graph_schema,
-                    "failed_cypher": generated_cypher,
-                    "errors": "\n".join(errors)
-                }, callbacks=callbacks)
-
-                # Extract Cypher code if wrapped in backticks
-                generated_cypher = extract_cypher(generated_cypher)
-
-                # Correct Cypher query if enabled
-                if self.cypher_query_corrector:
-                    generated_cypher = self.cypher_query_corrector(generated_cypher)
+                generated_cypher = self._postprocess_cypher(correction_chain.invoke(
+                    self._correction_args(question, generated_cypher, errors),
+                    callbacks=callbacks,
+                ))
 
                 # Test the corrected query
-                errors = try_cypher(self.graph, generated_cypher)
+                errors = validate(generated_cypher)
             except Exception as e:
                 # If correction fails, break and use empty string
                 errors = [str(e)]
                 break
+        return generated_cypher, errors, no_corrections
 
-        # If still have errors after max corrections, return empty string
-        if errors:
-            generated_cypher = ""
+    async def _acorrect_cypher(
+            self,
+            question: str,
+            generated_cypher: str,
+            errors: List[str],
+            run_manager: AsyncCallbackManagerForChainRun,
+            validate: Callable[[str], Any],
+            max_corrections: int = MAX_CORRECTIONS,
+    ) -> Tuple[str, List[str], int]:
+        """Async variant of _correct_cypher, validate may be a coroutine function."""
+        callbacks = run_manager.get_child()
+        no_corrections = 0
 
+        while errors and no_corrections < max_corrections:
+            await run_manager.on_text("Correcting cypher statement:", end="\n", verbose=self.verbose)
+            no_corrections += 1
 
-        _run_manager.on_text("Generated Cypher:", end="\n", verbose=self.verbose)
-        _run_manager.on_text(
-            generated_cypher, color="green", end="\n", verbose=self.verbose
+            correction_chain = CYPHER_CORRECTION_PROMPT | self.cypher_llm | StrOutputParser()
+
+            try:
+                generated_cypher = self._postprocess_cypher(await correction_chain.ainvoke(
+                    self._correction_args(question, generated_cypher, errors),
+                    callbacks=callbacks,
+                ))
+                errors = validate(generated_cypher)
+                if asyncio.iscoroutine(errors):
+                    errors = await errors
+            except Exception as e:
+                errors = [str(e)]
+                break
+        return generated_cypher, errors, no_corrections
+
+    def _generate_cypher(
+            self,
+            question: str,
+            args: Dict[str, Any],
+            run_manager: CallbackManagerForChainRun,
+    ) -> Tuple[str, int]:
+        """Generate a Cypher statement and correct it until it is valid.
+
+        Returns the statement, or an empty string if no valid statement could be generated,
+        and the number of corrections spent."""
+        generated_cypher = self._postprocess_cypher(
+            self.cypher_generation_chain.invoke(args, callbacks=run_manager.get_child())
+        )
+        errors = self._validate_cypher(generated_cypher)
+        generated_cypher, errors, corrections = self._correct_cypher(
+            question, generated_cypher, errors, run_manager, self._validate_cypher
         )
 
-        intermediate_steps.append({"query": generated_cypher})
+        # If still have errors after max corrections, return empty string
+        return "" if errors else generated_cypher, corrections
+
+    async def _agenerate_cypher(
+            self,
+            question: str,
+            args: Dict[str, Any],
+            run_manager: AsyncCallbackManagerForChainRun,
+    ) -> Tuple[str, int]:
+        """Async variant of _generate_cypher that generates several candidates concurrently if configured."""
+        if self.speculative_candidates > 1:
+            generated_cypher, errors = await self._aspeculate_cypher(args, run_manager)
+        else:
+            generated_cypher = self._postprocess_cypher(
+                await self.cypher_generation_chain.ainvoke(args, callbacks=run_manager.get_child())
+            )
+            errors = await self._avalidate_cypher(generated_cypher)
+        generated_cypher, errors, corrections = await self._acorrect_cypher(
+            question, generated_cypher, errors, run_manager, self._avalidate_cypher
+        )
+        return "" if errors else generated_cypher, corrections
+
+    def _run_cypher(
+            self,
+            question: str,
+            generated_cypher: str,
+            run_manager: CallbackManagerForChainRun,
+            corrections: int = 0,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Run the Cypher statement and return it together with its results.
+
+        Statements that were only validated offline may still fail in the database. In that case,
+        the database errors are used for the corrections left after the given number was spent."""
+        if not generated_cypher:
+            return generated_cypher, []
+        try:
+            return generated_cypher, self._query_context(generated_cypher)
+        except CypherSyntaxError as e:
+            if self.cypher_validator is None:
+                raise
+            generated_cypher, errors, _ = self._correct_cypher(
+                question, generated_cypher, [e.message], run_manager, lambda c: try_cypher(self.graph, c),
+                MAX_CORRECTIONS - corrections,
+            )
+            if errors:
+                return "", []
+            return generated_cypher, self._query_context(generated_cypher)
+
+    async def _arun_cypher(
+            self,
+            question: str,
+            generated_cypher: str,
+            run_manager: AsyncCallbackManagerForChainRun,
+            corrections: int = 0,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Async variant of _run_cypher."""
+        if not generated_cypher:
+            return generated_cypher, []
+        try:
+            return generated_cypher, await self._aquery_context(generated_cypher)
+        except CypherSyntaxError as e:
+            if self.cypher_validator is None:
+                raise
+            generated_cypher, errors, _ = await self._acorrect_cypher(
+                question, generated_cypher, [e.message], run_manager, lambda c: atry_cypher(self.graph, c),
+                MAX_CORRECTIONS - corrections,
+            )
+            if errors:
+                return "", []
+            return generated_cypher, await self._aquery_context(generated_cypher)
+
+    def _call(
+            self,
+            inputs: Dict[str, Any],
+            run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        """Generate Cypher statement, use it to look up in db and answer question."""
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        callbacks = _run_manager.get_child()
+        question = inputs[self.input_key]
+        args = self._prepare_args(inputs)
+
+        intermediate_steps: List = []
+
+        # Common questions are answered by a template, rephrasings of already answered
+        # questions are served from the semantic cache
+        generated_cypher, question_embedding = self._template_cypher(question), None
+        from_template = generated_cypher is not None
+        if not from_template and self.cypher_cache is not None:
+            generated_cypher, question_embedding = self.cypher_cache.lookup(question)
+        from_cache, corrections = generated_cypher is not None, 0
+        if not from_cache:
+            args = self._select_examples(args, question_embedding)
+            generated_cypher, corrections = self._generate_cypher(question, args, _run_manager)
 
         # Retrieve and limit the number of results
         # Generated Cypher be null if query corrector identifies invalid schema
-        if generated_cypher:
-            context = self.graph.query(generated_cypher)[: self.top_k]
-        else:
-            context = []
+        generated_cypher, context = self._run_cypher(question, generated_cypher, _run_manager, corrections)
+        if generated_cypher and not from_cache and self.cypher_cache is not None:
+            self.cypher_cache.store(question, generated_cypher, question_embedding)
+
+        self._log_cypher(_run_manager, generated_cypher)
+
+        intermediate_steps.append({"query": generated_cypher})
 
         final_result: Union[List[Dict[str, Any]], str]
         if self.return_direct:
             final_result = context
         else:
-            _run_manager.on_text("Full Context:", end="\n", verbose=self.verbose)
-            _run_manager.on_text(
-                str(context), color="green", end="\n", verbose=self.verbose
-            )
+            self._log_context(_run_manager, context)
 
             intermediate_steps.append({"context": context})
             if self.use_function_response:
@@ -452,8 +946,113 @@ class GraphCypherQAChain(Chain):
                     callbacks=callbacks,
                 )
 
-        chain_result: Dict[str, Any] = {self.output_key: final_result}
-        if self.return_intermediate_steps:
-            chain_result[INTERMEDIATE_STEPS_KEY] = intermediate_steps
+        return self._chain_result(final_result, intermediate_steps)
 
-        return chain_result
+    async def _acall(
+            self,
+            inputs: Dict[str, Any],
+            run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        """Async variant of _call that awaits the LLM and the database instead of blocking a thread."""
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        callbacks = _run_manager.get_child()
+        question = inputs[self.input_key]
+        args = self._prepare_args(inputs)
+
+        intermediate_steps: List = []
+
+        generated_cypher, question_embedding = self._template_cypher(question), None
+        from_template = generated_cypher is not None
+        if not from_template and self.cypher_cache is not None:
+            generated_cypher, question_embedding = await self.cypher_cache.alookup(question)
+        from_cache, corrections = generated_cypher is not None, 0
+        if not from_cache:
+            args = await self._aselect_examples(args, question_embedding)
+            generated_cypher, corrections = await self._agenerate_cypher(question, args, _run_manager)
+
+        generated_cypher, context = await self._arun_cypher(question, generated_cypher, _run_manager, corrections)
+        if generated_cypher and not from_cache and self.cypher_cache is not None:
+            self.cypher_cache.store(question, generated_cypher, question_embedding)
+
+        await _run_manager.on_text("Generated Cypher:", end="\n", verbose=self.verbose)
+        await _run_manager.on_text(generated_cypher, color="green", end="\n", verbose=self.verbose)
+
+        intermediate_steps.append({"query": generated_cypher})
+
+        final_result: Union[List[Dict[str, Any]], str]
+        if self.return_direct:
+            final_result = context
+        else:
+            await _run_manager.on_text("Full Context:", end="\n", verbose=self.verbose)
+            await _run_manager.on_text(str(context), color="green", end="\n", verbose=self.verbose)
+
+            intermediate_steps.append({"context": context})
+            if self.use_function_response:
+                function_response = get_function_response(question, context)
+                final_result = await self.qa_chain.ainvoke(
+                    {"question": question, "function_response": function_response},
+                )
+            else:
+                final_result = await self.qa_chain.ainvoke(
+                    {"question": question, "context": context},
+                    callbacks=callbacks,
+                )
+
+        return self._chain_result(final_result, intermediate_steps)
+
+
+def configure_chain(
+        chain: GraphCypherQAChain,
+        config: Any,
+        name: str,
+        examples: Any,
+        prompt_text: str,
+        embeddings: Any,
+        always_include: Tuple[str, ...] = (),
+) -> GraphCypherQAChain:
+    """Attach the optional stages configured for a tool to its chain.
+
+    Args:
+        chain: The chain of the tool.
+        config: The configuration, read with config.get(KEY, default).
+        name: The name of the tool, scoping its templates and cache, e.g. "cypher_search".
+        examples: The Cypher examples of the tool's prompt.
+        prompt_text: The full text of the tool's prompt, cached Cypher is only reused for the same prompt.
+        embeddings: The embeddings of the questions and examples.
+        always_include: Labels kept in every slice of the schema.
+
+    Returns:
+        The chain
+    """
+    # Imported here, since the schema slicer builds on this module
+    from prompts import get_graph_meta_data
+    from tools.cypher_cache import get_cache_settings, get_semantic_cypher_cache
+    from tools.cypher_templates import DEFAULT_CONFIDENCE_THRESHOLD, get_slot_extractor, get_template_matcher
+    from tools.example_index import DEFAULT_TOP_K, get_example_index
+    from tools.result_cache import get_result_cache
+    from tools.schema_slicer import get_schema_slicer
+
+    if config.get("CYPHER_VALIDATE_OFFLINE", True):
+        # Properties missing from the sampled schema are looked up once among the keys of the database
+        graph = chain.graph
+        chain.cypher_validator = CypherValidator(
+            graph.get_structured_schema,
+            lambda: [row["propertyKey"] for row in graph.query("CALL db.propertyKeys()")])
+    if config.get("CYPHER_EXAMPLE_RETRIEVAL_ENABLED", True):
+        chain.example_index = get_example_index(
+            examples, embeddings, int(config.get("CYPHER_EXAMPLES_TOP_K", DEFAULT_TOP_K)))
+    if config.get("SCHEMA_SLICING_ENABLED", True):
+        chain.schema_slicer = get_schema_slicer(chain.graph, get_graph_meta_data(), always_include)
+    if config.get("CYPHER_TEMPLATES_ENABLED", True):
+        chain.template_matcher = get_template_matcher(
+            name, examples, chain.graph,
+            float(config.get("CYPHER_TEMPLATES_CONFIDENCE", DEFAULT_CONFIDENCE_THRESHOLD)))
+    if config.get("CYPHER_CACHE_ENABLED", True):
+        # Similar questions only share Cypher if they name the same substances, places, and years
+        chain.cypher_cache = get_semantic_cypher_cache(name, prompt_text, embeddings, **get_cache_settings(config),
+                                                       entity_extractor=get_slot_extractor(chain.graph).entities)
+    if config.get("RESULT_CACHE_ENABLED", True):
+        chain.result_cache = get_result_cache(config)
+    # Generating several candidates at once trades LLM cost for the latency of corrections
+    chain.speculative_candidates = int(config.get(f"{name.upper()}_CANDIDATES", 1))
+    return chain
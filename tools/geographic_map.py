@@ -1,16 +1,20 @@
 from typing import Any, Type, Optional, Dict
 
-import pandas as pd
-import plotly.io
-from langchain_neo4j import GraphCypherQAChain
+import asyncio
+
+from tools.forked_cypherQA_chain import GraphCypherQAChain, configure_chain
 from langchain_community.tools import BaseTool
-from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
 from langchain_core.tools import ToolException
 from pydantic import BaseModel, Field, model_validator
 
+from config import config
+from figure_artifacts import encode_figure
 from graph import connect_to_neo4j
-from llm import get_chat_llm
-from prompts import Prompts, ToolDescriptions
+from llm import get_chat_llm, embeddings
+from prompts import CypherExampleCollections, Prompts, ToolDescriptions
+from tools.map_aggregation import aggregate_map_query
+from tools.map_binning import DEFAULT_MAX_POINTS
 from tools.plotly_visualization import create_plotly_map
 
 class PlotMap(BaseModel):
@@ -18,6 +22,7 @@ class PlotMap(BaseModel):
     chat_llm: Any
     graph: Any
     cypher_chain: Any
+    max_points: int = DEFAULT_MAX_POINTS
 
     @model_validator(mode="before")
     @classmethod
@@ -31,14 +36,32 @@ class PlotMap(BaseModel):
             verbose=True,
             cypher_prompt=values["prompt"].get_prompt_template(),
             return_intermediate_steps=True,
+            speculative_temperature=config.get("GEOGRAPHIC_MAP_CANDIDATE_TEMPERATURE", 0.7),
             allow_dangerous_requests=True
         )
+        configure_chain(values["cypher_chain"], config, "geographic_map", CypherExampleCollections.map_cypher_queries,
+                        values["prompt"].full_text, embeddings, ("Site",))
+        if config.get("MAP_AGGREGATION_PUSHDOWN_ENABLED", True):
+            # The database returns one row per site instead of one per site, year, and quarter
+            values["cypher_chain"].query_rewriter = aggregate_map_query
         values["cypher_chain"].return_direct = True
+        values["cypher_chain"].columnar = True
         values["cypher_chain"].top_k = 10000
+        # Maps with more sites show them binned into grid cells, unless the full detail is asked for
+        values["max_points"] = int(config.get("MAP_MAX_POINTS", DEFAULT_MAX_POINTS))
         return values
 
-    def run(self, query: str) -> dict:
+    def run(self, query: str, full_detail: bool = False) -> dict:
         results = self.cypher_chain.invoke({"query": query})
+        return self.create_answer(results, 0 if full_detail else self.max_points)
+
+    async def arun(self, query: str, full_detail: bool = False) -> dict:
+        results = await self.cypher_chain.ainvoke({"query": query})
+        # Building the figure is CPU-bound, so we keep it off the event loop
+        return await asyncio.to_thread(self.create_answer, results, 0 if full_detail else self.max_points)
+
+    @staticmethod
+    def create_answer(results: dict, max_points: int = DEFAULT_MAX_POINTS) -> dict:
         df_description = "NO DATA WAS FOUND"
 
         # We store the generated Cypher query and return it in the tool's exception in
@@ -46,11 +69,11 @@ class PlotMap(BaseModel):
         # the missing pieces, refine the question and run the tool again.
         generated_cypher = results["intermediate_steps"][-1]["query"]
         if "result" in results and len(results["result"]) > 0:
-            df = pd.DataFrame(results["result"])
-            df.columns = [column.lower() for column in df.columns]
-            df_description = df.describe(include='all').to_json(default_handler=str)
+            # The keys are lower-cased once, the statistics and the map share the same columns
+            columns = results["result"].with_lower_case_keys()
+            df_description = columns.describe_json()
             try:
-                artifact = create_plotly_map(results["result"])
+                artifact = create_plotly_map(columns, max_points)
             except Exception as e:
                 print(f"Error while creating plotly: {e}")
                 raise ToolException(f"Could not create plotly from data from the following cypher: {generated_cypher}"
@@ -73,6 +96,7 @@ class PlotMap(BaseModel):
 
 class GeographicMapInput(BaseModel):
     query: str = Field(description=ToolDescriptions.get("GeographicMapInput", "query"))
+    full_detail: bool = Field(default=False, description=ToolDescriptions.get("GeographicMapInput", "full_detail"))
 
 
 class GeographicMap(BaseTool):
@@ -82,10 +106,19 @@ class GeographicMap(BaseTool):
     response_format: str = "content_and_artifact"
     plot_map: PlotMap = Field(default_factory=PlotMap)
 
-    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> Any:
+    def _run(self, query: str, full_detail: bool = False,
+             run_manager: Optional[CallbackManagerForToolRun] = None) -> Any:
+        try:
+            result = self.plot_map.run(query, full_detail)
+            return result["content"], encode_figure(result["artifact"], config.get("FIGURE_ARTIFACT_COMPRESSION", True))
+        except Exception as e:
+            raise ToolException(f"Error while running GeographicMap: {e}")
+
+    async def _arun(self, query: str, full_detail: bool = False,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> Any:
         try:
-            result = self.plot_map.run(query)
-            return result["content"], plotly.io.to_json(result["artifact"])
+            result = await self.plot_map.arun(query, full_detail)
+            return result["content"], encode_figure(result["artifact"], config.get("FIGURE_ARTIFACT_COMPRESSION", True))
         except Exception as e:
             raise ToolException(f"Error while running GeographicMap: {e}")
 
@@ -0,0 +1,70 @@
+import threading
+from typing import Any, Dict, Optional, Type
+
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+
+# Tools that are safe to share hold no per-session state, so one instance per process serves all sessions.
+_shared_tools: Dict[Type[BaseTool], BaseTool] = {}
+_shared_tools_lock = threading.Lock()
+
+
+def get_shared_tool(tool_class: Type[BaseTool]) -> BaseTool:
+    """
+    Provides the process-wide instance of a tool and creates it on the first call.
+
+    Args:
+        tool_class: The class of the tool
+
+    Returns:
+        BaseTool: The shared instance of the tool
+    """
+    if tool_class not in _shared_tools:
+        with _shared_tools_lock:
+            if tool_class not in _shared_tools:
+                _shared_tools[tool_class] = tool_class()
+    return _shared_tools[tool_class]
+
+
+class LazyTool(BaseTool):
+    """
+    Proxy for a tool that is only created when the agent invokes it for the first time.
+
+    Name, description, and input schema are read from the defaults of the tool class, so the agent
+    can bind the tool without building its LLM client, graph connection, and prompt.
+    """
+
+    tool_class: Type[BaseTool]
+    shared: bool = True
+    """Whether all sessions use the same instance of the tool."""
+    _tool: Optional[BaseTool] = None
+    _lock: threading.Lock
+
+    def __init__(self, tool_class: Type[BaseTool], shared: bool = True, **kwargs: Any):
+        fields = tool_class.model_fields
+        proxied = {
+            key: fields[key].get_default(call_default_factory=True)
+            for key in ["name", "description", "args_schema", "response_format", "handle_tool_error"]
+            if key in fields
+        }
+        super().__init__(tool_class=tool_class, shared=shared, **{**proxied, **kwargs})
+        self._lock = threading.Lock()
+
+    @property
+    def tool(self) -> BaseTool:
+        """The wrapped tool, created on first access."""
+        if self.shared:
+            return get_shared_tool(self.tool_class)
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    self._tool = self.tool_class()
+        return self._tool
+
+    def _run(self, *args: Any, run_manager: Optional[CallbackManagerForToolRun] = None, **kwargs: Any) -> Any:
+        return self.tool._run(*args, run_manager=run_manager, **kwargs)
+
+    async def _arun(
+            self, *args: Any, run_manager: Optional[AsyncCallbackManagerForToolRun] = None, **kwargs: Any
+    ) -> Any:
+        return await self.tool._arun(*args, run_manager=run_manager, **kwargs)
@@ -0,0 +1,95 @@
+"""
+Aggregation of map data in the database instead of in Python.
+
+The Cypher statements generated for maps return one row per site, year, and quarter. The map,
+however, shows a single point per site. The statement is therefore wrapped in a subquery that
+aggregates its rows per site: the median of the value column via percentileCont, the first
+substance name, and the range of years. Only these rows are transferred to the application.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from tools.forked_cypherQA_chain import _top_level
+from tools.plotly_visualization import VALUE_COLUMNS
+from tools.result_cache import canonicalize_cypher
+
+# Columns identifying a site, all of them are grouping keys
+SITE_COLUMNS = ["sitename", "lat", "lon"]
+# Columns describing a site, they are grouping keys if they are returned
+SITE_META_DATA_COLUMNS = ["waterbody", "riverbasin", "country"]
+
+_identifier = re.compile(r"^[A-Za-z_]\w*$")
+_alias = re.compile(r"\bAS\s+(`[^`]+`|[A-Za-z_]\w*)\s*$", re.IGNORECASE)
+_projection_end = re.compile(r"\b(ORDER\s+BY|SKIP|LIMIT)\b", re.IGNORECASE)
+
+
+def _quote(name: str) -> str:
+    return name if _identifier.match(name) else "`" + name.replace("`", "``") + "`"
+
+
+def returned_columns(cypher: str) -> Optional[List[str]]:
+    """
+    Reads the names of the columns of the final RETURN clause.
+
+    :return: The column names, or None if there is no final RETURN, it returns all variables, or
+        it returns an expression without alias, which a subquery does not accept.
+    """
+    top_level = _top_level(cypher)
+    returns = list(re.finditer(r"\bRETURN\b", top_level, re.IGNORECASE))
+    if not returns:
+        return None
+    start = returns[-1].end()
+    end = _projection_end.search(top_level, start)
+    end = end.start() if end else len(cypher)
+    distinct = re.match(r"\s*DISTINCT\b", top_level[start:end], re.IGNORECASE)
+    if distinct:
+        start += distinct.end()
+    columns, position = [], start
+    for separator in [m.start() for m in re.finditer(",", top_level[start:end])] + [end - start]:
+        item = cypher[position:start + separator].strip()
+        position = start + separator + 1
+        if item == "*":
+            return None
+        alias = _alias.search(item)
+        if alias is None and not _identifier.match(item):
+            return None
+        columns.append(alias.group(1).strip("`") if alias else item)
+    return columns
+
+
+def aggregate_map_query(cypher: str) -> str:
+    """
+    Rewrites a map query to return one aggregated row per site.
+
+    :param cypher: The generated Cypher statement.
+    :return: The rewritten statement, or the statement unchanged if it lacks the site columns.
+    """
+    cypher = canonicalize_cypher(cypher)
+    columns = returned_columns(cypher)
+    if columns is None:
+        return cypher
+    names: Dict[str, str] = {}
+    for column in columns:
+        names.setdefault(column.lower(), column)
+    if any(c not in names for c in SITE_COLUMNS):
+        return cypher
+    target = next((c for c in VALUE_COLUMNS if c in names), None)
+
+    keys = SITE_COLUMNS + [c for c in SITE_META_DATA_COLUMNS if c in names]
+    if target is None and "chemicalname" in names:
+        # Occurrence maps show a point per site and substance
+        keys.append("chemicalname")
+    projection = [c if names[c] == c else f"{_quote(names[c])} AS {c}" for c in keys]
+    if target is not None:
+        projection.append(f"percentileCont({_quote(names[target])}, 0.5) AS {target}")
+        if "chemicalname" in names:
+            projection.append(f"head(collect({_quote(names['chemicalname'])})) AS chemicalname")
+    if "year" in names:
+        year = _quote(names["year"])
+        projection.append(
+            f"CASE WHEN min({year}) = max({year}) THEN toString(min({year})) "
+            f"ELSE toString(min({year})) + '-' + toString(max({year})) END AS year"
+        )
+    not_null = " AND ".join(f"{_quote(names[c])} IS NOT NULL" for c in SITE_COLUMNS)
+    return f"CALL {{ {cypher} }} WITH * WHERE {not_null} RETURN {', '.join(projection)}"
@@ -0,0 +1,87 @@
+"""
+Level of detail for maps with very many sites.
+
+Above a number of points, the sites are binned into a regular latitude/longitude grid. Each occupied
+cell becomes a single point at the centroid of its sites, colored and sized by the median value of
+its sites, with a hover summary of how many sites it holds and the range of their values. The grid
+is the finest one, starting at a tenth of a degree and doubled as needed, whose occupied cells do
+not exceed the number of points.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_POINTS = 2000
+MIN_CELL_DEGREES = 0.1
+# Columns added to the binned sites
+SITES_COLUMN = "sites"
+
+
+def grid_cells(lat: np.ndarray, lon: np.ndarray, cell_degrees: float) -> np.ndarray:
+    """Numbers the grid cells of the coordinates, equal numbers meaning the same cell."""
+    rows = np.floor((lat + 90) / cell_degrees).astype(np.int64)
+    columns = np.floor((lon + 180) / cell_degrees).astype(np.int64)
+    return rows * (int(np.ceil(360 / cell_degrees)) + 1) + columns
+
+
+def choose_cell_size(lat: np.ndarray, lon: np.ndarray, max_points: int) -> Tuple[float, np.ndarray]:
+    """
+    Finds the finest grid with at most max_points occupied cells.
+
+    :return: The edge length of the cells in degrees and the cell of each coordinate.
+    """
+    cell_degrees = MIN_CELL_DEGREES
+    cells = grid_cells(lat, lon, cell_degrees)
+    while len(np.unique(cells)) > max_points and cell_degrees < 180:
+        cell_degrees *= 2
+        cells = grid_cells(lat, lon, cell_degrees)
+    return cell_degrees, cells
+
+
+def bin_sites(
+        df: pd.DataFrame,
+        target_column: Optional[str],
+        meta_data_columns: List[str],
+        max_points: int = DEFAULT_MAX_POINTS,
+) -> Optional[Tuple[pd.DataFrame, float]]:
+    """
+    Bins the sites of a map if there are more than max_points of them.
+
+    :param df: One row per point with the columns sitename, lat, lon, and the target and meta data columns.
+    :param target_column: The column that colors the points, None for occurrence maps.
+    :param meta_data_columns: The columns shown when hovering over a point.
+    :param max_points: The number of points shown without binning.
+    :return: One row per occupied cell and the edge length of the cells in degrees, or None if
+        the sites are shown as they are.
+    """
+    if max_points <= 0 or len(df) <= max_points:
+        return None
+    lat = df["lat"].to_numpy(dtype=np.float64)
+    lon = df["lon"].to_numpy(dtype=np.float64)
+    cell_degrees, cells = choose_cell_size(lat, lon, max_points)
+    groups = df.assign(_cell=cells).groupby("_cell", sort=False)
+
+    aggregations = {
+        "lat": ("lat", "mean"),
+        "lon": ("lon", "mean"),
+        SITES_COLUMN: ("sitename", "nunique"),
+        "_first_site": ("sitename", "first"),
+    }
+    if target_column is not None:
+        aggregations[target_column] = (target_column, "median")
+        aggregations[f"{target_column} min"] = (target_column, "min")
+        aggregations[f"{target_column} max"] = (target_column, "max")
+    binned = groups.agg(**aggregations).reset_index(drop=True)
+    for column in meta_data_columns:
+        # The single value of a cell, or the number of different values
+        different = groups[column].nunique().to_numpy()
+        first = groups[column].first().astype(str).to_numpy()
+        binned[column] = np.where(different == 1, first, pd.Series(different).astype(str) + " different")
+    binned["sitename"] = np.where(
+        binned[SITES_COLUMN] == 1,
+        binned["_first_site"],
+        binned[SITES_COLUMN].astype(str) + " sites around " + binned["_first_site"].astype(str),
+    )
+    return binned.drop(columns="_first_site"), cell_degrees
@@ -2,6 +2,14 @@ import plotly.express as px
 import pandas as pd
 from typing import Any
 
+from tools.columnar import ColumnarResult
+from tools.map_binning import DEFAULT_MAX_POINTS, SITES_COLUMN, bin_sites
+
+# Columns holding the value that colors the points, the first one found is used
+VALUE_COLUMNS = ["concentration", "driverimportance", "tu", "ratiotu", "sumtu", "maxtu"]
+# Columns shown when hovering over a point
+META_DATA_COLUMNS = ["waterbody", "riverbasin", "country", "year", "quarter"]
+
 
 def render_concentration_map(df: pd.DataFrame, meta_info: dict) -> Any:
     target_color = {
@@ -69,6 +77,7 @@ def render_occurrence_map(df: pd.DataFrame, meta_info: dict) -> Any:
         lon="lon",
         hover_name="sitename",
         hover_data=df[meta_info["meta_data_columns"]],
+        size=meta_info.get("size_column"),
         # TODO: Jana, fix what you want here
         # size=0.25,
         # color="Occurrence"
@@ -103,10 +112,44 @@ def render_occurrence_map(df: pd.DataFrame, meta_info: dict) -> Any:
     return fig
 
 
-def create_plotly_map(result) -> Any:
-    df = pd.DataFrame(result)
+def level_of_detail(df: pd.DataFrame, meta_info: dict, max_points: int) -> tuple:
+    """
+    Bins the sites if there are more than max_points of them.
+
+    :return: The points to show and their meta information, which has a title if the sites were binned.
+    """
+    binned = bin_sites(df, meta_info.get("target_column"), meta_info["meta_data_columns"], max_points)
+    if binned is None:
+        return df, meta_info
+    binned_df, cell_degrees = binned
+    summary_columns = [SITES_COLUMN]
+    if meta_info.get("target_column") is not None:
+        summary_columns += [f"{meta_info['target_column']} min", f"{meta_info['target_column']} max"]
+    else:
+        meta_info = {**meta_info, "size_column": SITES_COLUMN}
+    meta_info = {
+        **meta_info,
+        "meta_data_columns": summary_columns + meta_info["meta_data_columns"],
+        "title": f"{df['sitename'].nunique()} sites in {len(binned_df)} cells of {cell_degrees:g}°, "
+                 f"ask for the full detail to see every site",
+    }
+    return binned_df, meta_info
+
+
+def create_plotly_map(result, max_points: int = DEFAULT_MAX_POINTS) -> Any:
+    """
+    Creates the map of the sites in the query result.
+
+    :param result: The records or columns of the query result.
+    :param max_points: Above this number of points, sites are binned into grid cells, 0 shows every site.
+    """
+    if isinstance(result, ColumnarResult):
+        # The columns are used as they are, their keys are expected in lower case already
+        df = result.to_frame()
+    else:
+        df = pd.DataFrame(result)
+        df.columns = df.columns.str.lower()
     # Check if dataframe has keys sitename, Lat, and Lon
-    df.columns = df.columns.str.lower()
 
     required_columns = ["sitename", "lat", "lon"]
     missing_columns = [col for col in required_columns if col not in df.columns]
@@ -114,15 +157,13 @@ def create_plotly_map(result) -> Any:
     if missing_columns:
         raise ValueError(f"Returned database result is missing the required columns: {missing_columns}")
 
-    value_columns = ["concentration", "driverimportance", "tu", "ratiotu", "sumtu", "maxtu"]
     selected_target_column = None
-    for v in value_columns:
+    for v in VALUE_COLUMNS:
         if v in df.columns:
             selected_target_column = v
             break
 
-    optional_meta_data_columns = ["waterbody", "riverbasin", "country", "year", "quarter"]
-    meta_data_columns = [col for col in optional_meta_data_columns if col in df.columns]
+    meta_data_columns = [col for col in META_DATA_COLUMNS if col in df.columns]
     if selected_target_column is not None:
         if selected_target_column in ['sumtu', 'ratiotu', 'maxtu']:
             # Group by 'sitename', 'Lat', 'Lon' and average the aggregated TU for each site
@@ -135,10 +176,16 @@ def create_plotly_map(result) -> Any:
                 selected_target_column: 'median',
                 'chemicalname': 'first'  # Keep the first non-null value of ChemicalName
             }).reset_index()
-        return render_concentration_map(result_df,
-                                        {"target_column": selected_target_column,
-                                         "meta_data_columns": meta_data_columns})
+        result_df, meta_info = level_of_detail(result_df,
+                                               {"target_column": selected_target_column,
+                                                "meta_data_columns": meta_data_columns},
+                                               max_points)
+        fig = render_concentration_map(result_df, meta_info)
     else:
         result_df = df[['sitename', 'lat', 'lon', "chemicalname"] + meta_data_columns].drop_duplicates()
         #result_df["Occurrence"] = 1
-        return render_occurrence_map(result_df, {"meta_data_columns": meta_data_columns})
+        result_df, meta_info = level_of_detail(result_df, {"meta_data_columns": meta_data_columns}, max_points)
+        fig = render_occurrence_map(result_df, meta_info)
+    if "title" in meta_info:
+        fig.update_layout(title=meta_info["title"])
+    return fig
@@ -0,0 +1,306 @@
+"""
+Cache for the results of executed Cypher statements.
+
+Results are keyed by the canonical form of the Cypher statement (comments removed and whitespace
+collapsed outside of string literals), its parameters, the result limit, and the dataset version.
+They are kept as pickled bytes, so the memory budget is exact and callers always receive a copy.
+Optionally, the cache is backed by an SQLite file that several worker processes share. Results expire
+after a time to live. When the graph database is reloaded, invalidate_result_cache() removes them and
+replaces a marker file, which every process checks on lookup to drop the results it keeps in memory.
+The dataset version, the image tag by default, does not change when a graph is reloaded under the same tag.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 512 * 1024 * 1024
+DEFAULT_TIME_TO_LIVE = 24 * 60 * 60  # seconds
+# The marker is kept next to the shared disk store if there is one
+default_marker_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+MARKER_FILE_NAME = "results_invalidated"
+
+
+def canonicalize_cypher(cypher: str) -> str:
+    """
+    Removes comments, collapses whitespace, and strips a trailing semicolon.
+    String literals and backtick-quoted names are left untouched.
+    """
+    result = []
+    i = 0
+    pending_space = False
+    while i < len(cypher):
+        c = cypher[i]
+        if c in "'\"`":
+            # copy the quoted literal, honouring backslash escapes
+            j = i + 1
+            while j < len(cypher) and cypher[j] != c:
+                j += 2 if cypher[j] == "\\" else 1
+            if pending_space and result:
+                result.append(" ")
+            pending_space = False
+            result.append(cypher[i:j + 1])
+            i = j + 1
+        elif cypher.startswith("//", i):
+            end = cypher.find("\n", i)
+            i = len(cypher) if end == -1 else end
+            pending_space = True
+        elif cypher.startswith("/*", i):
+            end = cypher.find("*/", i + 2)
+            i = len(cypher) if end == -1 else end + 2
+            pending_space = True
+        elif c.isspace():
+            pending_space = True
+            i += 1
+        else:
+            if pending_space and result:
+                result.append(" ")
+            pending_space = False
+            result.append(c)
+            i += 1
+    return "".join(result).rstrip(";").strip()
+
+
+def create_cache_key(
+        cypher: str, params: Optional[dict], limit: Optional[int], dataset_version: str, result_format: str = "records"
+) -> str:
+    source = json.dumps(
+        [canonicalize_cypher(cypher), params or {}, limit, dataset_version, result_format],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class DiskResultStore:
+    """
+    Result store in an SQLite file that is shared by all processes using the same directory.
+    Least recently used entries are removed once the file exceeds its byte budget.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_DISK_BYTES,
+                 time_to_live: float = DEFAULT_TIME_TO_LIVE):
+        os.makedirs(directory, exist_ok=True)
+        self.file = os.path.join(directory, "cypher_results.sqlite")
+        self.max_bytes = max_bytes
+        self.time_to_live = time_to_live
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(results)")]
+            if columns and "created" not in columns:
+                # Stores written before results expired are dropped, they are only a cache
+                connection.execute("DROP TABLE results")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL, created REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # The connection's own context manager only commits, it does not close the connection
+        connection = sqlite3.connect(self.file, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM results WHERE key = ? AND created > ?",
+                (key, time.time() - self.time_to_live)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("DELETE FROM results WHERE created <= ?", (now - self.time_to_live,))
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = connection.execute(
+                    "SELECT key, size FROM results ORDER BY last_access LIMIT 1").fetchone()
+                if oldest is None:
+                    break
+                connection.execute("DELETE FROM results WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+
+    def clear(self) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM results")
+
+
+class QueryResultCache:
+    """
+    In-process LRU cache of query results with a byte budget and a time to live, optionally backed by
+    a DiskResultStore.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, disk_store: Optional[DiskResultStore] = None,
+                 time_to_live: float = DEFAULT_TIME_TO_LIVE, marker_file: Optional[str] = None):
+        """
+        :param marker_file: The file replaced by invalidate_result_cache(), the results in memory are dropped
+            whenever it changes.
+        """
+        self.max_bytes = max_bytes
+        self.disk_store = disk_store
+        self.time_to_live = time_to_live
+        self.marker_file = marker_file
+        self._generation = _marker_generation(marker_file)
+        # The pickled results with the time they were stored
+        self._entries: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _put_in_memory(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key)[1])
+            self._entries[key] = (time.monotonic(), value)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def _check_generation(self) -> None:
+        """Drops the results in memory if another process invalidated the cache since."""
+        generation = _marker_generation(self.marker_file)
+        with self._lock:
+            if generation != self._generation:
+                self._generation = generation
+                self._entries.clear()
+                self._size = 0
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        self._check_generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.time_to_live:
+                self._size -= len(self._entries.pop(key)[1])
+                self.evictions += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(entry[1])
+        if self.disk_store is not None:
+            value = self.disk_store.get(key)
+            if value is not None:
+                self._put_in_memory(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return pickle.loads(value)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, result: List[Dict[str, Any]]) -> None:
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._check_generation()
+        self._put_in_memory(key, value)
+        if self.disk_store is not None:
+            self.disk_store.put(key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.disk_store is not None:
+            self.disk_store.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+def _marker_generation(marker_file: Optional[str]) -> Optional[Tuple[int, int]]:
+    if marker_file is None:
+        return None
+    try:
+        stat = os.stat(marker_file)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def get_marker_file(config) -> str:
+    return os.path.join(config.get("RESULT_CACHE_DIR") or default_marker_directory, MARKER_FILE_NAME)
+
+
+_result_cache: Optional[QueryResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache(config) -> QueryResultCache:
+    """
+    Provides the process-wide result cache, configured by RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TIME_TO_LIVE,
+    and optionally RESULT_CACHE_DIR and RESULT_CACHE_MAX_DISK_BYTES.
+    """
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            time_to_live = float(config.get("RESULT_CACHE_TIME_TO_LIVE", DEFAULT_TIME_TO_LIVE))
+            _result_cache = QueryResultCache(
+                int(config.get("RESULT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                _create_disk_store(config, time_to_live),
+                time_to_live,
+                get_marker_file(config),
+            )
+        return _result_cache
+
+
+def _create_disk_store(config, time_to_live: float) -> Optional[DiskResultStore]:
+    if not config.get("RESULT_CACHE_DIR"):
+        return None
+    return DiskResultStore(config.get("RESULT_CACHE_DIR"),
+                           int(config.get("RESULT_CACHE_MAX_DISK_BYTES", DEFAULT_MAX_DISK_BYTES)),
+                           time_to_live)
+
+
+def invalidate_result_cache(config) -> None:
+    """
+    Removes the cached results of all processes, e.g. after the graph database was reloaded.
+    The disk store is cleared, and the replaced marker file makes every process drop the results it
+    keeps in memory on its next lookup.
+    """
+    disk_store = _create_disk_store(config, DEFAULT_TIME_TO_LIVE)
+    if disk_store is not None:
+        disk_store.clear()
+    marker_file = get_marker_file(config)
+    os.makedirs(os.path.dirname(marker_file), exist_ok=True)
+    # Replacing the file gives it a new inode, so invalidations within the same timestamp tick differ too
+    temporary_file = f"{marker_file}.{os.getpid()}"
+    with open(temporary_file, "w") as f:
+        f.write(str(time.time()))
+    os.replace(temporary_file, marker_file)
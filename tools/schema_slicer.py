@@ -0,0 +1,200 @@
+"""
+Question-dependent slices of the graph schema and its metadata for the Cypher generation prompts.
+
+Every node label and relationship type is described by the words of its name, its description,
+and the names and descriptions of its properties. A question selects the labels and relationship
+types whose words it shares, weighted by how rare these words are across the schema, together with
+the labels at both ends of selected relationships. Questions that match nothing get the full schema.
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import yaml
+
+from tools.forked_cypherQA_chain import construct_schema
+
+# Entities scoring below this share of the best match are left out
+RELATIVE_SCORE_THRESHOLD = 0.5
+# Matches with names of labels, relationship types, and properties count more than matches with descriptions
+NAME_WEIGHT = 3
+
+# Question words that refer to schema entities without naming them
+SYNONYMS = {
+    "where": "site location",
+    "when": "year quarter time",
+    "chemical": "substance",
+    "chemicals": "substance",
+    "compound": "substance",
+    "compounds": "substance",
+    "cas": "casrn",
+    "map": "site location",
+}
+
+_word = re.compile(r"[a-z]+")
+_camel_case = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_stopwords = {
+    "the", "and", "for", "are", "was", "were", "has", "have", "had", "been", "with", "from", "this", "that",
+    "which", "what", "who", "how", "all", "any", "can", "its", "their", "there", "these", "those", "into",
+    "about", "show", "find", "give", "list", "please", "tell", "does", "did", "not", "highest", "lowest",
+    "most", "least", "number", "value", "values",
+}
+
+
+def stems(text: str) -> Set[str]:
+    """Lower-case word prefixes, so that e.g. measured and measurement share the stem 'measu'."""
+    text = _camel_case.sub(" ", text).replace("_", " ").lower()
+    words = [w for w in _word.findall(text) if len(w) > 2 and w not in _stopwords]
+    return {(w[:-1] if w.endswith("s") and not w.endswith("ss") else w)[:5] for w in words}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of English text and YAML for OpenAI models."""
+    return (len(text) + 3) // 4
+
+
+class SchemaSlicer:
+    """
+    Selects the part of the schema and metadata that is relevant to a question.
+    """
+
+    def __init__(
+            self,
+            structured_schema: Dict[str, Any],
+            metadata: str,
+            is_enhanced: bool = False,
+            always_include: Iterable[str] = (),
+    ):
+        """
+        :param structured_schema: The structured schema of the graph.
+        :param metadata: The YAML metadata with descriptions of nodes, relationships, and properties.
+        :param is_enhanced: Whether the structured schema contains example values.
+        :param always_include: Node labels or relationship types every slice contains, e.g. Site for maps.
+        """
+        self.structured_schema = structured_schema
+        self.metadata = yaml.safe_load(metadata) or {}
+        self.is_enhanced = is_enhanced
+        self.always_include = set(always_include)
+        self.relationships: List[Tuple[str, str, str]] = [
+            (r["start"], r["type"], r["end"]) for r in structured_schema.get("relationships", [])
+        ]
+
+        descriptions: Dict[str, dict] = {}
+        for entity in self.metadata.get("schema", {}).get("nodes", []) + \
+                self.metadata.get("schema", {}).get("relationships", []):
+            descriptions[entity["name"]] = entity
+        self.name_stems: Dict[str, Set[str]] = {}
+        self.entity_stems: Dict[str, Set[str]] = {}
+        properties = {**structured_schema.get("node_props", {}), **structured_schema.get("rel_props", {})}
+        for name in set(properties) | {t for _, t, _ in self.relationships} | set(descriptions):
+            names = [name] + [p["property"] for p in properties.get(name, [])]
+            words = [descriptions.get(name, {}).get("description", "")]
+            for p in descriptions.get(name, {}).get("properties", []):
+                names.append(p.get("name", ""))
+                words.append(p.get("description", ""))
+            self.name_stems[name] = stems(" ".join(names))
+            self.entity_stems[name] = stems(" ".join(words)) | self.name_stems[name]
+        document_frequency = Counter(s for words in self.entity_stems.values() for s in words)
+        self.idf = {s: math.log((1 + len(self.entity_stems)) / n) for s, n in document_frequency.items()}
+
+        self.full_schema = construct_schema(structured_schema, [], [], is_enhanced)
+        self.full_metadata = metadata
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.full_tokens = 0
+        self.sliced_tokens = 0
+
+    def select(self, question: str) -> Set[str]:
+        """
+        Selects the node labels and relationship types relevant to the question.
+
+        :return: The selected names, empty if the question matches nothing.
+        """
+        question_stems = stems(" ".join(
+            [question] + [SYNONYMS[w] for w in _word.findall(question.lower()) if w in SYNONYMS]))
+        scores = {}
+        for name, words in self.entity_stems.items():
+            score = sum(self.idf[s] for s in question_stems & words)
+            score += (NAME_WEIGHT - 1) * sum(self.idf[s] for s in question_stems & self.name_stems[name])
+            if score > 0:
+                scores[name] = score
+        if not scores:
+            return set()
+        best = max(scores.values())
+        selected = {name for name, score in scores.items() if score >= RELATIVE_SCORE_THRESHOLD * best}
+        selected |= self.always_include
+        labels = set(self.structured_schema.get("node_props", {}))
+        selected_labels = selected & labels
+        connected = set()
+        for start, rel_type, end in self.relationships:
+            if rel_type in selected:
+                selected |= {start, end}
+                connected.add(frozenset((start, end)))
+        for start, rel_type, end in self.relationships:
+            # Selected labels are useless if the query cannot connect them
+            if start in selected_labels and end in selected_labels and frozenset((start, end)) not in connected:
+                selected.add(rel_type)
+        return selected
+
+    def slice(self, question: str) -> Tuple[str, str]:
+        """
+        Provides the formatted schema and the metadata for the question.
+
+        :return: The schema and the metadata, both complete if the question matches nothing.
+        """
+        selected = self.select(question)
+        if selected:
+            schema = construct_schema(self.structured_schema, sorted(selected), [], self.is_enhanced)
+            metadata = yaml.safe_dump({"schema": {
+                key: [e for e in entities if e["name"] in selected]
+                for key, entities in self.metadata.get("schema", {}).items()
+            }}, sort_keys=False, width=120)
+        else:
+            schema, metadata = self.full_schema, self.full_metadata
+        with self._lock:
+            self.calls += 1
+            self.full_tokens += estimate_tokens(self.full_schema) + estimate_tokens(self.full_metadata)
+            self.sliced_tokens += estimate_tokens(schema) + estimate_tokens(metadata)
+        return schema, metadata
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "full_tokens": self.full_tokens,
+                "sliced_tokens": self.sliced_tokens,
+                "saved_tokens": self.full_tokens - self.sliced_tokens,
+                "saved_ratio": 1 - self.sliced_tokens / self.full_tokens if self.full_tokens else 0.0,
+            }
+
+
+_schema_slicers: Dict[tuple, SchemaSlicer] = {}
+_schema_slicers_lock = threading.Lock()
+
+
+def get_schema_slicer(graph, metadata: str, always_include: Iterable[str] = ()) -> SchemaSlicer:
+    """
+    Provides the slicer for the current schema snapshot of the graph.
+
+    :param graph: The graph providing the structured schema.
+    :param metadata: The YAML metadata of the schema.
+    :param always_include: Node labels or relationship types every slice contains.
+    """
+    fingerprint: Optional[str] = getattr(graph, "schema_fingerprint", None)
+    key = (fingerprint, tuple(sorted(always_include)), hash(metadata))
+    with _schema_slicers_lock:
+        if fingerprint is None or key not in _schema_slicers:
+            slicer = SchemaSlicer(graph.get_structured_schema, metadata, graph._enhanced_schema, always_include)
+            if fingerprint is None:
+                return slicer
+            _schema_slicers[key] = slicer
+        return _schema_slicers[key]
+
+
+def get_schema_slicer_metrics() -> List[Dict[str, Any]]:
+    """Returns the estimated prompt tokens saved by slicing the schema."""
+    with _schema_slicers_lock:
+        return [slicer.metrics() for slicer in _schema_slicers.values()]
@@ -0,0 +1,298 @@
+"""
+Summary statistics of query results computed in one pass over the records, as they arrive.
+
+The summary has the layout of pandas' df.describe(include='all').to_json(), which the tools hand to
+the agent: count, unique, top, and freq for categorical columns, and count, mean, std, min,
+quartiles, and max for numeric columns. Memory is bounded per column. Up to max_samples rows, the
+statistics are exactly those of pandas; beyond that, the quantiles are estimated from a uniform
+reservoir sample. Distinct values are counted up to max_categories.
+"""
+
+import datetime
+import json
+import math
+import random
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MAX_SAMPLES = 10000
+DEFAULT_MAX_CATEGORIES = 10000
+
+NUMERIC_STATISTICS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+CATEGORICAL_STATISTICS = ["count", "unique", "top", "freq"]
+ALL_STATISTICS = ["count", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def _format_double(value: float, precision: int = 10) -> str:
+    """
+    Formats a float like the JSON encoder of pandas, including its rounding of the last decimal.
+    """
+    sign = "-" if value < 0 else ""
+    value = abs(value)
+    if value > 1e16 or (value != 0.0 and value < 1e-15):
+        return f"{sign}{value:.{precision}g}"
+    pow10 = 10.0 ** precision
+    whole = int(value)
+    tmp = (value - whole) * pow10
+    frac = int(tmp)
+    diff = tmp - frac
+    if diff > 0.5 or (diff == 0.5 and (frac == 0 or frac & 1)):
+        frac += 1
+    if frac >= pow10:
+        frac = 0
+        whole += 1
+    decimals = f"{frac:0{precision}d}".rstrip("0") or "0"
+    return f"{sign}{whole}.{decimals}"
+
+
+def _json_value(value: Any, default_handler) -> str:
+    """Writes a value the way pandas' to_json does, e.g. floats with at most 10 decimals."""
+    if value is None or (isinstance(value, float) and not math.isfinite(value)):
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return _format_double(value)
+    if isinstance(value, str):
+        return json.dumps(value)
+    if isinstance(value, datetime.date):
+        # Python dates and times are written as epoch milliseconds, other types (like Neo4j's) by the handler
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime(value.year, value.month, value.day)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return str(int(value.timestamp() * 1000))
+    return json.dumps(default_handler(value))
+
+
+def _most_common(categories: Counter) -> Tuple[Any, Optional[int]]:
+    """
+    The most frequent value. Ties are broken like pandas' value_counts(), which sorts the
+    counts in order of first occurrence descending with numpy's default (unstable) sort.
+    """
+    if not categories:
+        return None, None
+    counts = np.fromiter(categories.values(), dtype=np.int64, count=len(categories))
+    order = np.arange(len(counts))[::-1][counts[::-1].argsort(kind="quicksort")][::-1]
+    keys = list(categories.keys())
+    return keys[order[0]], int(counts[order[0]])
+
+
+class ColumnAccumulator:
+    """
+    Statistics of a single column.
+    """
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES, max_categories: int = DEFAULT_MAX_CATEGORIES,
+                 seed: int = 0):
+        self.max_samples = max_samples
+        self.max_categories = max_categories
+        self.count = 0
+        # Every value, missing ones as NaN, as long as there are at most max_samples rows
+        self.values: Optional[List[Any]] = []
+        self.numeric = True
+        # Welford's online mean and variance
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.samples: List[float] = []
+        self.categories: Counter = Counter()
+        self._random = random.Random(seed)
+
+    def add(self, value: Any) -> None:
+        missing = _is_missing(value)
+        if self.values is not None:
+            if len(self.values) < self.max_samples:
+                self.values.append(math.nan if missing else value)
+            else:
+                self.values = None
+        if missing:
+            return
+        self.count += 1
+        if self.numeric and not _is_number(value):
+            self.numeric = False
+            self.samples = []
+            self.values = None
+        if self.numeric:
+            value = float(value)
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+            if len(self.samples) < self.max_samples:
+                self.samples.append(value)
+            else:
+                # Reservoir sampling keeps every value with the same probability
+                index = self._random.randrange(self.count)
+                if index < self.max_samples:
+                    self.samples[index] = value
+        # Categories are needed as well, in case a later value turns out not to be numeric
+        key = _hashable(value)
+        if key in self.categories or len(self.categories) < self.max_categories:
+            self.categories[key] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        if self.numeric and self.count > 0:
+            if self.values is not None:
+                # All values are known, so we compute exactly what pandas computes
+                return _numeric_column_summary(np.asarray(self.values, dtype=np.float64))
+            quartiles = np.percentile(np.asarray(self.samples, dtype=np.float64), [25, 50, 75])
+            return {
+                "count": float(self.count),
+                "mean": self.mean,
+                "std": math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan,
+                "min": self.min,
+                "25%": float(quartiles[0]),
+                "50%": float(quartiles[1]),
+                "75%": float(quartiles[2]),
+                "max": self.max,
+            }
+        top, freq = _most_common(self.categories)
+        return {
+            "count": self.count,
+            "unique": len(self.categories),
+            "top": top,
+            "freq": freq,
+        }
+
+
+class SummaryAccumulator:
+    """
+    Statistics of all columns of a stream of records, or of rows of values.
+    """
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES, max_categories: int = DEFAULT_MAX_CATEGORIES,
+                 keys: Sequence[str] = ()):
+        """
+        :param keys: The column names, in the order of the values of the rows passed to add_row().
+        """
+        self.max_samples = max_samples
+        self.max_categories = max_categories
+        self.columns: Dict[str, ColumnAccumulator] = {
+            key: ColumnAccumulator(max_samples, max_categories) for key in keys
+        }
+        self._row_accumulators = list(self.columns.values())
+        self.rows = 0
+
+    def add(self, record: Dict[str, Any]) -> None:
+        for column in record:
+            if column not in self.columns:
+                # Rows seen before without this column simply count as missing values
+                accumulator = ColumnAccumulator(self.max_samples, self.max_categories)
+                for _ in range(self.rows):
+                    accumulator.add(None)
+                self.columns[column] = accumulator
+        for column, accumulator in self.columns.items():
+            accumulator.add(record.get(column))
+        self.rows += 1
+
+    def add_row(self, row: Sequence[Any]) -> None:
+        """Adds the values of a row, in the order of the keys."""
+        for accumulator, value in zip(self._row_accumulators, row):
+            accumulator.add(value)
+        self.rows += 1
+
+    def add_all(self, records: Iterable[Dict[str, Any]]) -> "SummaryAccumulator":
+        for record in records:
+            self.add(record)
+        return self
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the statistics of each column, the rows are named like those of df.describe(include='all').
+        """
+        return _describe_layout({column: accumulator.summary() for column, accumulator in self.columns.items()})
+
+    def to_json(self, default_handler=str, lower_case_columns: bool = False) -> str:
+        """
+        Serializes the statistics like df.describe(include='all').to_json(default_handler=str).
+
+        :param default_handler: Converts values that are neither numbers, strings, nor dates.
+        :param lower_case_columns: Whether to write the column names in lower case.
+        """
+        return summary_to_json(self.summary(), default_handler, lower_case_columns)
+
+
+def _describe_layout(summaries: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Gives all columns the statistics df.describe(include='all') has for the mix of column types."""
+    if not summaries:
+        return {}
+    numeric = [c for c in summaries if "mean" in summaries[c]]
+    if len(numeric) == len(summaries):
+        statistics = NUMERIC_STATISTICS
+    elif not numeric:
+        statistics = CATEGORICAL_STATISTICS
+    else:
+        statistics = ALL_STATISTICS
+    return {column: {s: summary.get(s) for s in statistics} for column, summary in summaries.items()}
+
+
+def summary_to_json(summary: Dict[str, Dict[str, Any]], default_handler=str, lower_case_columns: bool = False) -> str:
+    """
+    Serializes the statistics returned by SummaryAccumulator.summary(), see SummaryAccumulator.to_json().
+    """
+    columns = []
+    for column, stats in summary.items():
+        if lower_case_columns:
+            column = column.lower()
+        values = ",".join(f"{json.dumps(s)}:{_json_value(v, default_handler)}" for s, v in stats.items())
+        columns.append(f"{json.dumps(str(column))}:{{{values}}}")
+    return "{" + ",".join(columns) + "}"
+
+
+def _numeric_column_summary(values: np.ndarray) -> Dict[str, Any]:
+    """Statistics of an int64 or float64 column, computed like pandas does, NaN being missing."""
+    values = values.astype(np.float64)
+    missing = np.isnan(values)
+    count = int(values.size - missing.sum())
+    if count == 0:
+        return {s: (0.0 if s == "count" else math.nan) for s in NUMERIC_STATISTICS}
+    # pandas sums with missing values replaced by zero, which decides the rounding of the result
+    filled = np.where(missing, 0.0, values)
+    mean = filled.sum() / count
+    std = math.nan
+    if count > 1:
+        squares = (mean - filled) ** 2
+        squares[missing] = 0.0
+        std = math.sqrt(squares.sum() / (count - 1))
+    present = values[~missing]
+    quartiles = np.percentile(present, [25, 50, 75])
+    return {
+        "count": float(count),
+        "mean": float(mean),
+        "std": float(std),
+        "min": float(present.min()),
+        "25%": float(quartiles[0]),
+        "50%": float(quartiles[1]),
+        "75%": float(quartiles[2]),
+        "max": float(present.max()),
+    }
+
+
+def summarize_records(records: Iterable[Dict[str, Any]], lower_case_columns: bool = False) -> str:
+    """
+    Computes the summary statistics of the records in one pass, see SummaryAccumulator.to_json().
+    """
+    return SummaryAccumulator().add_all(records).to_json(lower_case_columns=lower_case_columns)
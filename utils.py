@@ -1,13 +1,36 @@
+import logging
+import os
+from typing import Any, Dict
+
 import yaml
 
-def get_version() -> str:
+logger = logging.getLogger("ETF")
+
+values_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "values.yaml")
+
+
+def _read_values() -> Dict[str, Any]:
+    """Reads the Helm values of the deployment, empty if they cannot be read."""
     try:
-        with open("values.yaml") as f:
-            data = yaml.safe_load(f)
-            return data["ecotoxfred"]["image"]["tag"]
+        with open(values_file) as f:
+            return yaml.safe_load(f) or {}
     except FileNotFoundError:
-        print("Error: File 'values.yaml' not found.")
+        logger.warning(f"File '{values_file}' not found.")
     except Exception as e:
-        print(f"Unexpected error: {e}")
-    return "no version info"
+        logger.warning(f"Unexpected error reading '{values_file}': {e}")
+    return {}
+
+
+def _image_tag(component: str) -> str:
+    try:
+        return _read_values()[component]["image"]["tag"]
+    except (KeyError, TypeError):
+        return "no version info"
+
+
+def get_version() -> str:
+    return _image_tag("ecotoxfred")
+
 
+def get_database_version() -> str:
+    return _image_tag("neo4j")